@@ -30,5 +30,6 @@ setup(
 
     packages=find_packages(exclude=['tests']),
     install_requires=['numpy>=1.9.0', 'scipy>=0.15', 'matplotlib>=1.5.0'],
+    entry_points={'console_scripts': ['tbplot = tbplot.__main__:main']},
     zip_safe=False,
 )
@@ -1,4 +1,9 @@
+__version__ = "0.0.1"
+
 from . import pltutils
+from .budget import *
+from .interactive import *
 from .plot import *
+from .export import *
 from .structure import *
 from .style import *
@@ -0,0 +1,158 @@
+"""Command line batch renderer: `tbplot INPUT... -o DIR -f png`, also `python -m tbplot`"""
+import argparse
+import ast
+import glob
+import json
+import os
+import sys
+import time
+
+
+def _parse_style(items):
+    """Parse 'key=value' pairs: values are Python literals or plain strings"""
+    style = {}
+    for item in items or ():
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError("Expected 'key=value', got '{}'".format(item))
+        try:
+            style[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            style[key.strip()] = value.strip()
+    return style
+
+
+def _make_parser():
+    parser = argparse.ArgumentParser(
+        prog="tbplot", description="Render saved maps and structures to image files.")
+    parser.add_argument("inputs", nargs="+",
+                        help="`.npz` files or directories written by `SpatialMap.save`. "
+                             "Glob patterns are expanded.")
+    parser.add_argument("-o", "--output", metavar="DIR",
+                        help="Output directory. Defaults to the directory of each input.")
+    parser.add_argument("-f", "--format", default="png", help="Output format: png, pdf, svg...")
+    parser.add_argument("--spec", metavar="FILE",
+                        help="JSON file with the plot spec, see `tbplot.render.render`. "
+                             "The options below take precedence.")
+    parser.add_argument("--plot", help="'system', 'lead', 'plot', 'plot_pcolor', 'plot_contourf' or "
+                                       "'plot_contour'")
+    parser.add_argument("--axes", help="The spatial axes to plot, e.g. 'xy' or 'yz'")
+    parser.add_argument("--num-periods", type=int, help="Repetitions of periodic boundaries")
+    parser.add_argument("--cmap", help="Matplotlib colormap name")
+    parser.add_argument("--site-radius", type=float, nargs="+", metavar="R",
+                        help="Site radius or the (min, max) radius range")
+    parser.add_argument("--style", action="append", metavar="KEY=VALUE",
+                        help="Style (rc) setting, may be repeated")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Number of parallel processes (default: number of cores)")
+    parser.add_argument("--force", action="store_true",
+                        help="Render even if the output is newer than the input and spec")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="Reuse images of identical inputs and specs from this directory")
+    parser.add_argument("--cache-size", type=float, default=512, metavar="MB",
+                        help="Maximum size of the cache directory (default: 512 MB)")
+    return parser
+
+
+def _make_spec(args):
+    spec = {}
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+
+    options = dict(plot=args.plot, axes=args.axes, num_periods=args.num_periods, cmap=args.cmap)
+    if args.site_radius:
+        radius = args.site_radius
+        options["site_radius"] = radius[0] if len(radius) == 1 else tuple(radius)
+    spec.update({k: v for k, v in options.items() if v is not None})
+    if args.style:
+        spec["style"] = dict(spec.get("style", {}), **_parse_style(args.style))
+    return spec
+
+
+def _expand_inputs(patterns):
+    inputs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        inputs += [m for m in matches if m not in inputs]
+    return inputs
+
+
+def _mtime(path):
+    """Latest modification time of a file or a directory of `.npy` files"""
+    if os.path.isdir(path):
+        return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(path, name))
+                                               for name in os.listdir(path)])
+    return os.path.getmtime(path)
+
+
+def _job(job):
+    """Render a single file in a worker process: returns (job, seconds, error)"""
+    from .render import render_file, RenderCache
+
+    input, output, spec, format, cache = job
+    try:
+        cache = RenderCache(*cache) if cache else None
+        return job, render_file(input, output, spec, format, cache), None
+    except Exception as e:
+        return job, 0, "{}: {}".format(type(e).__name__, e)
+
+
+def main(argv=None):
+    """Entry point of the `tbplot` console script"""
+    args = _make_parser().parse_args(argv)
+
+    import matplotlib.pyplot as plt
+    plt.switch_backend("agg")
+
+    spec = _make_spec(args)
+    spec_time = os.path.getmtime(args.spec) if args.spec else 0
+    cache = (args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    jobs, skipped = [], []
+    for input in _expand_inputs(args.inputs):
+        name = os.path.splitext(os.path.basename(os.path.normpath(input)))[0]
+        directory = args.output or os.path.dirname(os.path.normpath(input))
+        output = os.path.join(directory, "{}.{}".format(name, args.format))
+        if not os.path.exists(input):
+            jobs.append((input, output, spec, args.format, cache))  # reported as an error
+        elif (not args.force and os.path.exists(output) and
+              os.path.getmtime(output) >= max(_mtime(input), spec_time)):
+            skipped.append((input, output))
+        else:
+            jobs.append((input, output, spec, args.format, cache))
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    for input, output in skipped:
+        print("{:>9}  {} -> {}".format("skipped", input, output))
+
+    start = time.perf_counter()
+    num_failed = 0
+    if jobs:
+        if args.jobs and args.jobs > 1 and len(jobs) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+            results = pool.imap_unordered(_job, jobs)
+        else:
+            pool, results = None, map(_job, jobs)
+
+        for (input, output, *_), seconds, error in results:
+            if error:
+                num_failed += 1
+                print("{:>9}  {}: {}".format("FAILED", input, error), file=sys.stderr)
+            else:
+                print("{:>7.2f} s  {} -> {}".format(seconds, input, output))
+            sys.stdout.flush()
+
+        if pool:
+            pool.close()
+            pool.join()
+
+    print("{} rendered, {} skipped, {} failed in {:.2f} s".format(
+        len(jobs) - num_failed, len(skipped), num_failed, time.perf_counter() - start))
+    return 1 if num_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""Up-front cost estimates of structure and map plots and the `tbplot.budget.*` policy
+
+The estimates are computed from the element counts alone: sites, hoppings, periodic
+images and lead repetitions. Nothing is plotted. Vector output (the format given to
+:func:`.render`, otherwise the `savefig.format` of :data:`matplotlib.rcParams`) costs
+much more for each element which isn't rasterized, see the `tbplot.rasterize.*` settings of :data:`.rc`.
+The plot functions check the estimates against the `tbplot.budget.memory` and
+`tbplot.budget.seconds` limits and apply the `tbplot.budget.policy` when a plot
+doesn't fit:
+
+- 'warn': plot anyway, but issue a warning (default).
+- 'raise': fail fast with a `RuntimeError` before any memory is allocated.
+- 'degrade': plot the most detailed variant which fits and warn about it. For vector
+  output, structures are first drawn with rasterized sites and hoppings. Then with
+  fewer periodic images or lead repetitions and, if that's still too much, without
+  the hoppings. Maps switch to the decimated (raster) plot.
+- `None`: don't estimate anything.
+
+There is no "instanced" variant: the site markers are already drawn as a single
+instanced `CircleCollection` and merging the hopping lines doesn't reduce the memory.
+"""
+import threading
+import warnings
+from collections import namedtuple
+from contextlib import contextmanager
+
+import matplotlib as mpl
+
+from .structure import _periodic_layout, _is_rasterized
+from .style import rc
+
+__all__ = ["PlotCost", "estimate_system", "estimate_map"]
+
+PlotCost = namedtuple("PlotCost", "num_artists num_sites num_hoppings memory seconds")
+# noinspection PyUnresolvedReferences
+PlotCost.__doc__ = """
+Estimated cost of a plot, see :func:`estimate_system` and :func:`estimate_map`
+
+Attributes
+----------
+num_artists : int
+    Number of matplotlib collections.
+num_sites, num_hoppings : int
+    Total number of drawn elements, including all the periodic images.
+memory : int
+    Peak transient memory of plotting and drawing in bytes.
+seconds : float
+    Approximate time to plot and draw at the default figure size.
+"""
+
+# Bytes and seconds per drawn element: measured with the Agg backend (the resident
+# memory growth of a `savefig`) and rounded up. The Python path objects of each line
+# segment dominate, the site markers are instanced by `CircleCollection`.
+_per_site = 100, 3e-5
+_per_hopping = 500, 2.5e-5
+_per_map_site = dict(plot_pcolor=(1400, 5e-5), plot_contourf=(1900, 1e-4),
+                     plot_contour=(1900, 1e-4), decimated=(110, 2e-6))
+# Additional cost of each element which isn't rasterized in vector output (svg, pdf)
+_vector_formats = ("svg", "svgz", "pdf", "ps", "eps")
+_vector_per_site = 250, 1.5e-4
+_vector_per_hopping = 1600, 2.5e-4
+
+
+def _nnz(hoppings):
+    return hoppings.nnz if hasattr(hoppings, "nnz") else len(hoppings[0])
+
+
+_output = threading.local()  # the `format` of the figure which is being rendered
+
+
+@contextmanager
+def _output_format(format):
+    """The plots in this context (and thread) will be saved in `format`"""
+    previous = getattr(_output, "format", None)
+    _output.format = format
+    try:
+        yield
+    finally:
+        _output.format = previous
+
+
+def _is_vector(format=None):
+    format = format or getattr(_output, "format", None) or mpl.rcParams["savefig.format"]
+    return format in _vector_formats
+
+
+def _cost(site_sizes, hopping_sizes, rasterized=None, format=None):
+    """Cost of collections with the given numbers of sites and hoppings
+
+    With `rasterized=None`, each collection follows the `tbplot.rasterize.*` thresholds.
+    """
+    vector = _is_vector(format)
+    memory, seconds = 0, 0.0
+    for kind, sizes, per_element, vector_per_element in [
+        ("sites", site_sizes, _per_site, _vector_per_site),
+        ("hoppings", hopping_sizes, _per_hopping, _vector_per_hopping)
+    ]:
+        for size in sizes:
+            memory += size * per_element[0]
+            seconds += size * per_element[1]
+            if vector and not (rasterized or _is_rasterized(kind, size)):
+                memory += size * vector_per_element[0]
+                seconds += size * vector_per_element[1]
+    return PlotCost(len(site_sizes) + len(hopping_sizes), sum(site_sizes), sum(hopping_sizes),
+                    memory, seconds)
+
+
+def _add(a, b):
+    return PlotCost(*(u + v for u, v in zip(a, b)))
+
+
+def _system_sizes(smap, num_periods, hoppings):
+    """Sizes of the site and hopping collections of :func:`.plot_system`"""
+    units, (boundaries, _, _, which, _) = _periodic_layout(smap.boundaries, num_periods)
+    num_images = 1 + len(units)
+    if not hoppings:
+        return [smap.num_sites] * num_images, []
+
+    boundary_nnz = [_nnz(b.hoppings) for b in boundaries]
+    num_boundary = sum(boundary_nnz[i] for i in which)
+    return ([smap.num_sites] * num_images,
+            [_nnz(smap.hoppings)] * num_images + ([num_boundary] if num_boundary else []))
+
+
+def _lead_sizes(lead_smap, lead_length, hoppings):
+    """Sizes of the site and hopping collections of :func:`.plot_lead`"""
+    sites = [lead_smap.num_sites] * lead_length
+    if not hoppings:
+        return sites, []
+    inner, outer = _nnz(lead_smap.hoppings), _nnz(lead_smap.boundaries[0].hoppings)
+    return sites, [inner, outer] * lead_length
+
+
+def estimate_system(smap, num_periods=1, leads=(), lead_length=6, hoppings=True,
+                    rasterized=None, format=None, num_views=1):
+    """Estimate the cost of :func:`.plot_system` (with `leads`: :func:`.plot_system_with_leads`)
+
+    Parameters
+    ----------
+    smap : StructureMap
+    num_periods : int
+        Number of times to repeat the periodic boundaries.
+    leads : List[StructureMap]
+    lead_length : int
+        Number of times to repeat the lead structure.
+    hoppings : bool
+        Include the hopping lines.
+    rasterized : Optional[bool]
+        Rasterize all the collections. By default, the `tbplot.rasterize.*` thresholds
+        of :data:`.rc` decide for each collection.
+    format : Optional[str]
+        Output format: by default, the one given to :func:`.render` or the
+        `savefig.format` of :data:`matplotlib.rcParams`.
+    num_views : int
+        Number of projections, see :func:`.plot_system_views`.
+
+    Returns
+    -------
+    PlotCost
+    """
+    cost = _cost(*_system_sizes(smap, num_periods, hoppings), rasterized, format)
+    for lead_smap in leads:
+        cost = _add(cost, _cost(*_lead_sizes(lead_smap, lead_length, hoppings),
+                                rasterized, format))
+    return PlotCost(*(v * num_views for v in cost))
+
+
+def estimate_map(smap, plot="plot_pcolor", decimate=None):
+    """Estimate the cost of a :class:`.SpatialMap` color or contour plot
+
+    Parameters
+    ----------
+    smap : SpatialMap
+    plot : str
+        'plot_pcolor', 'plot_contourf' or 'plot_contour'.
+    decimate : Optional[str]
+        See :meth:`.SpatialMap.plot_pcolor`.
+
+    Returns
+    -------
+    PlotCost
+    """
+    per_site = _per_map_site["decimated" if decimate else plot]
+    return PlotCost(1, smap.num_sites, 0, smap.num_sites * per_site[0],
+                    smap.num_sites * per_site[1])
+
+
+def _format_bytes(value):
+    """
+    >>> _format_bytes(3 * 2**29)
+    '1.5 GiB'
+    """
+    for unit in ["bytes", "KiB", "MiB"]:
+        if value < 1024:
+            return "{:.1f} {}".format(value, unit)
+        value /= 1024
+    return "{:.1f} GiB".format(value)
+
+
+def _over_budget(cost):
+    """Describe how `cost` exceeds the budget: an empty string if it doesn't"""
+    problems = []
+    memory, seconds = rc.get("tbplot.budget.memory"), rc.get("tbplot.budget.seconds")
+    if memory is not None and cost.memory > memory:
+        problems.append("{} of memory > tbplot.budget.memory = {}".format(
+            _format_bytes(cost.memory), _format_bytes(memory)))
+    if seconds is not None and cost.seconds > seconds:
+        problems.append("{:.1f} s > tbplot.budget.seconds = {} s".format(cost.seconds, seconds))
+    if not problems:
+        return ""
+    return "estimated {} ({} sites and {} hoppings in {} collections)".format(
+        " and ".join(problems), cost.num_sites, cost.num_hoppings, cost.num_artists)
+
+
+def _fit_budget(what, variants):
+    """Apply the `tbplot.budget.policy` to a plot and return the options to plot it with
+
+    Parameters
+    ----------
+    what : str
+        Name of the plot function, for the messages.
+    variants : Iterable[Tuple[str, Any, Callable[[], PlotCost]]]
+        The (description, options, cost) of the requested plot followed by progressively
+        cheaper variants. Only the costs which are needed are evaluated.
+    """
+    policy = rc.get("tbplot.budget.policy")
+    variants = iter(variants)
+    _, options, cost = next(variants)
+    if not policy:
+        return options
+    elif policy not in ("warn", "raise", "degrade"):
+        raise RuntimeError("Unknown tbplot.budget.policy: '{}'".format(policy))
+
+    problem = _over_budget(cost())
+    if not problem:
+        return options
+    elif policy == "warn":
+        warnings.warn("{}: {}".format(what, problem), stacklevel=4)
+        return options
+    elif policy == "degrade":
+        for description, degraded_options, degraded_cost in variants:
+            if not _over_budget(degraded_cost()):
+                warnings.warn("{}: {}, plotting {} instead".format(what, problem, description),
+                              stacklevel=4)
+                return degraded_options
+    raise RuntimeError("{}: {}".format(what, problem))
+
+
+def _degrade_props(props, hoppings=True, rasterized=None):
+    """Structure plot properties without the hopping lines and/or with rasterized collections"""
+    if not hoppings:
+        props = dict(props, hopping=dict(props["hopping"], width=0),
+                     boundary=dict(props["boundary"], width=0))
+    if rasterized:
+        props = dict(props, **{name: dict(props[name], rasterized=True)
+                               for name in ("site", "hopping", "boundary")})
+    return props
+
+
+def _degrade_step(description, options, rasterize, cost):
+    """A variant for :func:`_fit_budget` which is rasterized if `rasterize` is set
+
+    Returns (description, options + (rasterize,), cost) where `cost(*options, rasterize)`
+    is only evaluated when it's needed.
+    """
+    if rasterize:
+        description = ("{} (rasterized)".format(description) if description
+                       else "rasterized collections")
+    return description, options + (rasterize,), lambda: cost(*options, rasterize)
+
+
+def _fit_system(what, smap, num_periods, num_views=1):
+    """The `num_periods`, whether to draw the hoppings and to rasterize a structure plot"""
+    rasterize = True if _is_vector() else None  # it only saves anything in vector output
+
+    def cost(n, hoppings, rasterized):
+        return estimate_system(smap, n, hoppings=hoppings, rasterized=rasterized,
+                               num_views=num_views)
+
+    def variants():
+        yield _degrade_step("", (num_periods, True), None, cost)
+        if rasterize:
+            yield _degrade_step("", (num_periods, True), rasterize, cost)
+        for n in reversed(range(num_periods)):
+            yield _degrade_step("num_periods={}".format(n), (n, True), rasterize, cost)
+        yield _degrade_step("only the sites", (0, False), rasterize, cost)
+
+    return _fit_budget(what, variants())
+
+
+def _fit_lead(lead_smap, lead_length):
+    """The `lead_length`, whether to draw the hoppings and to rasterize :func:`.plot_lead`"""
+    rasterize = True if _is_vector() else None
+
+    def cost(length, hoppings, rasterized):
+        return _cost(*_lead_sizes(lead_smap, length, hoppings), rasterized)
+
+    def variants():
+        yield _degrade_step("", (lead_length, True), None, cost)
+        if rasterize:
+            yield _degrade_step("", (lead_length, True), rasterize, cost)
+        for n in reversed(range(1, lead_length)):
+            yield _degrade_step("lead_length={}".format(n), (n, True), rasterize, cost)
+        yield _degrade_step("only the sites", (1, False), rasterize, cost)
+
+    return _fit_budget("plot_lead", variants())
+
+
+def _fit_system_with_leads(smap, leads, num_periods, lead_length):
+    """The `num_periods`, `lead_length`, hoppings and rasterization of the whole figure
+
+    The combined cost of the structure and all the leads is checked at once: each part
+    may fit on its own while the figure doesn't. Lead repetitions are dropped before
+    the periodic images.
+    """
+    rasterize = True if _is_vector() else None
+
+    def cost(n, length, hoppings, rasterized):
+        return estimate_system(smap, n, leads, length, hoppings=hoppings, rasterized=rasterized)
+
+    def variants():
+        yield _degrade_step("", (num_periods, lead_length, True), None, cost)
+        if rasterize:
+            yield _degrade_step("", (num_periods, lead_length, True), rasterize, cost)
+        for length in reversed(range(1, lead_length)):
+            yield _degrade_step("lead_length={}".format(length), (num_periods, length, True),
+                                rasterize, cost)
+        for n in reversed(range(num_periods)):
+            yield _degrade_step("num_periods={}, lead_length=1".format(n), (n, 1, True),
+                                rasterize, cost)
+        yield _degrade_step("only the sites", (0, 1, False), rasterize, cost)
+
+    return _fit_budget("plot_system_with_leads", variants())
+
+
+def _fit_map(smap, plot, decimate):
+    """The `decimate` option of a map plot: 'mean' if the full plot doesn't fit"""
+    def variants():
+        yield "", decimate, lambda: estimate_map(smap, plot, decimate)
+        if not decimate and plot != "plot_contour":
+            yield "the decimated map", "mean", lambda: estimate_map(smap, plot, "mean")
+
+    return _fit_budget(plot, variants())
@@ -0,0 +1,128 @@
+"""Vectorized binned statistics of scattered data"""
+import numpy as np
+
+
+def reduce_by_key(keys, values, statistic, size):
+    """Reduce `values` which share the same integer key in range [0, size)
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Integer bin index of each value.
+    values : np.ndarray
+    statistic : str
+        One of 'mean', 'sum', 'max', 'min' or 'count'.
+    size : int
+        Total number of bins.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The statistic and the number of values in each bin.
+
+    Examples
+    --------
+    >>> result, count = reduce_by_key(np.array([0, 2, 2]), np.array([1., 2., 4.]), "max", 3)
+    >>> result.tolist(), count.tolist()
+    ([1.0, 0.0, 4.0], [1, 0, 2])
+    """
+    count = np.bincount(keys, minlength=size)
+    if statistic == "count":
+        return count.astype(float), count
+    elif statistic in ("sum", "mean"):
+        total = np.bincount(keys, weights=values, minlength=size)
+        return (total / np.maximum(count, 1) if statistic == "mean" else total), count
+    elif statistic in ("max", "min"):
+        ufunc = np.maximum if statistic == "max" else np.minimum
+        order = np.argsort(keys, kind="mergesort")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+        result = np.zeros(size)
+        if starts.size:
+            result[sorted_keys[starts]] = ufunc.reduceat(values[order], starts)
+        return result, count
+    else:
+        raise RuntimeError("Unknown statistic: '{}'".format(statistic))
+
+
+def grid_statistic(x, y, values, extent, shape, statistic="mean"):
+    """Binned statistic of scattered (x, y) data on a regular 2D grid
+
+    Parameters
+    ----------
+    x, y, values : np.ndarray
+    extent : Tuple[float, float, float, float]
+        Grid bounds: (xmin, xmax, ymin, ymax). Points outside are ignored.
+    shape : Tuple[int, int]
+        Number of bins: (rows along y, columns along x).
+    statistic : str
+        See :func:`reduce_by_key`.
+
+    Returns
+    -------
+    np.ma.MaskedArray
+        Array of `shape` with the first row at `ymin`. Empty bins are masked.
+    """
+    (x0, x1, y0, y1), (ny, nx) = extent, shape
+    inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    x, y, values = x[inside], y[inside], values[inside]
+
+    ix = np.clip(((x - x0) * (nx / max(x1 - x0, np.finfo(float).tiny))).astype(np.intp), 0, nx - 1)
+    iy = np.clip(((y - y0) * (ny / max(y1 - y0, np.finfo(float).tiny))).astype(np.intp), 0, ny - 1)
+    result, count = reduce_by_key(iy * nx + ix, values, statistic, nx * ny)
+    return np.ma.masked_array(result.reshape(ny, nx), mask=(count == 0).reshape(ny, nx))
+
+
+class ChunkedReduction:
+    """Binned statistic accumulated over chunks of data
+
+    Each chunk is reduced to partial statistics per unique bin key and the partials
+    are merged at the end, so memory is proportional to the number of bins and the
+    size of a single chunk.
+
+    Parameters
+    ----------
+    statistic : str
+        One of 'mean', 'sum', 'max', 'min' or 'count'.
+    """
+
+    _partial_statistics = dict(mean=("sum",), sum=("sum",), max=("max",), min=("min",), count=())
+
+    def __init__(self, statistic="mean"):
+        if statistic not in self._partial_statistics:
+            raise RuntimeError("Unknown statistic: '{}'".format(statistic))
+        self.statistic = statistic
+        self._keys = []
+        self._partials = []
+
+    def add(self, keys, values):
+        """Add a chunk: 2D integer `keys` (one row per value) and 1D `values`"""
+        if keys.shape[0] == 0:
+            return
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        size = unique_keys.shape[0]
+        partial = {name: reduce_by_key(inverse, values, name, size)[0]
+                   for name in self._partial_statistics[self.statistic]}
+        partial["count"] = np.bincount(inverse, minlength=size).astype(float)
+        self._keys.append(unique_keys)
+        self._partials.append(partial)
+
+    def result(self):
+        """Return the unique bin keys (2D) and the statistic for each of them"""
+        if not self._keys:
+            return np.empty((0, 0), dtype=np.int64), np.empty(0)
+
+        unique_keys, inverse = np.unique(np.concatenate(self._keys), axis=0, return_inverse=True)
+        size = unique_keys.shape[0]
+
+        def merge(name, how):
+            values = np.concatenate([p[name] for p in self._partials])
+            return reduce_by_key(inverse, values, how, size)[0]
+
+        count = merge("count", "sum")
+        if self.statistic == "count":
+            return unique_keys, count
+        elif self.statistic == "mean":
+            return unique_keys, merge("sum", "sum") / count
+        else:
+            return unique_keys, merge(self.statistic, self.statistic)
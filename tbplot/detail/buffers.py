@@ -0,0 +1,137 @@
+"""Growable arrays and sorting of data which arrives in chunks"""
+import numpy as np
+
+
+class GrowableArray:
+    """Array which can be appended to in chunks with amortized constant cost
+
+    The capacity doubles when it's exceeded, so a sequence of `append` calls never
+    holds more than one extra copy of the data.
+
+    Parameters
+    ----------
+    dtype : np.dtype
+    width : Optional[int]
+        Number of columns for a 2D array or `None` for 1D.
+    capacity : int
+        Number of preallocated rows.
+
+    Examples
+    --------
+    >>> a = GrowableArray(int, capacity=2)
+    >>> a.append([1, 2, 3])
+    >>> a.append(np.array([4]))
+    >>> a.view.tolist(), len(a)
+    ([1, 2, 3, 4], 4)
+    """
+
+    def __init__(self, dtype, width=None, capacity=1024):
+        self._shape_tail = () if width is None else (width,)
+        self._buffer = np.empty((max(capacity, 1),) + self._shape_tail, dtype=dtype)
+        self._size = 0
+        self.runs = [0]  # start of each appended chunk and the end of the last one
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def view(self) -> np.ndarray:
+        """The appended data without a copy (invalidated by the next `append`)"""
+        return self._buffer[:self._size]
+
+    def reserve(self, capacity):
+        """Make sure there is room for at least `capacity` rows"""
+        if capacity > self._buffer.shape[0]:
+            new_capacity = max(capacity, 2 * self._buffer.shape[0])
+            buffer = np.empty((new_capacity,) + self._shape_tail, dtype=self._buffer.dtype)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+
+    def append(self, values):
+        values = np.asarray(values)
+        if values.ndim == len(self._shape_tail):  # a single row
+            values = values[np.newaxis]
+        size = self._size + values.shape[0]
+        self.reserve(size)
+        self._buffer[self._size:size] = values
+        self._size = size
+        self.runs.append(size)
+
+
+def split_evenly(size, num_parts):
+    """Split `range(size)` into at most `num_parts` contiguous slices
+
+    >>> split_evenly(10, 3)
+    [slice(0, 3, None), slice(3, 6, None), slice(6, 10, None)]
+    """
+    bounds = np.linspace(0, size, max(min(num_parts, size), 1) + 1).astype(int).tolist()
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _merge_positions(a, b, map, num_parts):
+    """Position of each element of sorted `a` and `b` in their stable merge"""
+    if num_parts == 1:
+        # final position of `a` elements: own rank + rank in `b` (ties go first),
+        # the `b` elements fill the remaining positions in their existing order
+        position_a = np.searchsorted(b, a, side="left") + np.arange(a.size)
+        is_b = np.ones(a.size + b.size, dtype=bool)
+        is_b[position_a] = False
+        return np.concatenate([position_a, np.flatnonzero(is_b)])
+
+    def rank(job):
+        values, other, side, start = job
+        return np.searchsorted(other, values, side) + np.arange(start, start + values.size)
+
+    jobs = [(a[s], b, "left", s.start) for s in split_evenly(a.size, num_parts)]
+    jobs += [(b[s], a, "right", s.start) for s in split_evenly(b.size, num_parts)]
+    return np.concatenate(list(map(rank, jobs)))
+
+
+def merge_sorted_runs(keys, runs, map=map, num_parts=1):
+    """Return the stable sorting order of `keys` which consists of individually sorted runs
+
+    Adjacent runs are merged pairwise with :func:`~numpy.searchsorted` until a single
+    run remains. Runs which are already in order relative to each other (e.g. chunks
+    of layered data) are merged at no cost.
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        1D array where each run `keys[runs[i]:runs[i + 1]]` is sorted.
+    runs : array_like
+        Run boundaries: starts with 0 and ends with `keys.size`.
+    map : Callable
+        Applied to independent parts of each merge, e.g. :meth:`Executor.map`.
+    num_parts : int
+        Number of independent parts of each merge.
+
+    Returns
+    -------
+    np.ndarray
+        Indices which sort `keys`, same as a stable :func:`~numpy.argsort`.
+
+    Examples
+    --------
+    >>> merge_sorted_runs(np.array([1, 4, 6, 2, 4, 5, 0, 9]), [0, 3, 6, 8]).tolist()
+    [6, 0, 3, 1, 4, 5, 2, 7]
+    """
+    order = np.arange(keys.size)
+    keys = keys.copy()  # merged in step with `order`
+    runs = list(runs)
+    while len(runs) > 2:
+        merged_runs = [runs[0]]
+        for start, middle, end in zip(runs[0:-2:2], runs[1:-1:2], runs[2::2]):
+            a, b = keys[start:middle], keys[middle:end]
+            if a.size and b.size and a[-1] > b[0]:  # otherwise, already in order
+                position = start + _merge_positions(a, b, map, num_parts)
+                source_keys, source_order = keys[start:end].copy(), order[start:end].copy()
+
+                def scatter(s):
+                    keys[position[s]], order[position[s]] = source_keys[s], source_order[s]
+
+                list(map(scatter, split_evenly(end - start, num_parts)))
+            merged_runs.append(end)
+        if len(runs) % 2 == 0:  # odd number of runs: the last one waits for the next pass
+            merged_runs.append(runs[-1])
+        runs = merged_runs
+    return order
@@ -18,6 +18,43 @@ class CircleCollection(Collection):
         self._paths = [path.Path.unit_circle()]
         self.set_transform(transforms.IdentityTransform())
         self._transforms = np.empty((0, 3, 3))
+        self._tree = None
+        self._tree_offsets = None
+
+    def _kdtree(self):
+        """k-d tree of the circle centers, rebuilt only if the offsets are replaced"""
+        if self._tree is None or self._tree_offsets is not self._offsets:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self._offsets)
+            self._tree_offsets = self._offsets
+        return self._tree
+
+    def index_at(self, x, y, k=8):
+        """Index of the circle which contains the point (x, y) given in data units
+
+        The `k` nearest centers are found in O(log N) and the one closest relative to
+        its radius is returned if it contains the point, otherwise `None`.
+        """
+        if len(self._offsets) == 0:
+            return None
+
+        distance, idx = self._kdtree().query([x, y], k=min(k, len(self._offsets)))
+        distance, idx = np.atleast_1d(distance), np.atleast_1d(idx)
+        radius = self.radius[idx] if self.radius.size > 1 else self.radius
+        ratio = distance / radius
+        best = ratio.argmin()
+        return int(idx[best]) if ratio[best] <= 1 else None
+
+    def contains(self, mouseevent):
+        """Fast replacement for `Collection.contains` based on a k-d tree and data units"""
+        if getattr(self, '_contains', None) is not None:
+            return self._contains(self, mouseevent)
+        if not self.get_visible() or self.axes is None or mouseevent.x is None:
+            return False, {}
+
+        x, y = self.axes.transData.inverted().transform_point((mouseevent.x, mouseevent.y))
+        idx = self.index_at(x, y)
+        return (True, dict(ind=[idx])) if idx is not None else (False, {})
 
     def _set_transforms(self):
         ax = self.axes
@@ -34,6 +71,8 @@ class CircleCollection(Collection):
 
 # noinspection PyAbstractClass
 class Circle3DCollection(CircleCollection):
+    contains = Collection.contains  # the offsets are projected on every draw
+
     def __init__(self, radius, zs=0, zdir='z', depthshade=True, **kwargs):
         super().__init__(radius, **kwargs)
         self._depthshade = depthshade
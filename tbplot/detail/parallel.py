@@ -0,0 +1,101 @@
+"""Opt-in multithreading of the NumPy kernels used to prepare large plots
+
+Sorting, gathering and searching release the GIL, so splitting large arrays into
+chunks lets a thread pool use all the cores. The number of threads is set by the
+`tbplot.threads` key of :data:`.rc`. The results are identical for any number of
+threads: sorting is always stable.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .buffers import merge_sorted_runs, split_evenly
+
+_executors = {}
+
+
+def num_threads(size):
+    """Number of threads to use for an array of `size` elements"""
+    from ..style import rc
+    threads = rc.get("tbplot.threads") or os.cpu_count() or 1
+    if threads > 1 and size < rc.get("tbplot.threads.min_size", 0):
+        return 1
+    return max(min(threads, size), 1)
+
+
+def _executor(threads):
+    if threads not in _executors:
+        _executors[threads] = ThreadPoolExecutor(threads)
+    return _executors[threads]
+
+
+def parallel_map(func, items, threads):
+    """Like `map`, but eager and spread across `threads`"""
+    if threads == 1:
+        return [func(item) for item in items]
+    return list(_executor(threads).map(func, items))
+
+
+def argsort(keys, runs=None):
+    """Stable :func:`~numpy.argsort`: chunks are sorted in parallel, then merged
+
+    Parameters
+    ----------
+    keys : np.ndarray
+    runs : Optional[List[int]]
+        Boundaries of the chunks, e.g. the parts of the data as it was received.
+        By default, the keys are split evenly between the threads.
+
+    Examples
+    --------
+    >>> argsort(np.array([3, 1, 2, 1])).tolist()
+    [1, 3, 2, 0]
+    >>> argsort(np.array([3, 1, 2, 1]), runs=[0, 1, 4]).tolist()
+    [1, 3, 2, 0]
+    """
+    threads = num_threads(keys.size)
+    if runs is None:
+        if threads == 1:
+            return np.argsort(keys, kind="mergesort")
+        runs = [s.start for s in split_evenly(keys.size, threads)] + [keys.size]
+
+    order = np.empty(keys.size, dtype=np.intp)
+
+    def sort_chunk(bounds):
+        start, end = bounds
+        order[start:end] = start + np.argsort(keys[start:end], kind="mergesort")
+
+    parallel_map(sort_chunk, zip(runs[:-1], runs[1:]), threads)
+    executor_map = _executor(threads).map if threads > 1 else map
+    return order[merge_sorted_runs(take(keys, order), runs, executor_map, threads)]
+
+
+def take(array, idx):
+    """Same as `array[idx]` for an integer `idx`, gathered in parallel chunks"""
+    threads = num_threads(idx.size)
+    if threads == 1:
+        return array[idx]
+
+    result = np.empty(idx.shape + array.shape[1:], dtype=array.dtype)
+
+    def gather(s):
+        result[s] = array[idx[s]]
+
+    parallel_map(gather, split_evenly(idx.size, threads), threads)
+    return result
+
+
+def unique(values):
+    """Same as :func:`~numpy.unique` with the chunks reduced in parallel
+
+    >>> unique(np.array([2, 1, 2, 0])).tolist()
+    [0, 1, 2]
+    """
+    values = np.ravel(values)
+    threads = num_threads(values.size)
+    if threads == 1:
+        return np.unique(values)
+    parts = parallel_map(lambda s: np.unique(values[s]), split_evenly(values.size, threads),
+                         threads)
+    return np.unique(np.concatenate(parts))
@@ -1,4 +1,9 @@
 import copy
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
 import numpy as np
 
 
@@ -83,3 +88,126 @@ class FuzzySet:
     def add(self, item):
         if item not in self:
             self.data.append(item)
+
+
+def fingerprint(obj):
+    """Cheap summary of an array or sparse matrix which changes if it's modified
+
+    Only the metadata, the data pointer and a few sampled values are considered,
+    so the cost doesn't depend on the size of the array.
+
+    >>> a = np.arange(100)
+    >>> fingerprint(a) == fingerprint(a)
+    True
+    >>> b = a.copy(); b[0] = -1
+    >>> fingerprint(a) == fingerprint(b)
+    False
+    """
+    if isinstance(obj, np.ndarray):
+        sample = obj.flat[np.linspace(0, obj.size - 1, min(obj.size, 9)).astype(int)]
+        return (obj.shape, obj.dtype.str, obj.__array_interface__['data'][0],
+                sample.tobytes())
+    elif hasattr(obj, 'format') and hasattr(obj, 'nnz'):  # scipy.sparse matrix
+        parts = (getattr(obj, name, None) for name in ('data', 'row', 'col', 'indices', 'indptr'))
+        return (obj.format, obj.shape, obj.nnz) + tuple(fingerprint(p) for p in parts
+                                                         if p is not None)
+    else:
+        return obj
+
+
+def stable_json(obj):
+    """`default` function for :func:`json.dumps` which gives the same output on every run
+
+    Arrays are replaced by a hash of their contents, colormaps by their colors and other
+    matplotlib objects (e.g. norms) by their type and attributes. Objects which can only
+    be described by a `repr()` containing their address are rejected.
+
+    >>> import json
+    >>> from matplotlib.colors import Normalize
+    >>> a, b = (json.dumps([Normalize(0, 1)], default=stable_json) for _ in range(2))
+    >>> a == b
+    True
+    >>> json.dumps(object(), default=stable_json)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    RuntimeError: Can't make a stable key from <object object at ...>
+    """
+    from matplotlib.colors import Colormap
+
+    if isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        digest = hashlib.sha1(obj.data if obj.size else b"").hexdigest()
+        return "ndarray({}, {}, {})".format(obj.dtype.str, obj.shape, digest)
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, Colormap):
+        return [type(obj).__name__, obj.name, obj(np.linspace(0, 1, obj.N))]
+    elif isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    elif type(obj).__module__.startswith("matplotlib") and hasattr(obj, "__dict__"):
+        simple = (str, int, float, bool, type(None), tuple, list, np.ndarray, np.generic)
+        return [type(obj).__name__, {k: v for k, v in sorted(vars(obj).items())
+                                     if isinstance(v, simple)}]
+
+    text = repr(obj)
+    if " at 0x" in text:
+        raise RuntimeError("Can't make a stable key from {}".format(text))
+    return text
+
+
+class IdentityCache:
+    """Cache values derived from objects which are identified by `id()` and :func:`fingerprint`
+
+    An entry is dropped as soon as one of its key objects is garbage collected
+    and it's recomputed if the fingerprint of a key object changes. The entries may
+    be used from several threads: a value is computed outside of the lock, so two
+    threads may compute the same missing value at the same time.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, objects, name, compute):
+        """Return the cached `name` value for `objects` or call `compute()` to make it
+
+        Parameters
+        ----------
+        objects : Sequence
+            Key objects: arrays, sparse matrices or anything else which supports weak
+            references. The value isn't cached if that's not the case.
+        name : Hashable
+            Identifies the value which is derived from `objects`.
+        compute : Callable[[], Any]
+        """
+        key = tuple(id(obj) for obj in objects) + (name,)
+        prints = tuple(fingerprint(obj) for obj in objects)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == prints:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        value = compute()
+
+        def evict(_, entries=self._entries):
+            entries.pop(key, None)
+
+        try:
+            refs = [weakref.ref(obj, evict) for obj in objects]
+        except TypeError:
+            return value  # some key objects can't be tracked, e.g. lists: don't cache
+
+        with self._lock:
+            self._entries[key] = refs, prints, value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,420 @@
+"""Stream structure plots directly to SVG or PDF files without the matplotlib artist tree"""
+import zlib
+
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib import colors as mpl_colors
+
+from . import pltutils
+from .detail import parallel
+from .structure import (structure_plot_properties, _site_cmap, _hopping_cmap, _rotate,
+                        _as_triplets, _select_hoppings, _periodic_layout, _boundary_segments,
+                        _depth_order, _cache)
+
+__all__ = ["export_system", "export_structure"]
+
+
+def export_system(smap, file, num_periods=1, format=None, width=None, chunk_size=2**16,
+                  **kwargs):
+    """Write the structure as drawn by :func:`.plot_system` directly to an SVG or PDF file
+
+    Parameters
+    ----------
+    smap : StructureMap
+    file : Union[str, file]
+        File name or a binary file object.
+    num_periods : int
+        Number of times to repeat the periodic boundaries.
+    format, width, chunk_size
+        See :func:`export_structure`.
+    **kwargs
+        Additional plot arguments as specified in :func:`.structure_plot_properties`.
+    """
+    export_structure(file, smap.positions, smap.sublattices, smap.hoppings, smap.boundaries,
+                     num_periods, format, width, chunk_size, **kwargs)
+
+
+def export_structure(file, positions, data, hoppings, boundaries=(), num_periods=1,
+                     format=None, width=None, chunk_size=2**16, **kwargs):
+    """Write sites, hoppings and periodic boundaries directly to an SVG or PDF file
+
+    The output matches the colors, blending and line widths of :func:`.plot_sites`,
+    :func:`.plot_hoppings` and :func:`.plot_periodic_boundaries`, but the geometry is
+    written straight from the arrays in chunks of `chunk_size` elements. Each site is
+    a reference to a shared circle (an SVG `<symbol>` or a PDF form XObject) and the
+    hoppings are a single path per color. Only the structure is drawn: no axes, labels
+    or ticks. The time and memory don't depend on the matplotlib backend.
+
+    Parameters
+    ----------
+    file : Union[str, file]
+        File name or a binary file object.
+    positions, data, hoppings, boundaries, num_periods
+        See :func:`.plot_periodic_boundaries`.
+    format : Optional[str]
+        'svg' or 'pdf'. By default, it's taken from the extension of the `file` name.
+    width : Optional[float]
+        Width of the page in points. The height follows from the 'equal' aspect ratio.
+        Defaults to the width of the 'figure.figsize' rc setting.
+    chunk_size : int
+        Number of sites or hoppings which are formatted at once.
+    **kwargs
+        Additional plot arguments as specified in :func:`.structure_plot_properties`.
+        The matplotlib specific collection arguments (other than `alpha`, `lw` and
+        `edgecolor` of the sites) are ignored.
+    """
+    props = structure_plot_properties(**kwargs)
+    _export(file, format, width, chunk_size, (positions, data, hoppings, boundaries),
+            num_periods, props)
+
+
+def _export(file, format, width, chunk_size, structure, num_periods, props,
+            periodic_props=None):
+    """Write the `structure` with separate `periodic_props` for the periodic images"""
+    positions, data, hoppings, boundaries = structure
+    periodic_props = periodic_props or props
+    if format is None:
+        if not isinstance(file, str) or "." not in file:
+            raise RuntimeError("The export format can't be deduced from the file name")
+        format = file.rsplit(".", 1)[1]
+    writers = dict(svg=_SvgWriter, pdf=_PdfWriter)
+    if format.lower() not in writers:
+        raise RuntimeError("Unknown export format: '{}'".format(format))
+
+    scene = _Scene(positions, data, hoppings, boundaries, num_periods, props, periodic_props,
+                   width or mpl.rcParams["figure.figsize"][0] * 72, chunk_size)
+    if isinstance(file, str):
+        with open(file, "wb") as f:
+            scene.write(writers[format.lower()](f, scene.width, scene.height, scene.symbols))
+    else:
+        scene.write(writers[format.lower()](file, scene.width, scene.height, scene.symbols))
+
+
+def _colorize(values, cmap, blend=1.0, unique=None):
+    """Return a function which maps a chunk of `values` to RGBA bytes like a collection"""
+    if isinstance(cmap, (list, tuple)):
+        unique = unique if unique is not None else parallel.unique(values)
+        cm, norm = pltutils.direct_cmap_norm(unique, cmap, blend)
+    else:
+        cm = plt.get_cmap(cmap)
+        norm = mpl_colors.Normalize(*((values.min(), values.max()) if values.size else ()))
+    return lambda chunk: cm(norm(chunk), bytes=True)
+
+
+def _clip_scale(points_per_nm, reference, lower, upper):
+    """The line and radius scaling of `_connect_dynamic_scale` callbacks at a fixed zoom"""
+    return float(np.clip(reference * points_per_nm, lower, upper))
+
+
+class _Scene:
+    """The page geometry and the draw order of all the sites and hoppings
+
+    The hopping layers are drawn first (zorder -1 in the matplotlib plot), followed by
+    the site layers, each in the order of the plotting calls.
+    """
+
+    def __init__(self, positions, data, hoppings, boundaries, num_periods, props,
+                 periodic_props, width, chunk_size):
+        self.chunk_size = max(int(chunk_size), 1)
+        axes = props["axes"]
+        self.pos = np.array(_rotate(positions, axes)[:2]).T
+        self.data = np.asarray(data)
+        self.triplets = _as_triplets(hoppings)
+        self.props, self.periodic_props = props, periodic_props
+        units, combinations = _periodic_layout(boundaries, num_periods)
+        self.units = [(np.array(_rotate(shift, axes)[:2], dtype=float), blend)
+                      for shift, blend in units]
+
+        # the depth order of the sites is the same for every periodic image
+        z = np.asarray(_rotate(positions, axes)[2])
+        self.site_index = _cache.get([z], "depth_order", lambda: _depth_order(z))
+
+        site = props["site"]
+        self.boundary = _boundary_segments(
+            positions, combinations, _hopping_cmap(props["boundary"].get(
+                "cmap", [props["boundary"].get("color", "#666666")])),
+            axes, draw_only=props["boundary"].get("draw_only", ())
+        ) if props["boundary"].get("width", 1.0) != 0 else None
+
+        # page extent: all periodic images plus the largest site and a margin
+        radius = np.asarray(site.get("radius", 0.025))
+        lower, upper = self.pos.min(axis=0), self.pos.max(axis=0)
+        if self.units:
+            offsets = np.array([shift for shift, _ in self.units])
+            lower, upper = np.minimum(lower, lower + offsets.min(axis=0)), \
+                np.maximum(upper, upper + offsets.max(axis=0))
+        if self.boundary is not None:
+            lower = np.minimum(lower, self.boundary[3][0])
+            upper = np.maximum(upper, self.boundary[3][1])
+        lower, upper = lower - 1.3 * radius.max(), upper + 1.3 * radius.max()
+        center, length = (upper + lower) / 2, np.maximum(upper - lower, 0.5) * 1.08
+        self.origin = center - length / 2
+        self.points_per_nm = width / length[0]
+        self.width, self.height = width, length[1] * self.points_per_nm
+
+        # sites: one shared circle per distinct radius (rounded to the output precision)
+        if radius.ndim == 0:
+            scale = float(np.clip(2 - 0.01 * self.points_per_nm, 0.85, 1.3))
+            self.symbols = [round(float(radius) * scale * self.points_per_nm, 2)]
+            self.symbol_ids = None
+        else:
+            if self.site_index is not None:
+                radius = parallel.take(radius, self.site_index)
+            rounded = np.round(radius * self.points_per_nm, 2)
+            self.symbols = parallel.unique(rounded).tolist()
+            self.symbol_ids = np.searchsorted(self.symbols, rounded)
+
+    def to_page(self, points):
+        return (points - self.origin) * self.points_per_nm
+
+    def write(self, writer):
+        hopping_width = _clip_scale(self.points_per_nm, 0.005, 0.6, 1.2)
+        self._hoppings(writer, self.props["hopping"], np.zeros(2), 1.0, hopping_width)
+        for shift, blend in self.units:
+            self._hoppings(writer, self.periodic_props["hopping"], shift, blend, hopping_width)
+        self._boundary(writer, self.props["boundary"], hopping_width)
+
+        if np.any(np.asarray(self.props["site"].get("radius", 0.025)) != 0):
+            self._sites(writer, self.props["site"], np.zeros(2), 1.0)
+            for shift, blend in self.units:
+                self._sites(writer, self.periodic_props["site"], shift, blend)
+        writer.finish()
+
+    def _sites(self, writer, props, shift, blend):
+        cmap = _site_cmap(props.get("cmap", "auto"))
+        unique = _cache.get([self.data], "unique", lambda: parallel.unique(self.data))
+        colorize = _colorize(self.data, cmap, blend, unique)
+        edgecolor = props.get("edgecolor", str(1 - blend))
+        line_scale = _clip_scale(self.points_per_nm, 0.005, 0.2, 1.1)
+        writer.begin_group(props.get("alpha", 0.97), line_scale * props.get("lw", 0.2),
+                           mpl_colors.to_rgba(edgecolor))
+        for start in range(0, self.data.size, self.chunk_size):
+            s = slice(start, start + self.chunk_size)
+            if self.site_index is not None:
+                idx = self.site_index[s]
+                points, data = parallel.take(self.pos, idx), parallel.take(self.data, idx)
+            else:
+                points, data = self.pos[s], self.data[s]
+            symbol_ids = (self.symbol_ids[s] if self.symbol_ids is not None
+                          else np.zeros(points.shape[0], dtype=int))
+            writer.sites(self.to_page(points + shift), symbol_ids, colorize(data))
+        writer.end_group()
+
+    def _hoppings(self, writer, props, shift, blend, line_scale):
+        width = props.get("width", 1.0)
+        if width == 0 or self.triplets[2].size == 0:
+            return
+        cmap = _hopping_cmap(props.get("cmap", [props.get("color", "#666666")]))
+        from_idx, to_idx, hop_ids = _select_hoppings(self.triplets, props.get("symmetric"),
+                                                     props.get("draw_only", ()))
+        if isinstance(cmap, (list, tuple)):
+            colorize = _colorize(None, cmap, blend, np.arange(self.triplets[2].max() + 1))
+        else:
+            colorize = _colorize(hop_ids, cmap)
+
+        writer.begin_group(props.get("alpha", 1.0), line_scale * width)
+        for start in range(0, hop_ids.size, self.chunk_size):
+            s = slice(start, start + self.chunk_size)
+            segments = np.hstack([parallel.take(self.pos, from_idx[s]),
+                                  parallel.take(self.pos, to_idx[s])])
+            writer.lines(self.to_page(segments.reshape(-1, 2) + shift).reshape(-1, 4),
+                         colorize(hop_ids[s]))
+        writer.end_group()
+
+    def _boundary(self, writer, props, line_scale):
+        if self.boundary is None:
+            return
+        lines, hop_ids, colors, _ = self.boundary
+        if colors is not None:
+            colors = (colors * 255).astype(np.uint8)  # same as `Colormap(..., bytes=True)`
+        else:
+            colorize = _colorize(hop_ids, props.get("cmap"))
+            colors = colorize(hop_ids)
+
+        writer.begin_group(props.get("alpha", 1.0), line_scale * props.get("width", 1.0))
+        for start in range(0, hop_ids.size, self.chunk_size):
+            s = slice(start, start + self.chunk_size)
+            writer.lines(self.to_page(lines[s].reshape(-1, 2)).reshape(-1, 4), colors[s])
+        writer.end_group()
+
+
+def _color_groups(colors):
+    """Group elements with the same RGB color: yields (rgb_bytes, element_indices)"""
+    keys = _rgb_keys(colors)
+    order = np.argsort(keys, kind="mergesort")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+    for start, end in zip(starts, np.append(starts[1:], keys.size)):
+        yield colors[order[start], :3], order[start:end]
+
+
+def _style_ids(styles, keys, on_new):
+    """Map integer style `keys` to small consecutive IDs, calling `on_new(key, id)` once"""
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    for key in unique_keys.tolist():
+        if key not in styles:
+            styles[key] = len(styles)
+            on_new(key, styles[key])
+    return np.array([styles[key] for key in unique_keys.tolist()], dtype=int)[inverse]
+
+
+def _hundredths(values):
+    """The output coordinates are integers in units of 0.01 pt: faster to format"""
+    return np.round(np.asarray(values) * 100).astype(np.int64)
+
+
+def _rgb_keys(colors):
+    return np.dot(colors[:, :3].astype(np.int64), [65536, 256, 1])
+
+
+class _SvgWriter:
+    """Sites are `<use>` references to one `<symbol>` per radius, hoppings are paths
+
+    The fill colors are CSS classes which are defined as they first appear.
+    """
+
+    def __init__(self, file, width, height, symbols):
+        self.file, self.height = file, _hundredths(height)
+        self.fill_classes = {}  # RGB key -> CSS class ID
+        self._write('<?xml version="1.0" encoding="utf-8" standalone="no"?>\n'
+                    '<svg xmlns="http://www.w3.org/2000/svg" '
+                    'xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+                    'width="{w:.2f}pt" height="{h:.2f}pt" viewBox="0 0 {vw} {vh}">\n'
+                    '<defs>\n'.format(w=width, h=height, vw=_hundredths(width), vh=self.height))
+        for i, radius in enumerate(symbols):
+            self._write('<symbol id="r{i}" overflow="visible"><circle r="{r}"/></symbol>\n'
+                        .format(i=i, r=_hundredths(radius)))
+        self._write('</defs>\n')
+
+    def _write(self, text):
+        self.file.write(text.encode("ascii"))
+
+    def begin_group(self, alpha, linewidth, edgecolor=None):
+        attributes = 'stroke-width="{}"'.format(_hundredths(linewidth))
+        if edgecolor is None:
+            attributes += ' fill="none"'
+        else:
+            attributes += ' stroke="{}"'.format(mpl_colors.to_hex(edgecolor))
+        if alpha is not None and alpha < 1:
+            attributes += ' fill-opacity="{a:.3g}" stroke-opacity="{a:.3g}"'.format(a=alpha)
+        self._write('<g {}>\n'.format(attributes))
+
+    def end_group(self):
+        self._write('</g>\n')
+
+    def sites(self, points, symbol_ids, colors):
+        def new_class(key, i):
+            self._write('<style>.c{}{{fill:#{:06x}}}</style>\n'.format(i, key))
+
+        classes = _style_ids(self.fill_classes, _rgb_keys(colors), new_class)
+        points = _hundredths(points)
+        rows = np.column_stack([classes, symbol_ids, points[:, 0], self.height - points[:, 1]])
+        self._write('<use class="c%d" xlink:href="#r%d" x="%d" y="%d"/>\n'
+                    * rows.shape[0] % tuple(rows.ravel().tolist()))
+
+    def lines(self, segments, colors):
+        segments = _hundredths(segments)
+        segments[:, 1::2] = self.height - segments[:, 1::2]
+        for rgb, idx in _color_groups(colors):
+            data = segments[idx].ravel().tolist()
+            self._write('<path stroke="#{:02x}{:02x}{:02x}" d="'.format(*rgb) +
+                        'M%d %dL%d %d' * idx.size % tuple(data) + '"/>\n')
+
+    def finish(self):
+        self._write('</svg>\n')
+
+
+class _PdfWriter:
+    """Sites are placements of one form XObject per radius and color, hoppings are paths
+
+    The page content is compressed as it's written, so only the object offsets are kept.
+    """
+
+    def __init__(self, file, width, height, symbols):
+        self.file, self.symbols = file, symbols
+        self.forms = {}  # (symbol ID, RGB) key -> form XObject ID: a filled circle
+        self.offsets = {}
+        self.position = 0
+        self.alphas = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self._object(3, "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {:.2f} {:.2f}] "
+                        "/Resources 4 0 R /Contents 5 0 R >>".format(width, height).encode())
+        self.offsets[5] = self.position
+        self._write(b"5 0 obj\n<< /Length 6 0 R /Filter /FlateDecode >>\nstream\n")
+        self.stream_start = self.position
+        self.compressor = zlib.compressobj()
+        self._content("0.01 0 0 0.01 0 0 cm\n")
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        self._write("{} 0 obj\n".format(number).encode() + body + b"\nendobj\n")
+
+    def _content(self, text):
+        self._write(self.compressor.compress(text.encode("ascii")))
+
+    def begin_group(self, alpha, linewidth, edgecolor=None):
+        alpha = 1.0 if alpha is None else alpha
+        if alpha not in self.alphas:
+            self.alphas.append(alpha)
+        text = "q /A{} gs {} w ".format(self.alphas.index(alpha), _hundredths(linewidth))
+        if edgecolor is not None:
+            text += "{:.3f} {:.3f} {:.3f} RG".format(*edgecolor[:3])
+        self._content(text + "\n")
+
+    def end_group(self):
+        self._content("Q\n")
+
+    def sites(self, points, symbol_ids, colors):
+        forms = _style_ids(self.forms, symbol_ids * 2**24 + _rgb_keys(colors), lambda *_: None)
+        rows = np.column_stack([_hundredths(points), forms])
+        self._content("q 1 0 0 1 %d %d cm /F%d Do Q\n" * rows.shape[0]
+                      % tuple(rows.ravel().tolist()))
+
+    def lines(self, segments, colors):
+        segments = _hundredths(segments)
+        for rgb, idx in _color_groups(colors):
+            data = segments[idx].ravel().tolist()
+            self._content("{:.3f} {:.3f} {:.3f} RG\n".format(*(rgb / 255)) +
+                          "%d %d m %d %d l\n" * idx.size % tuple(data) + "S\n")
+
+    def finish(self):
+        self._write(self.compressor.flush())
+        length = self.position - self.stream_start
+        self._write(b"\nendstream\nendobj\n")
+        self._object(6, str(length).encode())
+
+        kappa = 0.5523  # control point distance of a Bezier circle
+        forms = []
+        for key, i in self.forms.items():
+            r = 100 * self.symbols[key // 2**24]
+            rgb = [(key >> shift & 255) / 255 for shift in (16, 8, 0)]
+            path = ("{:.3f} {:.3f} {:.3f} rg "
+                    "{r:.0f} 0 m {r:.0f} {k:.0f} {k:.0f} {r:.0f} 0 {r:.0f} c "
+                    "{m:.0f} {r:.0f} -{r:.0f} {k:.0f} -{r:.0f} 0 c "
+                    "-{r:.0f} -{k:.0f} -{k:.0f} -{r:.0f} 0 -{r:.0f} c "
+                    "{k:.0f} -{r:.0f} {r:.0f} -{k:.0f} {r:.0f} 0 c h B"
+                    ).format(*rgb, r=r, k=kappa * r, m=-kappa * r).encode()
+            number = 7 + i
+            self._object(number, "<< /Type /XObject /Subtype /Form /BBox [{a:.0f} {a:.0f} {b:.0f} {b:.0f}] "
+                                  "/Length {n} >>\nstream\n".format(
+                                      a=-2 * r - 100, b=2 * r + 100, n=len(path)).encode()
+                         + path + b"\nendstream")
+            forms.append("/F{} {} 0 R".format(i, number))
+
+        states = " ".join("/A{} << /CA {a:.3g} /ca {a:.3g} >>".format(i, a=a)
+                          for i, a in enumerate(self.alphas))
+        self._object(4, "<< /XObject << {} >> /ExtGState << {} >> >>".format(
+            " ".join(forms), states).encode())
+
+        xref = self.position
+        count = max(self.offsets) + 1
+        entries = "".join("{:010d} 00000 n \n".format(self.offsets[n]) for n in range(1, count))
+        self._write("xref\n0 {}\n0000000000 65535 f \n{}trailer\n<< /Size {} /Root 1 0 R >>\n"
+                    "startxref\n{}\n%%EOF\n".format(count, entries, count, xref).encode())
@@ -0,0 +1,232 @@
+"""Smooth interactive pan and zoom for structure plots with many elements"""
+import matplotlib.pyplot as plt
+import numpy as np
+
+__all__ = ["InteractiveView"]
+
+
+def _tbplot_collections(ax, layer):
+    """Visible collections of a `layer` created by :func:`.plot_sites`/:func:`.plot_hoppings`
+
+    The 'static' layer holds the hoppings and the faded periodic images, the 'sites'
+    layer holds the sites which are colored by data that may change.
+    """
+    return [c for c in ax.collections
+            if getattr(c, "_tbplot_layer", None) == layer and c.get_visible()]
+
+
+def _render_offscreen(ax, artists, extent=None):
+    """Render `artists` into a transparent bitmap of the axes area
+
+    By default, the current view is rendered. The bitmap may cover a different `extent`
+    in data coordinates, (x0, x1, y0, y1), at the same pixel size. The view limits are
+    changed only for the duration of the render and no limit callbacks are triggered.
+
+    Returns
+    -------
+    Tuple[np.ndarray, list]
+        RGBA image and its extent in data coordinates.
+    """
+    from matplotlib.backends.backend_agg import RendererAgg
+
+    fig = ax.get_figure()
+    width, height = int(np.ceil(fig.bbox.width)), int(np.ceil(fig.bbox.height))
+    renderer = RendererAgg(width, height, fig.dpi)
+    view = ax.viewLim.get_points().copy()
+    if extent is not None:
+        x0, x1, y0, y1 = extent
+        ax.viewLim.set_points(np.array([[x0, y0], [x1, y1]], dtype=float))
+    try:
+        for artist in sorted(artists, key=lambda a: a.get_zorder()):
+            artist.draw(renderer)
+        extent = list(ax.get_xlim()) + list(ax.get_ylim())
+    finally:
+        ax.viewLim.set_points(view)
+
+    buffer = np.frombuffer(renderer.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4)
+    x0, y0, x1, y1 = (int(round(v)) for v in ax.bbox.extents)
+    image = buffer[max(height - y1, 0):height - y0, max(x0, 0):x1].copy()
+    return image, extent
+
+
+def _structure_extent(ax, margin=0.05):
+    """Data limits of the axes combined with the current view, with a relative `margin`"""
+    (x0, y0), (x1, y1) = ax.dataLim.get_points()
+    (vx0, vy0), (vx1, vy1) = np.sort(ax.viewLim.get_points(), axis=0)
+    x0, x1, y0, y1 = min(x0, vx0), max(x1, vx1), min(y0, vy0), max(y1, vy1)
+    dx, dy = margin * (x1 - x0), margin * (y1 - y0)
+    return x0 - dx, x1 + dx, y0 - dy, y1 + dy
+
+
+class InteractiveView:
+    """Smooth pan and zoom for structure plots with a very large number of elements
+
+    The 'static' layer, i.e. the hoppings and the periodic images, is rendered once into
+    a bitmap which covers the whole structure. It's kept between gestures and rendered
+    again only if the figure is resized or the static collections or data limits change
+    (or after :meth:`invalidate`). When a pan or zoom gesture starts, the static
+    collections are hidden and the bitmap takes their place, scaled to follow the view.
+    The bitmap and the 'sites' layer are animated: the rest of the axes is saved once
+    per full draw and each gesture step only restores it and blits the animated layers.
+    The `dynamic_scale` callbacks of :func:`.plot_sites` and :func:`.plot_hoppings` are
+    suspended and the structure is redrawn at full quality once the gesture settles.
+
+    Parameters
+    ----------
+    ax : Optional[plt.Axes]
+        The structure plot. Defaults to the active axes.
+    settle_delay : float
+        Seconds of inactivity after which the gesture is considered finished.
+    scroll_zoom : float
+        Zoom factor per mouse wheel step. Scroll zooming is disabled if it's 1.
+    """
+
+    def __init__(self, ax=None, settle_delay=0.25, scroll_zoom=1.2):
+        self.ax = ax if ax is not None else plt.gca()
+        self.scroll_zoom = scroll_zoom
+        self._preview = None
+        self._static = None  # (key, AxesImage) of the cached static layer bitmap
+        self._hidden = []
+        self._animated = []
+        self._background = None
+
+        canvas = self.ax.get_figure().canvas
+        self._can_blit = hasattr(canvas, "copy_from_bbox") and hasattr(canvas, "restore_region")
+        self._timer = canvas.new_timer(interval=int(settle_delay * 1000))
+        self._timer.single_shot = True
+        self._timer.add_callback(self.settle)
+        self._cids = [canvas.mpl_connect("button_press_event", self._on_press),
+                      canvas.mpl_connect("button_release_event", self._on_release),
+                      canvas.mpl_connect("motion_notify_event", self._on_motion),
+                      canvas.mpl_connect("scroll_event", self._on_scroll),
+                      canvas.mpl_connect("draw_event", self._on_draw)]
+
+    @property
+    def in_gesture(self) -> bool:
+        """Is the preview bitmap currently shown instead of the static collections"""
+        return self._preview is not None
+
+    def invalidate(self):
+        """Render the static layer again at the next gesture, e.g. after changing its colors"""
+        self._static = None
+
+    def _static_preview(self, static):
+        """The cached bitmap of the `static` collections, rendered again only if needed"""
+        fig = self.ax.get_figure()
+        key = (tuple(fig.bbox.size), fig.dpi, tuple(self.ax.get_position().bounds),
+               tuple(id(c) for c in static), tuple(self.ax.dataLim.get_points().ravel()))
+        if self._static is None or self._static[0] != key:
+            from matplotlib.image import AxesImage
+            image, extent = _render_offscreen(self.ax, static, _structure_extent(self.ax))
+            preview = AxesImage(self.ax, extent=extent, origin="upper",
+                                interpolation="bilinear", zorder=-10)
+            preview.set_data(image)
+            self.ax._set_artist_props(preview)
+            self._static = key, preview
+        return self._static[1]
+
+    def start_gesture(self):
+        """Replace the static collections with a bitmap preview until :meth:`settle`"""
+        self._timer.stop()
+        if self.in_gesture:
+            return
+
+        static = _tbplot_collections(self.ax, "static")
+        sites = _tbplot_collections(self.ax, "sites")
+        if not static and not sites:
+            return
+
+        self._preview = self._static_preview(static)
+        self._hidden = static
+        self.ax._tbplot_frozen = True
+        for col in self._hidden:
+            col.set_visible(False)
+
+        if self._can_blit:
+            # the preview is drawn only by blitting, it's not added to the axes
+            self._animated = [self._preview] + sites
+            for artist in self._animated:
+                artist.set_animated(True)
+            self.ax.get_figure().canvas.draw()  # saves the background, see `_on_draw`
+        else:
+            self.ax.add_image(self._preview)
+
+    def settle(self):
+        """Finish the gesture: restore the collections and redraw at full quality"""
+        self._timer.stop()
+        if not self.in_gesture:
+            return
+
+        if self._preview in self.ax.images:
+            self._preview.remove()
+        self._preview = None
+        self._background = None
+        for artist in self._animated:
+            artist.set_animated(False)
+        self._animated = []
+        self.ax._tbplot_frozen = False
+        for col in self._hidden:
+            col.set_visible(True)
+        self._hidden = []
+        for col in _tbplot_collections(self.ax, "static") + _tbplot_collections(self.ax, "sites"):
+            col._tbplot_dynamic_scale(self.ax)
+        self.ax.get_figure().canvas.draw_idle()
+
+    def disconnect(self):
+        """Remove the event handlers and restore the full quality view"""
+        self.settle()
+        canvas = self.ax.get_figure().canvas
+        for cid in self._cids:
+            canvas.mpl_disconnect(cid)
+        self._cids = []
+
+    def _draw_animated(self):
+        for artist in sorted(self._animated, key=lambda a: a.get_zorder()):
+            self.ax.draw_artist(artist)
+
+    def _blit(self):
+        """Draw a gesture step: restore the saved background and blit the animated layers"""
+        canvas = self.ax.get_figure().canvas
+        if self._background is None:
+            canvas.draw_idle()
+            return
+
+        canvas.restore_region(self._background)
+        self._draw_animated()
+        canvas.blit(self.ax.bbox)
+
+    def _is_navigating(self):
+        toolbar = self.ax.get_figure().canvas.toolbar
+        return toolbar is not None and bool(str(getattr(toolbar, "mode", "")))
+
+    def _on_draw(self, _):
+        """Save the background of a full draw (without the animated layers) and add them"""
+        if self.in_gesture and self._animated:
+            self._background = self.ax.get_figure().canvas.copy_from_bbox(self.ax.bbox)
+            self._draw_animated()
+
+    def _on_press(self, event):
+        if event.inaxes is self.ax and self._is_navigating():
+            self.start_gesture()
+
+    def _on_motion(self, _):
+        if self.in_gesture and self._is_navigating():
+            self._blit()
+
+    def _on_release(self, _):
+        if self.in_gesture:
+            self._timer.start()
+
+    def _on_scroll(self, event):
+        if event.inaxes is not self.ax or self.scroll_zoom == 1:
+            return
+
+        self.start_gesture()
+        factor = self.scroll_zoom if event.button == "down" else 1 / self.scroll_zoom
+        for get_lim, set_lim, center in [(self.ax.get_xlim, self.ax.set_xlim, event.xdata),
+                                         (self.ax.get_ylim, self.ax.set_ylim, event.ydata)]:
+            lo, hi = get_lim()
+            set_lim(center - (center - lo) * factor, center + (hi - center) * factor)
+
+        self._blit()
+        self._timer.start()
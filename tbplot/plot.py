@@ -2,10 +2,11 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from tbplot.structure import (plot_sites, plot_hoppings, plot_periodic_boundaries,
-                              structure_plot_properties)
+                              structure_plot_properties, _periodic_layout, _plot_periodic_layout)
 from . import pltutils
+from .budget import _fit_system, _fit_lead, _fit_system_with_leads, _degrade_props
 
-__all__ = ["plot_system", "plot_lead", "plot_system_with_leads"]
+__all__ = ["plot_system", "plot_system_views", "plot_lead", "plot_system_with_leads"]
 
 
 def _center(pos, shift):
@@ -15,17 +16,18 @@ def _center(pos, shift):
     return (x.max() + x.min()) / 2, (y.max() + y.min()) / 2
 
 
-def _decorate_structure_plot(axes="xy", add_margin=True, **_):
-    plt.gca().set_aspect("equal")
-    plt.xlabel("{}".format(axes[0]))
-    plt.ylabel("{}".format(axes[1]))
+def _decorate_structure_plot(axes="xy", add_margin=True, ax=None, **_):
+    ax = pltutils._gca(ax)
+    ax.set_aspect("equal")
+    ax.set_xlabel("{}".format(axes[0]))
+    ax.set_ylabel("{}".format(axes[1]))
     if add_margin:
-        pltutils.set_min_axis_length(0.5)
-        pltutils.set_min_axis_ratio(0.4)
-        pltutils.despine(trim=True)
-        pltutils.add_margin()
+        pltutils.set_min_axis_length(0.5, ax=ax)
+        pltutils.set_min_axis_ratio(0.4, ax=ax)
+        pltutils.despine(trim=True, ax=ax)
+        pltutils.add_margin(ax=ax)
     else:
-        pltutils.despine()
+        pltutils.despine(ax=ax)
 
 
 def plot_system(smap, num_periods=1, **kwargs):
@@ -38,8 +40,19 @@ def plot_system(smap, num_periods=1, **kwargs):
         Number of times to repeat the periodic boundaries.
     **kwargs
         Additional plot arguments as specified in :func:`.structure_plot_properties`.
+        Pass `ax` to draw on a specific axes without using the global pyplot state.
+
+    The estimated cost is checked against the `tbplot.budget.*` settings of :data:`.rc`,
+    see :mod:`tbplot.budget`. Over budget, the collections may be rasterized or fewer
+    periodic images may be drawn.
     """
-    props = structure_plot_properties(**kwargs)
+    num_periods, hoppings, rasterized = _fit_system("plot_system", smap, num_periods)
+    _plot_system(smap, num_periods, hoppings, rasterized, **kwargs)
+
+
+def _plot_system(smap, num_periods, hoppings, rasterized, **kwargs):
+    """:func:`plot_system` with the options which were fitted to the budget"""
+    props = _degrade_props(structure_plot_properties(**kwargs), hoppings, rasterized)
 
     plot_hoppings(smap.positions, smap.hoppings, **props['hopping'])
     plot_sites(smap.positions, smap.sublattices, **props['site'])
@@ -49,6 +62,54 @@ def plot_system(smap, num_periods=1, **kwargs):
     _decorate_structure_plot(**props)
 
 
+def plot_system_views(smap, views=("xy", "xz", "yz"), axs=None, num_periods=1, **kwargs):
+    """Plot several projections of the structure, e.g. side by side top and side views
+
+    The parts which don't depend on the view are prepared only once: the hopping
+    triplets, the site colormap and the periodic shifts and boundary combinations.
+    :func:`.plot_sites` caches the depth order of the sites per depth axis, so the same
+    order serves all the periodic images and the views which share a depth axis. It's
+    applied to per-site arguments like `site=dict(radius=array)` as well, so each view
+    matches a separate :func:`.plot_system` call.
+
+    Parameters
+    ----------
+    smap : StructureMap
+    views : Sequence[str]
+        The spatial axes of each view, e.g. 'xy', 'xz', 'yz'.
+    axs : Optional[Sequence[plt.Axes]]
+        One axes for each view. A new row of subplots is created by default.
+    num_periods : int
+        Number of times to repeat the periodic boundaries.
+    **kwargs
+        Additional plot arguments as specified in :func:`.structure_plot_properties`,
+        except `axes` which is given by `views`.
+
+    Returns
+    -------
+    List[plt.Axes]
+
+    The estimated cost of all the views is checked against the `tbplot.budget.*`
+    settings, same as :func:`plot_system`.
+    """
+    num_periods, hoppings, rasterized = _fit_system("plot_system_views", smap, num_periods,
+                                                    num_views=len(views))
+    if axs is None:
+        _, axs = plt.subplots(1, len(views), squeeze=False)
+        axs = axs[0]
+
+    layout = _periodic_layout(smap.boundaries, num_periods)
+    for ax, view in zip(axs, views):
+        props = structure_plot_properties(axes=view, ax=ax, **kwargs)
+        props = _degrade_props(props, hoppings, rasterized)
+        plot_hoppings(smap.positions, smap.hoppings, **props['hopping'])
+        plot_sites(smap.positions, smap.sublattices, **props['site'])
+        _plot_periodic_layout(smap.positions, smap.hoppings, smap.sublattices, layout, props)
+        _decorate_structure_plot(**props)
+
+    return list(axs)
+
+
 def plot_lead(lead_smap, index, lead_length=6, **kwargs):
     """Plot the sites, hoppings and periodic boundaries of the lead
 
@@ -58,17 +119,24 @@ def plot_lead(lead_smap, index, lead_length=6, **kwargs):
     index : int
         This number will appear on the lead label.
     lead_length : int
-        Number of times to repeat the lead's periodic boundaries.
+        Number of times to repeat the lead's periodic boundaries. May be reduced (or the
+        collections rasterized) to fit the `tbplot.budget.*` settings, see :mod:`tbplot.budget`.
     **kwargs
         Additional plot arguments as specified in :func:`.structure_plot_properties`.
     """
+    lead_length, hoppings, rasterized = _fit_lead(lead_smap, lead_length)
+    _plot_lead(lead_smap, index, lead_length, hoppings, rasterized, **kwargs)
+
+
+def _plot_lead(lead_smap, index, lead_length, hoppings, rasterized, **kwargs):
+    """:func:`plot_lead` with the options which were fitted to the budget"""
     pos = lead_smap.positions
     sub = lead_smap.sublattices
-    inner_hoppings = lead_smap.hoppings.tocoo()
+    inner_hoppings = lead_smap.hoppings
     boundary = lead_smap.boundaries[0]
-    outer_hoppings = boundary.hoppings.tocoo()
+    outer_hoppings = boundary.hoppings
 
-    props = structure_plot_properties(**kwargs)
+    props = _degrade_props(structure_plot_properties(**kwargs), hoppings, rasterized)
 
     blend_gradient = np.linspace(0.5, 0.1, lead_length)
     for i, blend in enumerate(blend_gradient):
@@ -79,7 +147,8 @@ def plot_lead(lead_smap, index, lead_length=6, **kwargs):
                       boundary=(1, boundary.shift), **props['boundary'])
 
     label_pos = _center(pos, lead_length * boundary.shift * 1.5)
-    pltutils.annotate_box("lead {}".format(index), label_pos, bbox=dict(alpha=0.7))
+    pltutils.annotate_box("lead {}".format(index), label_pos, bbox=dict(alpha=0.7),
+                          ax=props["ax"])
 
     _decorate_structure_plot(**props)
 
@@ -99,9 +168,17 @@ def plot_system_with_leads(smap, leads, num_periods=1, lead_length=6, axes='xy',
         The spatial axes to plot. E.g. 'xy', 'yz', etc.
     **kwargs
         Additional plot arguments as specified in :func:`.structure_plot_properties`.
+
+    The estimated cost of the whole figure, see :func:`.estimate_system` with `leads`, is
+    checked against the `tbplot.budget.*` settings at once. When degrading, fewer lead
+    repetitions are drawn before fewer periodic images.
     """
+    num_periods, lead_length, hoppings, rasterized = _fit_system_with_leads(
+        smap, leads, num_periods, lead_length
+    )
+
     kwargs['add_margin'] = False
-    plot_system(smap, num_periods, axes=axes, **kwargs)
+    _plot_system(smap, num_periods, hoppings, rasterized, axes=axes, **kwargs)
     for n, lead_smap in enumerate(leads):
-        plot_lead(lead_smap, n, lead_length, axes=axes, **kwargs)
-    _decorate_structure_plot(axes=axes)
+        _plot_lead(lead_smap, n, lead_length, hoppings, rasterized, axes=axes, **kwargs)
+    _decorate_structure_plot(axes=axes, ax=kwargs.get("ax"))
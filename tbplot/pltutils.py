@@ -5,6 +5,7 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 
+from .detail import parallel
 from .detail.utils import with_defaults
 
 __all__ = ["axes", "backend", "despine", "respine", "set_min_axis_length", "set_min_axis_ratio",
@@ -12,6 +13,15 @@ __all__ = ["axes", "backend", "despine", "respine", "set_min_axis_length", "set_
            "get_palette", "set_palette", "direct_cmap_norm", "align"]
 
 
+def _gca(ax=None):
+    """Return `ax` or, only if it's `None`, the active pyplot axes
+
+    All the functions which accept an `ax` argument draw on it without touching the
+    global pyplot state, e.g. on a :class:`~matplotlib.figure.Figure` with an Agg canvas.
+    """
+    return ax if ax is not None else plt.gca()
+
+
 @contextmanager
 def axes(ax):
     """A context manager that sets the active Axes instance to `ax`
@@ -54,15 +64,17 @@ def backend(new_backend):
         plt.switch_backend(old_backend)
 
 
-def despine(trim=False):
+def despine(trim=False, ax=None):
     """Remove the top and right spines
 
     Parameters
     ----------
     trim : bool
         Trim spines so that they don't extend beyond the last major ticks.
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     """
-    ax = plt.gca()
+    ax = _gca(ax)
     if ax.name == "3d":
         return
 
@@ -80,9 +92,9 @@ def despine(trim=False):
             getattr(ax, "set_{}ticks".format(v))(ticks)
 
 
-def respine():
+def respine(ax=None):
     """Redraw all spines, opposite of :func:`despine`"""
-    ax = plt.gca()
+    ax = _gca(ax)
     for side in ["top", "right", "bottom", "left"]:
         ax.spines[side].set_visible(True)
         ax.spines[side].set_smart_bounds(False)
@@ -90,7 +102,7 @@ def respine():
     ax.yaxis.set_ticks_position("both")
 
 
-def set_min_axis_length(length, axis="xy"):
+def set_min_axis_length(length, axis="xy", ax=None):
     """Set minimum axis length
 
     Parameters
@@ -99,8 +111,10 @@ def set_min_axis_length(length, axis="xy"):
         Minimum range in data coordinates
     axis : {"x", "y", "xy"}
         Apply to a single axis ("x", "y") or both ("xy").
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     """
-    ax = plt.gca()
+    ax = _gca(ax)
     for a in axis:
         _min, _max = getattr(ax, "get_{}lim".format(a))()
         if abs(_max - _min) < length:
@@ -110,29 +124,32 @@ def set_min_axis_length(length, axis="xy"):
             getattr(ax, "set_{}lim".format(a))(_min, _max, auto=None)
 
 
-def set_min_axis_ratio(ratio):
+def set_min_axis_ratio(ratio, ax=None):
     """Set minimum ratio between axes limits
 
     Parameters
     ----------
     ratio : float
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     """
-    xmin, xmax = plt.xlim()
-    ymin, ymax = plt.ylim()
+    ax = _gca(ax)
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
     x = (xmax - xmin) / 2
     y = (ymax - ymin) / 2
 
     if y != 0 and x / y < ratio:
         center = (xmax + xmin) / 2
         lim = ratio * y
-        plt.xlim(center - lim, center + lim)
+        ax.set_xlim(center - lim, center + lim)
     elif y / x < ratio:
         center = (ymax + ymin) / 2
         lim = ratio * x
-        plt.ylim(center - lim, center + lim)
+        ax.set_ylim(center - lim, center + lim)
 
 
-def add_margin(margin=0.08, axis="xy"):
+def add_margin(margin=0.08, axis="xy", ax=None):
     """Adjust the axis length to include a margin (after autoscale)
 
     Parameters
@@ -141,11 +158,13 @@ def add_margin(margin=0.08, axis="xy"):
         Fraction of the original length.
     axis : {"x", "y", "xy"}
         Apply to a single axis ("x", "y") or both ("xy").
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     """
-    ax = plt.gca()
+    ax = _gca(ax)
     for a in axis:
         _min, _max = getattr(ax, "get_{}lim".format(a))()
-        set_min_axis_length(abs(_max - _min) * (1 + margin), axis=a)
+        set_min_axis_length(abs(_max - _min) * (1 + margin), axis=a, ax=ax)
 
 
 def blend_colors(color, bg, factor):
@@ -178,9 +197,17 @@ def colorbar(mappable=None, cax=None, ax=None, label="", powerlimits=(0, 0), **k
     powerlimits : Tuple[int, int]
         Sets size thresholds for scientific notation.
     mappable, cax, ax, **kwargs
-        Forwarded to :func:`matplotlib.pyplot.colorbar`.
+        Forwarded to :func:`matplotlib.pyplot.colorbar`. If `ax` or `cax` is given, the
+        colorbar is added to their figure directly and the `mappable` is required.
     """
-    cbar = plt.colorbar(mappable, cax, ax, **with_defaults(kwargs, pad=0.02, aspect=28))
+    kwargs = with_defaults(kwargs, pad=0.02, aspect=28)
+    if ax is None and cax is None:
+        cbar = plt.colorbar(mappable, cax, ax, **kwargs)
+    else:
+        if mappable is None:
+            raise RuntimeError("A `mappable` is required when the colorbar `ax` is given")
+        figure = (ax if ax is not None else cax).get_figure()
+        cbar = figure.colorbar(mappable, cax, ax, **kwargs)
 
     cbar.solids.set_edgecolor("face")  # remove white gaps between segments
     cbar.solids.set_rasterized(True)  # and reduce pdf and svg output size
@@ -199,7 +226,7 @@ def colorbar(mappable=None, cax=None, ax=None, label="", powerlimits=(0, 0), **k
     return cbar
 
 
-def annotate_box(s, xy, fontcolor="black", **kwargs):
+def annotate_box(s, xy, fontcolor="black", ax=None, **kwargs):
     """Annotate with a box around the text
 
     Parameters
@@ -210,6 +237,8 @@ def annotate_box(s, xy, fontcolor="black", **kwargs):
         Text position.
     fontcolor : color
         Setting "white" will make the background black.
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     **kwargs
         Forwarded to `plt.annotate()`.
     """
@@ -224,8 +253,9 @@ def annotate_box(s, xy, fontcolor="black", **kwargs):
             kwargs["arrowprops"], dict(arrowstyle="->", color=fontcolor)
         )
 
-    plt.annotate(s, xy, **with_defaults(kwargs, color=fontcolor, horizontalalignment="center",
-                                        verticalalignment="center"))
+    _gca(ax).annotate(s, xy, **with_defaults(kwargs, color=fontcolor,
+                                             horizontalalignment="center",
+                                             verticalalignment="center"))
 
 
 def cm2inch(*values):
@@ -247,7 +277,7 @@ def cm2inch(*values):
     return tuple(v / 2.54 for v in values)
 
 
-def legend(*args, reverse=False, facecolor="0.98", lw=0, **kwargs):
+def legend(*args, reverse=False, facecolor="0.98", lw=0, ax=None, **kwargs):
     """Custom legend with modified style and option to reverse label order
 
     Parameters
@@ -258,17 +288,20 @@ def legend(*args, reverse=False, facecolor="0.98", lw=0, **kwargs):
         Legend background color.
     lw : float
         Frame width.
+    ax : Optional[plt.Axes]
+        Defaults to the active axes.
     *args, **kwargs
         Forwarded to :func:`matplotlib.pyplot.legend`.
     """
-    h, l = plt.gca().get_legend_handles_labels()
+    ax = _gca(ax)
+    h, l = ax.get_legend_handles_labels()
     if not h:
         return None
 
     if not reverse:
-        ret = plt.legend(*args, **kwargs)
+        ret = ax.legend(*args, **kwargs)
     else:
-        ret = plt.legend(h[::-1], l[::-1], *args, **kwargs)
+        ret = ax.legend(h[::-1], l[::-1], *args, **kwargs)
 
     frame = ret.get_frame()
     frame.set_facecolor(facecolor)
@@ -311,7 +344,7 @@ def get_palette(name=None, num_colors=8, start=0):
     return [list(color) for color in palette]
 
 
-def set_palette(name=None, num_colors=8, start=0):
+def set_palette(name=None, num_colors=8, start=0, ax=None):
     """Set the active color palette
 
     Parameters
@@ -322,11 +355,13 @@ def set_palette(name=None, num_colors=8, start=0):
         Number of colors to retrieve.
     start : int
         Staring from this color number.
+    ax : Optional[plt.Axes]
+        Also restart the color cycle of this axes, the active axes by default.
     """
     palette = get_palette(name, num_colors, start)
     mpl.rcParams["axes.prop_cycle"] = plt.cycler("color", palette)
     mpl.rcParams["patch.facecolor"] = palette[0]
-    plt.gca().set_prop_cycle(mpl.rcParams["axes.prop_cycle"])
+    _gca(ax).set_prop_cycle(mpl.rcParams["axes.prop_cycle"])
 
 
 def direct_cmap_norm(data, colors, blend=1):
@@ -353,7 +388,7 @@ def direct_cmap_norm(data, colors, blend=1):
     # colormap with an boundary norm to match the unique data points
     from matplotlib.colors import ListedColormap, BoundaryNorm
     cmap = ListedColormap(colors)
-    boundaries = np.append(np.unique(data), np.inf)
+    boundaries = np.append(parallel.unique(data), np.inf)
     norm = BoundaryNorm(boundaries, len(boundaries) - 1)
 
     return cmap, norm
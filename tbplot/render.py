@@ -0,0 +1,648 @@
+"""Render maps and structures to image bytes or files without an interactive session"""
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import matplotlib.style as mpl_style
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+
+from .budget import _output_format
+from .detail.utils import with_defaults, stable_json
+from .plot import plot_system, plot_lead
+from .results import load_map
+from .shared import SharedMap
+from .structure import _as_triplets
+from .style import rc, tbplot_style, _split_style
+
+__all__ = ["render", "render_file", "render_async", "RenderContext", "RenderStats",
+           "RenderCache", "AsyncRenderer"]
+
+_map_plots = ("plot", "plot_pcolor", "plot_contourf", "plot_contour")
+
+
+@contextmanager
+def _style_context(style):
+    """Apply a style (including `tbplot.*` keys) only within this context"""
+    mpl_part, tbplot_part = _split_style(style)
+    saved_rc = dict(rc)
+    rc.update(tbplot_part)
+    try:
+        with mpl_style.context(mpl_part):
+            yield
+    finally:
+        rc.clear()
+        rc.update(saved_rc)
+
+
+def _plot(smap, plot, kwargs):
+    """Draw `smap` on `kwargs['ax']` (the current axes by default) with the `plot` kind"""
+    if plot == "system":
+        # the site options of the spec are given as site properties for `plot_system`
+        site = dict(kwargs.pop("site", None) or {})
+        if "site_radius" in kwargs:
+            site["radius"] = kwargs.pop("site_radius")
+        if "cmap" in kwargs:
+            site["cmap"] = kwargs.pop("cmap")
+        plot_system(smap, site=site, **kwargs)
+    elif plot == "lead":
+        plot_lead(smap, **with_defaults(kwargs, index=0))
+    elif plot in _map_plots:
+        getattr(smap, plot)(**kwargs)
+    else:
+        raise RuntimeError("Unknown plot: '{}'".format(plot))
+
+
+def _split_spec(smap, spec):
+    """Return the plot kind, figure options, style and plot arguments of a `spec`"""
+    from .results import StructureMap
+
+    spec = dict(spec or {})
+    plot = spec.pop("plot", "plot" if isinstance(smap, StructureMap) else "plot_pcolor")
+    figure_options = dict(figsize=spec.pop("figsize", None), dpi=spec.pop("dpi", None))
+    style = with_defaults(spec.pop("style", None), tbplot_style)
+    return plot, figure_options, style, spec
+
+
+def render(smap, spec=None, format="png", cache=None):
+    """Plot a map or structure according to `spec` and return the image file contents
+
+    Parameters
+    ----------
+    smap : Union[SpatialMap, StructureMap, SharedMap]
+        A :class:`.SharedMap` handle is attached in the process which does the plotting,
+        e.g. a worker of :class:`AsyncRenderer`: only the handle and its data are sent.
+    spec : Optional[dict]
+        The plot specification. The 'plot' key selects :func:`.plot_system` ('system'),
+        :func:`.plot_lead` ('lead', the 'index' is 0 by default) or
+        one of the map methods: 'plot' (default for a :class:`.StructureMap`),
+        'plot_pcolor' (default otherwise), 'plot_contourf' or 'plot_contour'. The 'style'
+        dict is applied on top of :data:`.tbplot_style`, 'figsize' and 'dpi' set up the
+        figure. All the other keys, e.g. 'axes', 'num_periods', 'cmap', 'site_radius',
+        are forwarded to the plot function.
+    format : str
+        Any output format supported by :meth:`~matplotlib.figure.Figure.savefig`.
+    cache : Optional[RenderCache]
+        Return the stored result of an identical earlier render without plotting.
+
+    Returns
+    -------
+    bytes
+    """
+    smap = _attached(smap)
+    if cache is not None:
+        return cache.fetch(smap, spec, format, lambda: render(smap, spec, format))
+
+    plot, figure_options, style, kwargs = _split_spec(smap, spec)
+    with _style_context(style):
+        return _draw(smap, plot, figure_options, kwargs, format)
+
+
+def _attached(smap):
+    """The map of a :class:`.SharedMap` handle or `smap` itself"""
+    return smap.attach() if isinstance(smap, SharedMap) else smap
+
+
+def _draw(smap, plot, figure_options, kwargs, format):
+    """Plot on a standalone figure which pyplot doesn't know about and return the file"""
+    figure = Figure(figsize=figure_options["figsize"])
+    FigureCanvasAgg(figure)
+    with _output_format(format):  # for the cost estimates of :mod:`tbplot.budget`
+        _plot(smap, plot, dict(kwargs, ax=figure.add_subplot(111)))
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=format, dpi=figure_options["dpi"])
+    return buffer.getvalue()
+
+
+def _resident_memory():
+    """Resident set size of this process in bytes (`None` if it's not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+RenderStats = namedtuple("RenderStats", "seconds rss rss_change peak_allocated")
+RenderStats.__doc__ = """Time and memory of a single job of a :class:`RenderContext`
+
+The `rss` (resident set size) is measured after the job, `rss_change` is relative
+to the start of the job. The `peak_allocated` Python memory is only traced if enabled.
+"""
+
+
+class RenderContext:
+    """Reusable figures for long-running render services
+
+    Creating a figure and its axes dominates the cost of small plots. The context keeps
+    a pool of idle figures and resets them after each job: the tbplot callbacks on the
+    axes are disconnected, all the artists and extra axes (e.g. colorbars) are removed
+    and the size and position are restored. Nothing from a previous job stays alive.
+
+    Parameters
+    ----------
+    size : int
+        Maximum number of idle figures which are kept.
+    style : Optional[dict]
+        Applied on top of :data:`.tbplot_style` when the figures are created and for
+        each job. The 'style' of a job spec is applied on top of this.
+    trace_memory : bool
+        Record the peak Python allocation of each job with :mod:`tracemalloc` (slower).
+    cache : Optional[RenderCache]
+        Return the stored result of identical earlier jobs, see :func:`render`.
+
+    Examples
+    --------
+    >>> with RenderContext() as context:  # doctest: +SKIP
+    ...     png = context.render(smap, dict(num_periods=2))
+    ...     context.stats[-1].rss
+    """
+
+    def __init__(self, size=2, style=None, trace_memory=False, cache=None):
+        self.size = size
+        self.cache = cache
+        self.style = with_defaults(style, tbplot_style)
+        self.trace_memory = trace_memory
+        self.stats = deque(maxlen=1000)  # :class:`RenderStats` of the most recent jobs
+        self._idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Close all the idle figures"""
+        while self._idle:
+            plt.close(self._idle.pop())
+
+    def _acquire(self):
+        if self._idle:
+            figure = self._idle.pop()
+            plt.figure(figure.number)  # make it current for the plotting functions
+            return figure
+
+        with _style_context(self.style):
+            figure = plt.figure()
+            ax = figure.add_subplot(111)
+        figure._tbplot_defaults = figure.get_size_inches(), figure.dpi, ax.get_position()
+        return figure
+
+    def _release(self, figure):
+        with _style_context(self.style):  # `cla` applies the rc settings
+            _reset_figure(figure)
+        if len(self._idle) < self.size:
+            self._idle.append(figure)
+        else:
+            plt.close(figure)
+
+    @contextmanager
+    def figure(self):
+        """Borrow a clean figure (the current pyplot figure within this context)"""
+        figure = self._acquire()
+        try:
+            yield figure
+        finally:
+            self._release(figure)
+
+    def render(self, smap, spec=None, format="png"):
+        """Same as :func:`render`, but on a pooled figure: the stats are appended to `stats`"""
+        smap = _attached(smap)
+        if self.cache is not None:
+            return self.cache.fetch(smap, spec, format, lambda: self._render(smap, spec, format),
+                                    base_style=self.style)
+        return self._render(smap, spec, format)
+
+    def _render(self, smap, spec, format):
+        plot, figure_options, _, kwargs = _split_spec(smap, spec)
+        style = with_defaults((spec or {}).get("style"), self.style)
+
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        rss_start = _resident_memory()
+        start = time.perf_counter()
+        try:
+            buffer = io.BytesIO()
+            with self.figure() as figure, _style_context(style), _output_format(format):
+                if figure_options["figsize"]:
+                    figure.set_size_inches(figure_options["figsize"])
+                _plot(smap, plot, kwargs)
+                figure.savefig(buffer, format=format, dpi=figure_options["dpi"])
+        finally:
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            rss = _resident_memory()
+            self.stats.append(RenderStats(time.perf_counter() - start, rss,
+                                          rss - rss_start if rss is not None else None, peak))
+        return buffer.getvalue()
+
+
+def _reset_figure(figure):
+    """Make a pooled figure look like new and release everything a job attached to it"""
+    size, dpi, position = figure._tbplot_defaults
+    for ax in figure.axes:
+        for artist in ax.collections + ax.images:
+            for cid in getattr(artist, "_tbplot_cids", ()):
+                ax.callbacks.disconnect(cid)
+            artist._tbplot_cids = []
+    for ax in figure.axes[1:]:
+        figure.delaxes(ax)
+
+    if figure.axes:
+        ax = figure.axes[0]
+        ax.cla()
+        # `cla` keeps the limits and the settings changed by `set_aspect` and `despine`
+        ax.set_aspect("auto", adjustable="box", anchor="C")
+        for spine in ax.spines.values():
+            spine.set_visible(True)
+            spine.set_smart_bounds(False)
+        ax.xaxis.set_ticks_position("default")
+        ax.yaxis.set_ticks_position("default")
+        ax.set_position(position)
+        ax.dataLim.set(Bbox.null())
+        ax.viewLim.set(Bbox.unit())  # the size of the sites depends on the initial view
+        ax.__dict__.pop("_tbplot_frozen", None)
+    else:
+        figure.add_axes(position)
+    figure.texts.clear()
+    figure.artists.clear()
+    figure.legends.clear()
+    figure.images.clear()
+    figure.set_size_inches(size)
+    figure.set_dpi(dpi)
+
+
+def _array_parts(smap):
+    """All the arrays which define a map or structure"""
+    yield from (smap.data, *smap.positions, smap.sublattices)
+    if hasattr(smap, "hoppings"):
+        yield from _as_triplets(smap.hoppings)
+        for boundary in smap.boundaries:
+            yield np.asarray(boundary.shift, dtype=float)
+            yield from _as_triplets(boundary.hoppings)
+
+
+class RenderCache:
+    """Content-addressed on-disk cache of rendered images
+
+    The key is a SHA-1 hash of all the arrays of the map (including hoppings and
+    boundaries), the plot spec, the effective style (including the :data:`.rc` settings),
+    the output format and the tbplot and matplotlib versions. Arrays, colormaps and norms
+    in the spec are keyed by their contents. Other objects which can't be described
+    without their memory address are rejected with a `RuntimeError`: they would never
+    hit the cache. The least recently used entries are deleted when the total size
+    exceeds `max_size`. A hit reads the file without creating a figure. Entries are
+    written atomically, so a cache directory can be shared by processes.
+
+    Parameters
+    ----------
+    directory : str
+        Created if it doesn't exist.
+    max_size : int
+        Maximum total size of the stored images in bytes.
+    """
+
+    suffix = ".tbplot-cache"
+
+    def __init__(self, directory, max_size=512 * 2**20):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, smap, spec, format, base_style=tbplot_style):
+        """Hash of everything which determines the rendered image"""
+        from . import __version__
+
+        digest = hashlib.sha1()
+        for array in _array_parts(smap):
+            array = np.ascontiguousarray(array)
+            digest.update("{}{}".format(array.dtype.str, array.shape).encode())
+            digest.update(array.data if array.size else b"")
+
+        spec = dict(spec or {})
+        style = dict(rc)  # the active `tbplot.*` settings, unless the spec overrides them
+        style.update(with_defaults(spec.pop("style", None), base_style))
+        meta = [type(smap).__name__, spec, style, format, __version__, mpl.__version__]
+        digest.update(json.dumps(meta, sort_keys=True, default=stable_json).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load(self, key):
+        """Return the stored bytes or `None`: a hit counts as a use for the LRU order"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def store(self, key, data):
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def fetch(self, smap, spec, format, render_function, base_style=tbplot_style):
+        """Return the cached image or `render_function()` which is then stored"""
+        key = self.key(smap, spec, format, base_style)
+        data = self.load(key)
+        if data is None:
+            data = render_function()
+            self.store(key, data)
+        return data
+
+    def entries(self):
+        """List of (last use time, size, path) of all the entries, oldest first"""
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                result.append((stat.st_mtime, stat.st_size, path))
+        return sorted(result)
+
+    def _evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for *_, path in self.entries():
+            os.remove(path)
+
+
+def render_file(input, output, spec=None, format=None, cache=None):
+    """Load a map saved by :meth:`.SpatialMap.save` and render it to the `output` file
+
+    Parameters
+    ----------
+    input : str
+        Path of a `.npz` file or a directory of `.npy` files.
+    output : str
+        The image file which is (over)written.
+    spec : Optional[dict]
+        See :func:`render`.
+    format : Optional[str]
+        Output format, taken from the extension of the `output` file by default.
+    cache : Optional[RenderCache]
+        See :func:`render`.
+
+    Returns
+    -------
+    float
+        Elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    format = format or os.path.splitext(output)[1][1:]
+    data = render(load_map(input, mmap=True), spec, format, cache)
+    with open(output, "wb") as f:
+        f.write(data)
+    return time.perf_counter() - start
+
+
+class _SharedStyle:
+    """Apply the style of concurrent jobs: the rc settings are global to the process
+
+    Jobs with the same style share it and plot at the same time. A job with a different
+    style waits until the active one is no longer used by any job.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._key = None
+        self._context = None
+        self._num_users = 0
+
+    @contextmanager
+    def __call__(self, style):
+        key = repr(sorted(style.items()))
+        with self._condition:
+            while self._num_users and self._key != key:
+                self._condition.wait()
+            if not self._num_users:
+                self._key, self._context = key, _style_context(style)
+                self._context.__enter__()
+            self._num_users += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._num_users -= 1
+                if not self._num_users:
+                    self._context.__exit__(None, None, None)
+                    self._condition.notify_all()
+
+
+_shared_style = _SharedStyle()
+
+
+def _render_in_thread(smap, spec, format, cache):
+    """Plot on a standalone figure: only the style is shared with the other threads"""
+    smap = _attached(smap)
+
+    def render_with_shared_style():
+        plot, figure_options, style, kwargs = _split_spec(smap, spec)
+        with _shared_style(style):
+            return _draw(smap, plot, figure_options, kwargs, format)
+
+    if cache is not None:
+        return cache.fetch(smap, spec, format, render_with_shared_style)
+    return render_with_shared_style()
+
+
+def _render_in_process(smap, spec, format, cache):
+    """Each worker process has its own pyplot state: always plot off-screen"""
+    if plt.get_backend().lower() != "agg":
+        plt.switch_backend("agg")
+    return render(smap, spec, format, cache)
+
+
+# Only called from coroutines: `get_event_loop` returns the running loop on Python < 3.7
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+class AsyncRenderer:
+    """Run :func:`render` jobs from :mod:`asyncio` code without blocking the event loop
+
+    The plotting runs in an executor. With `kind="process"` (default), each worker process
+    has its own pyplot state and the jobs run truly in parallel, but the map and spec must
+    be picklable and are copied to the worker: share large structures with
+    :func:`.share_map` and send :meth:`.SharedMap.with_data` handles instead. With `kind="thread"`, nothing is copied and
+    each job plots on its own figure without pyplot, but the rc settings are global: jobs
+    with different styles take turns and the GIL limits the speedup of the pure Python parts.
+
+    At most `max_workers` jobs are submitted to the executor at the same time. Further
+    calls wait their turn (backpressure) and, if `max_pending` calls are already waiting,
+    fail immediately with a `RuntimeError` so that a server can shed the load.
+
+    A cancelled or timed out job which hasn't started yet is removed from the executor.
+    A job which is already plotting can't be interrupted: it runs to completion in the
+    background, its result is discarded and its slot is only freed once it's done.
+
+    Parameters
+    ----------
+    max_workers : Optional[int]
+        Number of parallel jobs, the number of cores by default.
+    kind : str
+        'process' or 'thread'.
+    max_pending : Optional[int]
+        Maximum number of calls waiting for a free worker, unlimited by default.
+    timeout : Optional[float]
+        Default timeout of each call in seconds, including the waiting time.
+    cache : Optional[RenderCache]
+        Shared by all the jobs, see :func:`render`.
+
+    Examples
+    --------
+    >>> async def handler(smap):  # doctest: +SKIP
+    ...     async with AsyncRenderer(max_workers=4) as renderer:
+    ...         return await renderer.render(smap, dict(num_periods=2), timeout=30)
+    """
+
+    def __init__(self, max_workers=None, kind="process", max_pending=None, timeout=None,
+                 cache=None):
+        if kind not in ("process", "thread"):
+            raise RuntimeError("Unknown executor kind: '{}'".format(kind))
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.kind = kind
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.cache = cache
+        self.num_pending = 0
+        self.num_running = 0
+        self._executor = None
+        self._slots = None
+        self._loop = None
+
+    def _start(self):
+        loop = _running_loop()
+        if self._loop is not loop:
+            # asyncio primitives belong to a single loop: recreate them for a new one
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_workers - self.num_running)
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        return loop
+
+    def _finished(self, slots):
+        self.num_running -= 1
+        if slots is self._slots:
+            slots.release()
+
+    async def render(self, smap, spec=None, format="png", timeout=None):
+        """Same as :func:`render`, but awaitable
+
+        Parameters
+        ----------
+        smap, spec, format
+            See :func:`render`.
+        timeout : Optional[float]
+            Seconds, overrides the default `timeout` of the renderer.
+
+        Returns
+        -------
+        bytes
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        loop = self._start()
+        slots = self._slots
+
+        if not slots.locked():
+            await slots.acquire()  # doesn't suspend when a slot is free
+        elif self.max_pending is not None and self.num_pending >= self.max_pending:
+            raise RuntimeError("Too many pending render jobs ({})".format(self.num_pending))
+        else:
+            self.num_pending += 1
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout)
+            finally:
+                self.num_pending -= 1
+
+        job = _render_in_process if self.kind == "process" else _render_in_thread
+        try:
+            executor_future = self._executor.submit(job, smap, spec, format, self.cache)
+        except BaseException:
+            slots.release()
+            raise
+        self.num_running += 1
+        executor_future.add_done_callback(
+            lambda _: None if loop.is_closed() else
+            loop.call_soon_threadsafe(self._finished, slots)
+        )
+
+        remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        # cancelling the wrapper also cancels the executor job if it hasn't started yet
+        return await asyncio.wait_for(asyncio.wrap_future(executor_future), remaining)
+
+    def close(self, wait=True):
+        """Shut down the executor: jobs which are still running are finished if `wait`"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await _running_loop().run_in_executor(None, self.close)
+
+
+_default_renderer = None
+
+
+async def render_async(smap, spec=None, format="png", timeout=None):
+    """Same as :func:`render`, but awaitable: the plotting doesn't block the event loop
+
+    The jobs run on a shared :class:`AsyncRenderer` with the default settings: a process
+    per core. Create a dedicated :class:`AsyncRenderer` to change the concurrency limits.
+
+    Parameters
+    ----------
+    smap, spec, format
+        See :func:`render`.
+    timeout : Optional[float]
+        Seconds, including the time spent waiting for a free worker.
+
+    Returns
+    -------
+    bytes
+    """
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = AsyncRenderer()
+    return await _default_renderer.render(smap, spec, format, timeout)
@@ -3,18 +3,26 @@
 Result objects hold computed data and offer postprocessing and plotting functions
 which are specifically adapted to the nature of the stored data.
 """
+import os
+
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.artist import Artist
+from scipy.sparse import coo_matrix, isspmatrix_csr
 
 from copy import copy
 from collections import namedtuple
 
 from . import pltutils
-from .detail.utils import with_defaults
+from .budget import _fit_system, _fit_map, _degrade_props
+from .detail.binning import grid_statistic, ChunkedReduction
+from .detail.utils import with_defaults, IdentityCache
+from .export import _export
 from .structure import (structure_plot_properties, plot_hoppings, plot_sites,
-                        plot_periodic_boundaries)
+                        plot_periodic_boundaries, _rotate, _connect_dynamic_scale, _as_triplets,
+                        _periodic_layout, _plot_periodic_layout)
 
-__all__ = ['SpatialMap', 'StructureMap']
+__all__ = ['SpatialMap', 'StructureMap', 'Boundary', 'Pick', 'load_map']
 
 Positions = namedtuple('Positions', 'x y z')
 # noinspection PyUnresolvedReferences
@@ -27,6 +35,263 @@ x, y, z : array_like
     1D arrays of Cartesian coordinates
 """
 
+Pick = namedtuple('Pick', 'index position sublattice data hopping')
+# noinspection PyUnresolvedReferences
+Pick.__doc__ = """
+Named tuple describing the site found by :meth:`SpatialMap.pick`
+
+Attributes
+----------
+index : int
+    Site index.
+position : np.ndarray
+    The (x, y, z) coordinates of the site.
+sublattice : int
+    Sublattice ID of the site.
+data : float
+    Data value at the site.
+hopping : Optional[Tuple[int, int, int]]
+    The (from, to, ID) of the hopping nearest to the picked point, see :meth:`StructureMap.pick`.
+"""
+
+# Spatial indices derived from positions and hoppings: computed once per map
+_cache = IdentityCache()
+
+
+class Boundary:
+    """Periodic boundary: hoppings from the sites of the original unit to a unit at `shift`
+
+    Same interface as :class:`.System.boundaries` which makes it possible to restore
+    a :class:`StructureMap` without access to the original system.
+
+    Attributes
+    ----------
+    shift : array_like
+        Position difference between the original unit and the shifted one.
+    hoppings : :class:`~scipy.sparse.spmatrix`
+        Sparse matrix of hopping IDs in any format.
+    """
+
+    def __init__(self, shift, hoppings):
+        self.shift = np.asarray(shift)
+        self.hoppings = hoppings
+
+
+# Version of the on-disk layout written by :meth:`SpatialMap.save`
+_FORMAT_VERSION = 1
+
+
+# The rc params which change the cached hopping raster of :meth:`StructureMap.plot`:
+# the drawing of the lines and the margins of the automatic axes limits
+_static_layer_rc = ("lines.linewidth", "lines.antialiased", "lines.solid_capstyle",
+                    "lines.solid_joinstyle", "path.simplify", "path.simplify_threshold",
+                    "path.snap", "path.sketch", "agg.path.chunksize", "axes.xmargin",
+                    "axes.ymargin", "axes.autolimit_mode")
+
+
+def _write_arrays(file, arrays, compressed):
+    """Write a dict of arrays as a single compressed `.npz` file or a directory of `.npy`
+
+    The `.npz` file is written at exactly the given path: through a file object, numpy
+    doesn't append the `.npz` extension, so :func:`_read_arrays` finds the same path.
+    """
+    if compressed:
+        with open(file, "wb") as f:
+            np.savez_compressed(f, **arrays)
+    else:
+        os.makedirs(file, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(file, name + ".npy"), array)
+
+
+def _read_arrays(file, mmap):
+    """Read a dict of arrays written by :func:`_write_arrays`"""
+    if os.path.isdir(file):
+        mmap_mode = "r" if mmap else None
+        return {name[:-4]: np.load(os.path.join(file, name), mmap_mode=mmap_mode)
+                for name in os.listdir(file) if name.endswith(".npy")}
+    else:
+        with np.load(file) as npz:
+            return dict(npz.items())
+
+
+def _check_format_version(arrays):
+    version = int(arrays.get("format_version", 0))
+    if version != _FORMAT_VERSION:
+        raise RuntimeError("Unsupported file format version: {}".format(version))
+
+
+def load_map(file, mmap=False):
+    """Load a :class:`SpatialMap` or a :class:`StructureMap`, whichever was saved in `file`
+
+    Parameters
+    ----------
+    file : str
+        Path of a `.npz` file or a directory of `.npy` files, see :meth:`SpatialMap.save`.
+    mmap : bool
+        Memory-map the arrays, see :meth:`SpatialMap.load`.
+
+    Returns
+    -------
+    Union[SpatialMap, StructureMap]
+    """
+    arrays = _read_arrays(file, mmap)
+    _check_format_version(arrays)
+    cls = StructureMap if "hoppings_row" in arrays else SpatialMap
+    return cls._from_arrays(arrays)
+
+
+def _coo_to_arrays(matrix, prefix):
+    """Return the COO triplets of a sparse matrix with the smallest suitable index type"""
+    row, col, data = _as_triplets(matrix)
+    index_type = np.int32 if max(matrix.shape) < np.iinfo(np.int32).max else np.int64
+    return {prefix + "_row": row.astype(index_type, copy=False),
+            prefix + "_col": col.astype(index_type, copy=False),
+            prefix + "_data": data}
+
+
+def _coo_from_arrays(arrays, prefix, size):
+    """Inverse of :func:`_coo_to_arrays`: memory-mapped arrays are not copied"""
+    return coo_matrix((arrays[prefix + "_data"],
+                       (arrays[prefix + "_row"], arrays[prefix + "_col"])), shape=(size, size))
+
+
+class _RectangularBins:
+    """Square (cubic) bins along `axes`, aligned to multiples of `bin_size`"""
+
+    def __init__(self, bin_size, axes):
+        if not axes or any(a not in "xyz" for a in axes):
+            raise RuntimeError("Invalid axes: '{}'".format(axes))
+        self.axes = axes
+        self.bin_size = np.broadcast_to(np.asarray(bin_size, dtype=float), (len(axes),))
+
+    def keys(self, positions):
+        return np.column_stack([np.floor(getattr(positions, a) / s)
+                                for a, s in zip(self.axes, self.bin_size)]).astype(np.int64)
+
+    def positions(self, keys):
+        coordinates = {a: np.zeros(keys.shape[0]) for a in "xyz"}
+        for i, (a, s) in enumerate(zip(self.axes, self.bin_size)):
+            coordinates[a] = (keys[:, i] + 0.5) * s
+        return coordinates["x"], coordinates["y"], coordinates["z"]
+
+    def measure(self, _):
+        return np.prod(self.bin_size)
+
+
+class _HexagonalBins:
+    """Hexagonal bins in the xy plane with `size` distance between neighboring centers
+
+    The centers form two rectangular lattices offset by half a period. Each point
+    belongs to the nearest center of either lattice.
+    """
+
+    def __init__(self, size):
+        self.dx, self.dy = size, size * np.sqrt(3)
+
+    def keys(self, positions):
+        x, y = positions.x / self.dx, positions.y / self.dy
+        i1, j1 = np.round(x), np.round(y)
+        i2, j2 = np.floor(x), np.floor(y)
+        # squared distances in units of `dx`: `dy / dx == sqrt(3)`
+        offset = (x - i2 - 0.5)**2 + 3 * (y - j2 - 0.5)**2 < (x - i1)**2 + 3 * (y - j1)**2
+        return np.column_stack([np.where(offset, i2, i1),
+                                np.where(offset, j2, j1), offset]).astype(np.int64)
+
+    def positions(self, keys):
+        offset = 0.5 * keys[:, 2]
+        return (keys[:, 0] + offset) * self.dx, (keys[:, 1] + offset) * self.dy, \
+            np.zeros(keys.shape[0])
+
+    def measure(self, _):
+        return self.dx * self.dy / 2
+
+
+class _RadialBins:
+    """Shells of `bin_width` around `center`, distances measured along `axes`"""
+
+    def __init__(self, center, bin_width, axes):
+        if not axes or any(a not in "xyz" for a in axes) or len(center) != len(axes):
+            raise RuntimeError("The center must have one coordinate for each of the "
+                               "axes '{}'".format(axes))
+        self.center, self.bin_width, self.axes = center, bin_width, axes
+
+    def keys(self, positions):
+        r = np.sqrt(sum((getattr(positions, a) - c)**2 for a, c in zip(self.axes, self.center)))
+        return np.floor(r / self.bin_width).astype(np.int64)[:, np.newaxis]
+
+    def positions(self, keys):
+        r = (keys[:, 0] + 0.5) * self.bin_width
+        return r, np.zeros_like(r), np.zeros_like(r)
+
+    def measure(self, keys):
+        inner, outer = keys[:, 0] * self.bin_width, (keys[:, 0] + 1) * self.bin_width
+        dim = len(self.axes)
+        unit_volume = {1: 2, 2: np.pi, 3: 4 / 3 * np.pi}[dim]
+        return unit_volume * (outer**dim - inner**dim)
+
+
+def _reduce(chunks, bins, statistic, by_sublattice):
+    """Reduce `chunks` of (data, positions, sublattices) arrays to a map with one site per bin"""
+    density = statistic == "density"
+    reduction = ChunkedReduction("count" if density else statistic)
+    for data, positions, sublattices in chunks:
+        keys = bins.keys(Positions(*positions))
+        if by_sublattice:
+            keys = np.column_stack([keys, sublattices])
+        reduction.add(keys, data)
+
+    keys, data = reduction.result()
+    if data.size == 0:
+        return SpatialMap(data, (data, data, data))
+
+    sublattices = None
+    if by_sublattice:
+        keys, sublattices = keys[:, :-1].astype(np.int64), keys[:, -1]
+    if density:
+        data = data / bins.measure(keys)
+    return SpatialMap(data, bins.positions(keys), sublattices)
+
+
+def _binned(chunks, bin_size, statistic="mean", axes="xy", by_sublattice=False):
+    """:meth:`SpatialMap.binned` of `chunks` of (data, positions, sublattices) arrays"""
+    return _reduce(chunks, _RectangularBins(bin_size, axes), statistic, by_sublattice)
+
+
+def _hexbinned(chunks, size, statistic="mean", by_sublattice=False):
+    """:meth:`SpatialMap.hexbinned` of `chunks` of (data, positions, sublattices) arrays"""
+    return _reduce(chunks, _HexagonalBins(size), statistic, by_sublattice)
+
+
+def _radial_average(chunks, center, bin_width, statistic="mean", axes="xy",
+                    by_sublattice=False):
+    """:meth:`SpatialMap.radial_average` of `chunks` of (data, positions, sublattices) arrays"""
+    return _reduce(chunks, _RadialBins(center, bin_width, axes), statistic, by_sublattice)
+
+
+_reductions = dict(binned=_binned, hexbinned=_hexbinned, radial_average=_radial_average)
+
+
+class _Rebin(Artist):
+    """Invisible figure artist which calls `rebin()` before the axes are drawn
+
+    It has the lowest `zorder`, so the plot is updated before `ax` collects the artists
+    it's going to draw. It does nothing once `ax` is removed from the figure.
+    """
+
+    zorder = -np.inf
+
+    def __init__(self, ax, rebin):
+        super().__init__()
+        self.ax = ax
+        self.rebin = rebin
+        if hasattr(self, "set_in_layout"):
+            self.set_in_layout(False)
+
+    def draw(self, renderer, *args, **kwargs):
+        if self.ax in self.ax.get_figure().axes:
+            self.rebin()
+
 
 class SpatialMap:
     """Represents some spatially dependent property: data mapped to site positions
@@ -74,6 +339,88 @@ class SpatialMap:
         return self.__class__(self.data[idx], (v[idx] for v in self.positions),
                               self.sublattices[idx])
 
+    def _to_arrays(self):
+        """Flat dict of arrays for saving, see :meth:`save`"""
+        return dict(format_version=np.array(_FORMAT_VERSION), data=self.data,
+                    x=self.x, y=self.y, z=self.z, sublattices=self.sublattices)
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        """Inverse of :meth:`_to_arrays`"""
+        return cls(arrays["data"], (arrays["x"], arrays["y"], arrays["z"]),
+                   arrays["sublattices"])
+
+    def save(self, file, compressed=True):
+        """Save the map to disk, see :meth:`load`
+
+        The layout is versioned: positions, data and sublattices are stored as raw arrays,
+        hoppings as COO triplets and boundaries as their shifts and COO triplets.
+
+        Parameters
+        ----------
+        file : str
+            Path of the `.npz` file (if `compressed`) or of the output directory. It's used
+            as given, i.e. no `.npz` extension is added, and :meth:`load` takes the same path.
+        compressed : bool
+            Write a single compressed `.npz` file. Otherwise, write a directory of
+            uncompressed `.npy` files which can be memory-mapped by :meth:`load`.
+        """
+        _write_arrays(file, self._to_arrays(), compressed)
+
+    @classmethod
+    def load(cls, file, mmap=False):
+        """Load a map saved by :meth:`save`
+
+        Parameters
+        ----------
+        file : str
+            Path of a `.npz` file or a directory of `.npy` files.
+        mmap : bool
+            Memory-map the arrays instead of reading them (only for uncompressed saves).
+            Large maps open instantly and operations like :meth:`cropped` only page in
+            the data they touch.
+
+        Returns
+        -------
+        SpatialMap
+        """
+        arrays = _read_arrays(file, mmap)
+        _check_format_version(arrays)
+        return cls._from_arrays(arrays)
+
+    def _kdtree(self, axes):
+        """k-d tree of the site positions projected onto the `axes` plane (cached)"""
+        def build():
+            from scipy.spatial import cKDTree
+            return cKDTree(np.column_stack(_rotate(self.positions, axes)[:2]))
+
+        return _cache.get(list(self.positions), ("kdtree", axes), build)
+
+    def pick(self, x, y, axes="xy", max_distance=np.inf):
+        """Find the site nearest to the point (x, y) in the plane of `axes`
+
+        The lookup is O(log N) thanks to a k-d tree which is built once per map.
+        Useful for tooltips and click handlers, e.g. with `event.xdata, event.ydata`.
+
+        Parameters
+        ----------
+        x, y : float
+            Point coordinates in data units.
+        axes : str
+            The spatial axes of the plot. E.g. 'xy', 'yz', etc.
+        max_distance : float
+            Return `None` if there's no site within this distance.
+
+        Returns
+        -------
+        Optional[Pick]
+        """
+        distance, idx = self._kdtree(axes).query([x, y], distance_upper_bound=max_distance)
+        if np.isinf(distance):
+            return None
+        return Pick(int(idx), np.array([v[idx] for v in self.positions]),
+                    self.sublattices[idx], self.data[idx], None)
+
     def cropped(self, **limits):
         """Return a copy which retains only the sites within the given limits
 
@@ -104,56 +451,300 @@ class SpatialMap:
         """Clip (limit) the values in the `data` array, see :func:`~numpy.clip`"""
         return self.__class__(np.clip(self.data, v_min, v_max), self.positions, self.sublattices)
 
+    def _chunks(self, chunk_size):
+        """Iterate over the (data, positions, sublattices) arrays of consecutive parts
+
+        The arrays are views, nothing is copied.
+        """
+        for start in range(0, self.num_sites, chunk_size):
+            s = slice(start, start + chunk_size)
+            yield self.data[s], tuple(v[s] for v in self.positions), self.sublattices[s]
+
+    def binned(self, bin_size, statistic="mean", axes="xy", by_sublattice=False,
+               chunk_size=2**20):
+        """Reduce the data on a regular 2D or 3D grid: one site per non-empty bin
+
+        Parameters
+        ----------
+        bin_size : Union[float, array_like]
+            Bin size, either the same for all `axes` or one value per axis. Bin edges
+            are aligned to multiples of the size.
+        statistic : str
+            'mean', 'sum', 'max', 'min', 'count' or 'density' (number of sites per
+            unit length, area or volume).
+        axes : str
+            Binned axes, e.g. 'xy' for 2D or 'xyz' for 3D. Other coordinates are zero.
+        by_sublattice : bool
+            Reduce each sublattice separately. The result keeps the sublattice IDs.
+        chunk_size : int
+            Number of sites processed at once. Only the bins are kept in memory, so
+            a memory-mapped map (see :meth:`load`) is never fully read at once.
+
+        Returns
+        -------
+        :class:`SpatialMap`
+            Sites at bin centers.
+        """
+        return _binned(self._chunks(chunk_size), bin_size, statistic, axes, by_sublattice)
+
+    def hexbinned(self, size, statistic="mean", by_sublattice=False, chunk_size=2**20):
+        """Reduce the data on a hexagonal grid in the xy plane
+
+        Parameters
+        ----------
+        size : float
+            Distance between the centers of neighboring hexagons.
+        statistic, by_sublattice, chunk_size
+            See :meth:`binned`.
+
+        Returns
+        -------
+        :class:`SpatialMap`
+            Sites at hexagon centers.
+        """
+        return _hexbinned(self._chunks(chunk_size), size, statistic, by_sublattice)
+
+    def radial_average(self, center, bin_width, statistic="mean", axes="xy",
+                       by_sublattice=False, chunk_size=2**20):
+        """Reduce the data in concentric shells around `center`
+
+        Parameters
+        ----------
+        center : array_like
+            One coordinate for each of the `axes`.
+        bin_width : float
+            Width of each shell.
+        statistic, by_sublattice, chunk_size
+            See :meth:`binned`. For 'density', the measure is the area of the ring
+            (2D) or the volume of the shell (3D).
+        axes : str
+            Distance is measured in this subspace: e.g. 'xy' for rings, 'xyz' for
+            spherical shells.
+
+        Returns
+        -------
+        :class:`SpatialMap`
+            The `x` coordinate of each site is the mean radius of the shell.
+        """
+        return _radial_average(self._chunks(chunk_size), center, bin_width, statistic, axes,
+                               by_sublattice)
+
+    @staticmethod
+    def reduce_chunks(chunks, method, *args, **kwargs):
+        """Apply :meth:`binned`, :meth:`hexbinned` or :meth:`radial_average` to chunks
+
+        The full map never needs to exist: `chunks` may be a generator which produces
+        the data piece by piece. Bins which are split across chunks are merged.
+
+        Parameters
+        ----------
+        chunks : Iterable[SpatialMap]
+        method : str
+            Name of the reduction method.
+        *args, **kwargs
+            Forwarded to the method. The `chunk_size` is ignored: the chunks are given.
+
+        Examples
+        --------
+        >>> chunks = (SpatialMap(np.ones(4), (np.arange(4) + 4 * i, np.zeros(4), np.zeros(4)))
+        ...           for i in range(3))
+        >>> reduced = SpatialMap.reduce_chunks(chunks, "binned", 6, "sum", axes="x")
+        >>> reduced.x.tolist(), reduced.data.tolist()
+        ([3.0, 9.0], [6.0, 6.0])
+        """
+        if method not in _reductions:
+            raise RuntimeError("Unknown reduction method: '{}'".format(method))
+        kwargs.pop("chunk_size", None)
+        arrays = ((chunk.data, chunk.positions, chunk.sublattices) for chunk in chunks)
+        return _reductions[method](arrays, *args, **kwargs)
+
     @staticmethod
-    def _decorate_plot():
-        ax = plt.gca()
+    def _decorate_plot(ax):
         ax.set_aspect("equal")
         ax.set_xlabel("x")
         ax.set_ylabel("y")
-        pltutils.despine(trim=True)
+        pltutils.despine(trim=True, ax=ax)
+
+    def _decimated_grid(self, ax, statistic, follow_view=False):
+        """Bin the xy data onto a grid which matches the pixel resolution of `ax`
+
+        Initially, the whole map is binned using the full axes size. With `follow_view`,
+        only the visible part is binned at the current zoom level.
+
+        Returns
+        -------
+        Optional[Tuple[np.ma.MaskedArray, list]]
+            The grid and its extent or `None` if no part of the map is visible.
+        """
+        x, y = self.x, self.y
+        extent = [x.min(), x.max(), y.min(), y.max()]
+        width, height = ax.bbox.width, ax.bbox.height
+        if follow_view:
+            (vx0, vx1), (vy0, vy1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+            extent = [max(extent[0], vx0), min(extent[1], vx1),
+                      max(extent[2], vy0), min(extent[3], vy1)]
+            if extent[0] > extent[1] or extent[2] > extent[3]:
+                return None
+            width *= (extent[1] - extent[0]) / (vx1 - vx0)
+            height *= (extent[3] - extent[2]) / (vy1 - vy0)
+
+        shape = max(int(np.ceil(height)), 1), max(int(np.ceil(width)), 1)
+        return grid_statistic(x, y, self.data, extent, shape, statistic), extent
+
+    def _plot_decimated(self, ax, statistic, make_artist, remove_artist):
+        """Plot the binned map on `ax` and re-bin the visible part after the view changes
+
+        `make_artist(grid, extent)` draws the grid and returns the artist which is
+        replaced by a new one on re-binning if `remove_artist(artist)` is callable.
+        The limits callbacks only mark the plot as stale: new artists may change the
+        limits again. The re-binning is deferred to the next draw, see :class:`_Rebin`.
+        """
+        state = dict(artist=make_artist(*self._decimated_grid(ax, statistic)),
+                     stale=False, busy=False)
 
-    def plot_pcolor(self, **kwargs):
+        def rebin():
+            if state["busy"] or not state["stale"]:
+                return
+
+            state["busy"] = True  # the new artist may adjust the limits of the axes
+            try:
+                state["stale"] = False
+                result = self._decimated_grid(ax, statistic, follow_view=True)
+                if result is None:
+                    return
+                if remove_artist:
+                    remove_artist(state["artist"])
+                state["artist"] = make_artist(*result)
+            finally:
+                state["busy"] = False
+
+        def mark_stale(_):
+            if not state["busy"]:
+                state["stale"] = True
+
+        artist = state["artist"]
+        ax.get_figure().artists.append(_Rebin(ax, rebin))
+        _connect_dynamic_scale(ax, artist, mark_stale, 'sites', apply_now=False)
+        self._decorate_plot(ax)
+        return artist
+
+    @staticmethod
+    def _set_current_image(ax, artist):
+        """Make `artist` the pyplot current image (for `plt.colorbar`), only for the active axes"""
+        if ax is None:
+            plt.sci(artist)
+
+    def plot_pcolor(self, decimate=None, ax=None, **kwargs):
         """Color plot of the xy plane
 
         Parameters
         ----------
+        decimate : Optional[str]
+            Bin the data onto a grid which matches the output resolution and plot it
+            with :func:`~matplotlib.pyplot.imshow`. Each pixel shows the 'mean' or 'max'
+            of the sites it contains. Empty pixels are masked. The visible part is
+            re-binned on zoom, so the cost is bounded by the pixels, not the sites.
+        ax : Optional[plt.Axes]
+            Defaults to the active axes. The global pyplot state isn't used if it's given.
         **kwargs
-            Forwarded to :func:`~matplotlib.pyplot.tripcolor`.
+            Forwarded to :func:`~matplotlib.pyplot.tripcolor`, or to
+            :func:`~matplotlib.pyplot.imshow` with `decimate`.
+
+        The plot is decimated by default if its estimated cost is over the budget and
+        `tbplot.budget.policy` is 'degrade', see :mod:`tbplot.budget`.
         """
+        decimate = _fit_map(self, "plot_pcolor", decimate)
+        target_ax, ax = ax, pltutils._gca(ax)
+        if decimate:
+            if "norm" not in kwargs:
+                kwargs = with_defaults(kwargs, vmin=self.data.min(), vmax=self.data.max())
+            kwargs = with_defaults(kwargs, interpolation="nearest", origin="lower")
+            state = {}
+
+            def draw_image(grid, extent):
+                if "image" not in state:
+                    state["image"] = ax.imshow(grid, extent=extent, **kwargs)
+                else:
+                    state["image"].set_data(grid)
+                    state["image"].set_extent(extent)
+                return state["image"]
+
+            image = self._plot_decimated(ax, decimate, draw_image, remove_artist=None)
+            self._set_current_image(target_ax, image)
+            return image
+
         x, y, _ = self.positions
         kwargs = with_defaults(kwargs, shading="gouraud", rasterized=True)
-        pcolor = plt.tripcolor(x, y, self.data, **kwargs)
-        self._decorate_plot()
+        pcolor = ax.tripcolor(x, y, self.data, **kwargs)
+        self._set_current_image(target_ax, pcolor)
+        self._decorate_plot(ax)
         return pcolor
 
-    def plot_contourf(self, num_levels=50, **kwargs):
+    def plot_contourf(self, num_levels=50, decimate=None, ax=None, **kwargs):
         """Filled contour plot of the xy plane
 
         Parameters
         ----------
         num_levels : int
             Number of contour levels.
+        decimate : Optional[str]
+            Bin the data onto a grid which matches the output resolution ('mean' or 'max'
+            of the sites in each pixel) and plot it with :func:`~matplotlib.pyplot.contourf`.
+            See :meth:`plot_pcolor`.
+        ax : Optional[plt.Axes]
+            Defaults to the active axes. The global pyplot state isn't used if it's given.
         **kwargs
-            Forwarded to :func:`~matplotlib.pyplot.tricontourf`.
+            Forwarded to :func:`~matplotlib.pyplot.tricontourf`, or to
+            :func:`~matplotlib.pyplot.contourf` with `decimate`.
+
+        Decimated if it's over budget, same as :meth:`plot_pcolor`.
         """
+        decimate = _fit_map(self, "plot_contourf", decimate)
+        target_ax, ax = ax, pltutils._gca(ax)
         levels = np.linspace(self.data.min(), self.data.max(), num=num_levels)
-        x, y, _ = self.positions
         kwargs = with_defaults(kwargs, levels=levels, rasterized=True)
-        contourf = plt.tricontourf(x, y, self.data, **kwargs)
-        self._decorate_plot()
+        if decimate:
+            def draw_contours(grid, extent):
+                ny, nx = grid.shape
+                dx, dy = (extent[1] - extent[0]) / nx, (extent[3] - extent[2]) / ny
+                xs = extent[0] + dx * (np.arange(nx) + 0.5)
+                ys = extent[2] + dy * (np.arange(ny) + 0.5)
+                return ax.contourf(xs, ys, grid, **kwargs)
+
+            def remove_contours(contour_set):
+                if hasattr(contour_set, "remove"):
+                    contour_set.remove()
+                else:
+                    for collection in contour_set.collections:
+                        collection.remove()
+
+            contours = self._plot_decimated(ax, decimate, draw_contours, remove_contours)
+            self._set_current_image(target_ax, contours)
+            return contours
+
+        x, y, _ = self.positions
+        contourf = ax.tricontourf(x, y, self.data, **kwargs)
+        self._set_current_image(target_ax, contourf)
+        self._decorate_plot(ax)
         return contourf
 
-    def plot_contour(self, **kwargs):
+    def plot_contour(self, ax=None, **kwargs):
         """Contour plot of the xy plane
 
         Parameters
         ----------
+        ax : Optional[plt.Axes]
+            Defaults to the active axes. The global pyplot state isn't used if it's given.
         **kwargs
             Forwarded to :func:`~matplotlib.pyplot.tricontour`.
         """
+        _fit_map(self, "plot_contour", None)
+        target_ax, ax = ax, pltutils._gca(ax)
         x, y, _ = self.positions
-        contour = plt.tricontour(x, y, self.data, **kwargs)
-        self._decorate_plot()
+        contour = ax.tricontour(x, y, self.data, **kwargs)
+        if contour.get_array() is not None:  # same as `plt.tricontour`
+            self._set_current_image(target_ax, contour)
+        self._decorate_plot(ax)
         return contour
 
 
@@ -162,9 +753,10 @@ class StructureMap(SpatialMap):
 
     Attributes
     ----------
-    hoppings : :class:`~scipy.sparse.csr_matrix`
-        Sparse matrix of hopping IDs. See :attr:`.System.hoppings`.
-    boundaries : List[:class:`~scipy.sparse.csr_matrix`]
+    hoppings : :class:`~scipy.sparse.spmatrix`
+        Sparse matrix of hopping IDs. See :attr:`.System.hoppings`. Any format is
+        accepted: the COO triplets needed for plotting are derived once per matrix.
+    boundaries : List[:class:`Boundary`]
         Boundary hoppings. See :attr:`.System.boundaries`.
     """
 
@@ -176,7 +768,7 @@ class StructureMap(SpatialMap):
     @classmethod
     def from_system(cls, data, system):
         return cls(data, system.positions, system.sublattices,
-                   system.hoppings.tocsr(), system.boundaries)
+                   system.hoppings, system.boundaries)
 
     @property
     def spatial_map(self) -> SpatialMap:
@@ -193,19 +785,183 @@ class StructureMap(SpatialMap):
         m.data -= 1
         return m
 
+    @staticmethod
+    def _filter_coo_matrix(matrix, idx):
+        """Keep the entries between the selected sites using the (cached) COO triplets"""
+        size = matrix.shape[0]
+        row, col, data = _as_triplets(matrix)
+        selected = np.arange(size)[idx]
+        new_index = np.full(size, -1, dtype=row.dtype)
+        new_index[selected] = np.arange(selected.size)
+
+        row, col = new_index[row], new_index[col]
+        keep = np.logical_and(row >= 0, col >= 0)
+        return coo_matrix((data[keep], (row[keep], col[keep])),
+                          shape=(selected.size, selected.size))
+
+    @staticmethod
+    def _filter_matrix(matrix, idx):
+        if isspmatrix_csr(matrix):
+            return StructureMap._filter_csr_matrix(matrix, idx)
+        else:
+            return StructureMap._filter_coo_matrix(matrix, idx)
+
     @staticmethod
     def _filter_boundary(boundary, idx):
         b = copy(boundary)
-        b.hoppings = StructureMap._filter_csr_matrix(b.hoppings, idx)
+        b.hoppings = StructureMap._filter_matrix(b.hoppings, idx)
         return b
 
     def __getitem__(self, idx):
         """Same rules as numpy indexing"""
         return self.__class__(self.data[idx], (v[idx] for v in self.positions),
-                              self.sublattices[idx], self._filter_csr_matrix(self.hoppings, idx),
+                              self.sublattices[idx], self._filter_matrix(self.hoppings, idx),
                               [self._filter_boundary(b, idx) for b in self.boundaries])
 
-    def plot(self, cmap="YlGnBu", site_radius=(0.03, 0.05), num_periods=1, **kwargs):
+    def _nearest_hopping(self, x, y, axes, k=16):
+        """The (from, to, ID) of the hopping line nearest to (x, y)
+
+        The `k` bonds with the nearest midpoints are found with a k-d tree (built once
+        per map) and the exact point to segment distance decides among them.
+        """
+        row, col, data = _as_triplets(self.hoppings)
+        if data.size == 0:
+            return None
+
+        points = np.column_stack(_rotate(self.positions, axes)[:2])
+
+        def build():
+            from scipy.spatial import cKDTree
+            return cKDTree((points[row] + points[col]) / 2)
+
+        tree = _cache.get([self.hoppings] + list(self.positions), ("bond_kdtree", axes), build)
+        _, idx = tree.query([x, y], k=min(k, data.size))
+        idx = np.atleast_1d(idx)
+
+        start, end = points[row[idx]], points[col[idx]]
+        direction = end - start
+        length2 = np.maximum((direction ** 2).sum(axis=1), np.finfo(float).tiny)
+        t = np.clip(((np.array([x, y]) - start) * direction).sum(axis=1) / length2, 0, 1)
+        distance = np.hypot(*(start + t[:, np.newaxis] * direction - [x, y]).T)
+
+        nearest = idx[distance.argmin()]
+        return int(row[nearest]), int(col[nearest]), data[nearest]
+
+    def pick(self, x, y, axes="xy", max_distance=np.inf, hopping=False):
+        """Find the site nearest to the point (x, y) and optionally the nearest hopping
+
+        Parameters
+        ----------
+        x, y, axes, max_distance
+            See :meth:`SpatialMap.pick`.
+        hopping : bool
+            Also find the nearest hopping line and return it as :attr:`Pick.hopping`.
+
+        Returns
+        -------
+        Optional[Pick]
+        """
+        result = super().pick(x, y, axes, max_distance)
+        if result is None or not hopping:
+            return result
+        return result._replace(hopping=self._nearest_hopping(x, y, axes))
+
+    def _to_arrays(self):
+        arrays = super()._to_arrays()
+        arrays.update(_coo_to_arrays(self.hoppings, "hoppings"))
+        arrays["boundary_shifts"] = np.array([b.shift for b in self.boundaries]).reshape(-1, 3)
+        for n, boundary in enumerate(self.boundaries):
+            arrays.update(_coo_to_arrays(boundary.hoppings, "boundary{}".format(n)))
+        return arrays
+
+    @classmethod
+    def _from_arrays(cls, arrays):
+        size = arrays["data"].size
+        boundaries = [Boundary(shift, _coo_from_arrays(arrays, "boundary{}".format(n), size))
+                      for n, shift in enumerate(arrays["boundary_shifts"])]
+        return cls(arrays["data"], (arrays["x"], arrays["y"], arrays["z"]),
+                   arrays["sublattices"], _coo_from_arrays(arrays, "hoppings", size), boundaries)
+
+    def _plot_static_layer(self, props, num_periods):
+        """Plot the hoppings and periodic images, with the hoppings from a cached raster
+
+        The hopping layer doesn't depend on :attr:`data` so it's rendered once per
+        structure (including the boundary shifts), view, plot properties, line and
+        margin style (see `_static_layer_rc`) and axes size. Periodic sites are
+        colored by the data, so they are always plotted.
+        """
+        from matplotlib.image import AxesImage
+        from .interactive import _render_offscreen
+
+        ax = pltutils._gca(props["ax"])
+        hopping_props = props["hopping"]
+        props["site"]["alpha"] = 0.5
+        props["hopping"] = dict(hopping_props, alpha=0.5)
+        periodic_props = structure_plot_properties(**props)
+        layout = _periodic_layout(self.boundaries, num_periods)
+
+        def props_key(p):
+            return tuple(sorted((k, repr(v)) for k, v in p.items()))
+
+        fig = ax.get_figure()
+        key = ("static_layer", num_periods, props_key(hopping_props),
+               props_key(periodic_props["hopping"]), props_key(periodic_props["boundary"]),
+               tuple(tuple(np.asarray(b.shift).tolist()) for b in self.boundaries),
+               tuple(fig.bbox.size), fig.dpi, tuple(ax.get_position().bounds),
+               tuple((name, repr(plt.rcParams[name])) for name in _static_layer_rc))
+        layer = _cache.get([self.hoppings] + list(self.positions) +
+                           [b.hoppings for b in self.boundaries], key, dict)
+
+        if not layer:
+            # same order as the regular plot: the data limits depend on it
+            from matplotlib.collections import LineCollection
+            static = [plot_hoppings(self.positions, self.hoppings, **hopping_props)]
+            static += _plot_periodic_layout(self.positions, self.hoppings, self.data, layout,
+                                            periodic_props)
+            static = [c for c in static if isinstance(c, LineCollection)]
+            layer["limits"] = ax.get_xlim(), ax.get_ylim()
+            pltutils.despine(trim=True, ax=ax)
+            pltutils.add_margin(ax=ax)
+
+            # render with the final aspect, but leave the limits for the regular draw
+            xlim, ylim = ax.get_xlim(), ax.get_ylim()
+            ax.apply_aspect()
+            layer["image"], layer["extent"] = _render_offscreen(ax, static)
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
+            for collection in static:
+                collection.remove()
+        else:
+            _plot_periodic_layout(self.positions, self.hoppings, self.data, layout,
+                                  periodic_props, layers=("sites",))
+            ax.set_xlim(layer["limits"][0])
+            ax.set_ylim(layer["limits"][1])
+            pltutils.despine(trim=True, ax=ax)
+            pltutils.add_margin(ax=ax)
+
+        xlim, ylim = ax.get_xlim(), ax.get_ylim()
+        image = AxesImage(ax, extent=layer["extent"], origin="upper", interpolation="nearest",
+                          zorder=-1)
+        image.set_data(layer["image"])
+        ax.add_image(image)
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+
+    def _site_radii(self, site_radius):
+        """Map the magnitude of :attr:`data` to the (min, max) `site_radius` range"""
+        if not isinstance(site_radius, (tuple, list)):
+            return site_radius
+
+        positive_data = self.data - self.data.min()
+        maximum = positive_data.max()
+        if not np.allclose(maximum, 0):
+            delta = site_radius[1] - site_radius[0]
+            return site_radius[0] + delta * positive_data / maximum
+        else:
+            return site_radius[1]
+
+    def plot(self, cmap="YlGnBu", site_radius=(0.03, 0.05), num_periods=1,
+             cache_structure=False, **kwargs):
         """Plot the spatial structure with a colormap of :attr:`data` at the lattice sites
 
         Both the site size and color are used to display the data.
@@ -219,41 +975,71 @@ class StructureMap(SpatialMap):
             represent the magnitude of the data.
         num_periods : int
             Number of times to repeat periodic boundaries.
+        cache_structure : bool
+            Render the hoppings and boundaries (which don't depend on :attr:`data`) into
+            a raster only once and reuse it in subsequent calls with the same structure,
+            view, properties and axes size, e.g. when plotting data at many energies.
+            The cached layer doesn't follow the line width scaling when zooming.
         **kwargs
             Additional plot arguments as specified in :func:`.structure_plot_properties`.
+            Pass `ax` to draw on a specific axes without using the global pyplot state.
+
+        Over the `tbplot.budget.*` settings, the collections may be rasterized or fewer
+        periodic images may be drawn, see :mod:`tbplot.budget`.
         """
-        ax = plt.gca()
+        num_periods, hoppings, rasterized = _fit_system("StructureMap.plot", self, num_periods)
+        target_ax = kwargs.get("ax")
+        ax = pltutils._gca(target_ax)
         ax.set_aspect("equal", "datalim")
         ax.set_xlabel("x")
         ax.set_ylabel("y")
 
-        def to_radii(data):
-            if not isinstance(site_radius, (tuple, list)):
-                return site_radius
-
-            positive_data = data - data.min()
-            maximum = positive_data.max()
-            if not np.allclose(maximum, 0):
-                delta = site_radius[1] - site_radius[0]
-                return site_radius[0] + delta * positive_data / maximum
-            else:
-                return site_radius[1]
-
         props = structure_plot_properties(**kwargs)
-        props["site"] = with_defaults(props["site"], radius=to_radii(self.data), cmap=cmap)
+        props["site"] = with_defaults(props["site"], radius=self._site_radii(site_radius),
+                                      cmap=cmap)
+        props["hopping"] = with_defaults(props["hopping"], color="#bbbbbb")
+        props = _degrade_props(props, hoppings, rasterized)
         collection = plot_sites(self.positions, self.data, **props["site"])
 
-        hop = self.hoppings.tocoo()
-        props["hopping"] = with_defaults(props["hopping"], color="#bbbbbb")
-        plot_hoppings(self.positions, hop, **props["hopping"])
+        # pass the original matrix: the COO triplets are derived once per matrix
+        if cache_structure:
+            self._plot_static_layer(props, num_periods)
+        else:
+            plot_hoppings(self.positions, self.hoppings, **props["hopping"])
 
-        props["site"]["alpha"] = props["hopping"]["alpha"] = 0.5
-        plot_periodic_boundaries(self.positions, hop, self.boundaries, self.data,
-                                 num_periods, **props)
+            props["site"]["alpha"] = props["hopping"]["alpha"] = 0.5
+            plot_periodic_boundaries(self.positions, self.hoppings, self.boundaries, self.data,
+                                     num_periods, **props)
 
-        pltutils.despine(trim=True)
-        pltutils.add_margin()
+            pltutils.despine(trim=True, ax=ax)
+            pltutils.add_margin(ax=ax)
 
         if collection:
-            plt.sci(collection)
+            self._set_current_image(target_ax, collection)
         return collection
+
+    def export(self, file, cmap="YlGnBu", site_radius=(0.03, 0.05), num_periods=1,
+               format=None, width=None, chunk_size=2**16, **kwargs):
+        """Write the structure as drawn by :meth:`plot` directly to an SVG or PDF file
+
+        Parameters
+        ----------
+        file : Union[str, file]
+            File name or a binary file object.
+        cmap, site_radius, num_periods
+            See :meth:`plot`.
+        format, width, chunk_size
+            See :func:`.export_structure`.
+        **kwargs
+            Additional plot arguments as specified in :func:`.structure_plot_properties`.
+        """
+        props = structure_plot_properties(**kwargs)
+        props["site"] = with_defaults(props["site"], radius=self._site_radii(site_radius),
+                                      cmap=cmap)
+        props["hopping"] = with_defaults(props["hopping"], color="#bbbbbb")
+
+        periodic_props = dict(props, site=dict(props["site"], alpha=0.5),
+                              hopping=dict(props["hopping"], alpha=0.5))
+        _export(file, format, width, chunk_size,
+                (self.positions, self.data, self.hoppings, self.boundaries),
+                num_periods, props, periodic_props)
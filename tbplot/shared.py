@@ -0,0 +1,230 @@
+"""Publish the arrays of a map once and attach to them from other processes without a copy"""
+import os
+import tempfile
+import uuid
+import weakref
+from copy import copy
+
+import numpy as np
+
+from .results import SpatialMap, StructureMap
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+__all__ = ["SharedMap", "share_map"]
+
+_map_types = {"SpatialMap": SpatialMap, "StructureMap": StructureMap}
+_alignment = 64  # bytes: a cache line, more than enough for any dtype
+
+# name -> (segment, uint8 view of the whole buffer): each process maps a buffer only once
+_attached = {}
+
+
+def _layout(arrays):
+    """Byte offset, dtype and shape of each array within a single buffer"""
+    layout, size = {}, 0
+    for name, array in sorted(arrays.items()):
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += -(-array.nbytes // _alignment) * _alignment
+    return layout, max(size, _alignment)
+
+
+def _view(base, offset, dtype, shape):
+    """Read-only array view into the `base` buffer"""
+    dtype = np.dtype(dtype)
+    num_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    array = base[offset:offset + num_bytes].view(dtype).reshape(shape)
+    array.flags.writeable = False
+    return array
+
+
+class _SegmentBuffer:
+    """Array interface of a shared memory segment: array views keep the segment alive
+
+    The segment can only be closed once all the views are gone, so it's closed when the
+    last one is garbage collected. The array is released first (attribute order).
+    """
+
+    def __init__(self, segment):
+        self.array = np.frombuffer(segment.buf, dtype=np.uint8)
+        self.segment = segment
+        self.__array_interface__ = self.array.__array_interface__
+
+
+def _open_segment(name):
+    """Attach to an existing shared memory segment which is owned by another process"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # Python >= 3.13
+    except TypeError:
+        segment = shared_memory.SharedMemory(name)
+        # only the owner may unlink it: don't let this process clean it up at exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def _map_buffer(kind, name):
+    if name not in _attached:
+        if kind == "shm":
+            segment = _open_segment(name)
+            _attached[name] = segment, np.asarray(_SegmentBuffer(segment))
+        else:
+            memmap = np.memmap(name, dtype=np.uint8, mode="r")
+            _attached[name] = memmap, memmap
+    return _attached[name][1]
+
+
+def _unmap_buffer(name):
+    """Forget the mapping: it's closed once the last view of the buffer is collected"""
+    _attached.pop(name, None)
+
+
+def _destroy(kind, name):
+    """Delete the buffer: processes which are still attached keep their mapping"""
+    try:
+        if kind == "shm":
+            segment = _attached[name][0] if name in _attached else _open_segment(name)
+            segment.unlink()
+        else:
+            os.remove(name)
+    except FileNotFoundError:
+        pass
+    _unmap_buffer(name)
+
+
+class SharedMap:
+    """Handle to the arrays of a map which were published by :func:`share_map`
+
+    The handle is small and cheap to pickle: it only holds the name of the buffer and the
+    layout of the arrays. :meth:`attach` maps the buffer (once per process) and returns
+    a map with read-only views of the arrays. A handle made by :meth:`with_data` also
+    carries a new :attr:`.SpatialMap.data` array, the only part which is copied per job.
+
+    The handle returned by :func:`share_map` owns the buffer: :meth:`release` (or the end
+    of a `with` block) deletes it. It's also deleted when the owner is garbage collected.
+    """
+
+    def __init__(self, kind, name, layout, map_type, data=None):
+        self.kind = kind
+        self.name = name
+        self.layout = layout
+        self.map_type = map_type
+        self.data = data
+        self._finalizer = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_finalizer"] = None  # the copy doesn't own the buffer
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+    @property
+    def num_sites(self) -> int:
+        return self.layout["data"][2][0]
+
+    def with_data(self, data):
+        """Return a handle to the same arrays, but with a different `data` array
+
+        Parameters
+        ----------
+        data : array_like
+            Must have one value per site.
+
+        Returns
+        -------
+        SharedMap
+        """
+        data = np.atleast_1d(data)
+        if data.shape != (self.num_sites,):
+            raise RuntimeError("Expected data for {} sites, got shape {}".format(
+                self.num_sites, data.shape))
+        handle = copy(self)
+        handle.data = data
+        handle._finalizer = None
+        return handle
+
+    def attach(self):
+        """Return a map with zero-copy, read-only views of the shared arrays
+
+        Returns
+        -------
+        Union[SpatialMap, StructureMap]
+        """
+        base = _map_buffer(self.kind, self.name)
+        arrays = {name: _view(base, *entry) for name, entry in self.layout.items()}
+        if self.data is not None:
+            arrays["data"] = self.data
+        return _map_types[self.map_type]._from_arrays(arrays)
+
+    def release(self):
+        """Unmap the buffer in this process and, if this is the owner, delete it"""
+        if self._finalizer is not None:
+            self._finalizer()
+        else:
+            _unmap_buffer(self.name)
+
+
+def share_map(smap, kind=None, directory=None):
+    """Copy the arrays of a map into a single shared buffer, see :class:`SharedMap`
+
+    Worker processes :meth:`~SharedMap.attach` to the buffer instead of receiving a
+    pickled copy of the positions, sublattices and hopping matrices with each job.
+
+    Parameters
+    ----------
+    smap : Union[SpatialMap, StructureMap]
+    kind : Optional[str]
+        'shm' for :mod:`multiprocessing.shared_memory` (default on Python 3.8+) or
+        'file' for a memory-mapped file (default on older versions).
+    directory : Optional[str]
+        Location of the 'file': `/dev/shm` if it exists (backed by memory), otherwise
+        the default temporary directory.
+
+    Returns
+    -------
+    SharedMap
+        The owner of the buffer: :meth:`~SharedMap.release` it when all jobs are done.
+
+    Examples
+    --------
+    >>> smap = SpatialMap(np.arange(4.0), (np.arange(4), np.zeros(4), np.zeros(4)))
+    >>> with share_map(smap) as handle:
+    ...     handle.with_data(np.ones(4)).attach().data.tolist()
+    [1.0, 1.0, 1.0, 1.0]
+    """
+    kind = kind or ("shm" if shared_memory is not None else "file")
+    if kind == "shm" and shared_memory is None:
+        raise RuntimeError("Shared memory requires Python 3.8 or newer, use kind='file'")
+    elif kind not in ("shm", "file"):
+        raise RuntimeError("Unknown kind of shared buffer: '{}'".format(kind))
+
+    arrays = {name: np.ascontiguousarray(array) for name, array in smap._to_arrays().items()}
+    layout, size = _layout(arrays)
+    if kind == "shm":
+        segment = shared_memory.SharedMemory(create=True, size=size)
+        name = segment.name
+        base = np.asarray(_SegmentBuffer(segment))
+    else:
+        if directory is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        name = os.path.join(directory, "tbplot-{}.map".format(uuid.uuid4().hex))
+        segment = base = np.memmap(name, dtype=np.uint8, mode="w+", shape=(size,))
+
+    for key, array in arrays.items():
+        offset = layout[key][0]
+        base[offset:offset + array.nbytes] = array.reshape(-1).view(np.uint8)
+    if kind == "file":
+        base.flush()
+    _attached[name] = segment, base
+
+    handle = SharedMap(kind, name, layout, type(smap).__name__)
+    handle._finalizer = weakref.finalize(handle, _destroy, kind, name)
+    return handle
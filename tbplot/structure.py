@@ -2,16 +2,23 @@
 import functools
 import itertools
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from . import pltutils
-from .detail.utils import with_defaults, FuzzySet
+from .detail import parallel
+from .detail.buffers import GrowableArray
+from .detail.utils import with_defaults, FuzzySet, IdentityCache
+from .style import rc
 
-__all__ = ['plot_hoppings', 'plot_periodic_boundaries', 'plot_sites', 'structure_plot_properties']
+__all__ = ['plot_hoppings', 'plot_periodic_boundaries', 'plot_sites', 'structure_plot_properties',
+           'StructureBuilder']
 
+# Geometry derived from positions and hopping matrices: computed once per system
+_cache = IdentityCache()
 
-def structure_plot_properties(axes='xyz', site=None, hopping=None, boundary=None, **kwargs):
+
+def structure_plot_properties(axes='xyz', site=None, hopping=None, boundary=None, ax=None,
+                              **kwargs):
     """Process structure plot properties
 
     Parameters
@@ -25,6 +32,9 @@ def structure_plot_properties(axes='xyz', site=None, hopping=None, boundary=None
         Arguments forwarded to :func:`plot_hoppings`.
     boundary : dict
         Arguments forwarded to :func:`plot_periodic_boundaries`.
+    ax : Optional[plt.Axes]
+        Draw everything on this axes without using the global pyplot state.
+        Defaults to the active axes.
     **kwargs
         Additional args are reserved for internal implementation.
 
@@ -40,24 +50,43 @@ def structure_plot_properties(axes='xyz', site=None, hopping=None, boundary=None
     if invalid_args:
         raise RuntimeError("Invalid arguments: {}".format(','.join(invalid_args)))
 
-    props = {'axes': axes, 'add_margin': kwargs.get('add_margin', True),
-             'site': with_defaults(site, axes=axes),
-             'hopping': with_defaults(hopping, axes=axes)}
+    props = {'axes': axes, 'add_margin': kwargs.get('add_margin', True), 'ax': ax,
+             'site': with_defaults(site, axes=axes, ax=ax),
+             'hopping': with_defaults(hopping, axes=axes, ax=ax)}
     props['boundary'] = with_defaults(boundary, props['hopping'], color='#f40a0c')
     return props
 
 
-def decorate_structure_plot(axes='xy', add_margin=True, **_):
-    plt.gca().set_aspect('equal')
-    plt.xlabel("{} (nm)".format(axes[0]))
-    plt.ylabel("{} (nm)".format(axes[1]))
+def decorate_structure_plot(axes='xy', add_margin=True, ax=None, **_):
+    ax = pltutils._gca(ax)
+    ax.set_aspect('equal')
+    ax.set_xlabel("{} (nm)".format(axes[0]))
+    ax.set_ylabel("{} (nm)".format(axes[1]))
     if add_margin:
-        pltutils.set_min_axis_length(0.5)
-        pltutils.set_min_axis_ratio(0.4)
-        pltutils.despine(trim=True)
-        pltutils.add_margin()
+        pltutils.set_min_axis_length(0.5, ax=ax)
+        pltutils.set_min_axis_ratio(0.4, ax=ax)
+        pltutils.despine(trim=True, ax=ax)
+        pltutils.add_margin(ax=ax)
     else:
-        pltutils.despine()
+        pltutils.despine(ax=ax)
+
+
+def _site_cmap(cmap):
+    """Resolve the named discrete site palettes: 'auto' and 'pairs'"""
+    if cmap == 'auto':
+        return ['#377ec8', '#ff7f00', '#41ae76', '#e41a1c',
+                '#984ea3', '#ffff00', '#a65628', '#f781bf']
+    elif cmap == 'pairs':
+        return ['#a6cee3', '#1f78b4', '#b2df8a', '#33a02c', '#fb9a99', '#e31a1c',
+                '#fdbf6f', '#ff7f00', '#cab2d6', '#6a3d9a']
+    return cmap
+
+
+def _hopping_cmap(cmap):
+    """Resolve the named discrete hopping palette: 'auto'"""
+    if cmap == 'auto':
+        return ['#666666', '#1b9e77', '#e6ab02', '#7570b3', '#e7298a', '#66a61e', '#a6761d']
+    return cmap
 
 
 def _rotate(position, axes):
@@ -80,8 +109,71 @@ def _data_units_to_points(ax, value):
     return value * (length / data_range)
 
 
+def _connect_dynamic_scale(ax, col, dynamic_scale, layer, apply_now=True):
+    """Apply `dynamic_scale` now (optional) and whenever the axes limits change
+
+    The callbacks are skipped while the axes are frozen during an interactive gesture,
+    see :class:`.InteractiveView`. The collection is tagged with its `layer`: 'sites'
+    for data which may change or 'static' for hoppings and faded periodic images.
+    """
+    def on_limits_changed(active_ax):
+        if not getattr(active_ax, '_tbplot_frozen', False):
+            dynamic_scale(active_ax)
+
+    if apply_now:
+        dynamic_scale(ax)
+    col._tbplot_layer = layer
+    col._tbplot_dynamic_scale = dynamic_scale
+    col._tbplot_cids = [ax.callbacks.connect(signal, on_limits_changed)
+                        for signal in ('xlim_changed', 'ylim_changed')]
+
+
+def _as_triplets(hoppings):
+    """The (row, col, data) arrays of a sparse matrix in any format or a tuple of arrays
+
+    COO matrices and tuples are used without a copy. Other formats are converted once
+    per matrix object and the result is cached until the matrix is modified.
+    """
+    if isinstance(hoppings, (tuple, list)):
+        return tuple(np.asarray(v) for v in hoppings)
+    elif hoppings.format == 'coo':
+        return hoppings.row, hoppings.col, hoppings.data
+
+    def convert():
+        coo = hoppings.tocoo()
+        return coo.row, coo.col, coo.data
+
+    return _cache.get([hoppings], 'coo_triplets', convert)
+
+
+def _is_rasterized(kind, num_elements):
+    """Should a collection of `kind` ('sites' or 'hoppings') be rasterized in vector output
+
+    The thresholds are set by the `tbplot.rasterize.*` keys of :data:`.rc`.
+    """
+    threshold = rc.get("tbplot.rasterize.{}".format(kind))
+    return threshold is not None and num_elements > threshold
+
+
+def _depth_order(z):
+    """Stable back-to-front order of sites or `None` if they are already in order
+
+    The O(N) checks for a single layer or already sorted data come first.
+
+    >>> _depth_order(np.zeros(3)) is None, _depth_order(np.array([0, 1, 1])) is None
+    (True, True)
+    >>> _depth_order(np.array([1, 0, 1])).tolist()
+    [1, 0, 2]
+    """
+    if z.size == 0 or z.min() == z.max() or not np.any(z[1:] < z[:-1]):
+        return None
+    order = parallel.argsort(z)
+    order.setflags(write=False)  # shared by every plot of these positions
+    return order
+
+
 def plot_sites(positions, data, radius=0.025, offset=(0, 0, 0), blend=1.0,
-               cmap='auto', axes='xyz', **kwargs):
+               cmap='auto', axes='xyz', ax=None, **kwargs):
     """Plot circles at lattice site `positions` with colors based on `data`
 
     Parameters
@@ -108,28 +200,31 @@ def plot_sites(positions, data, radius=0.025, offset=(0, 0, 0), blend=1.0,
         used instead.
     axes : str
         The spatial axes to plot. E.g. 'xy', 'yz', etc.
+    ax : Optional[plt.Axes]
+        Defaults to the active axes. The global pyplot state isn't used if it's given.
     **kwargs
-        Forwarded to :class:`matplotlib.collections.CircleCollection`.
+        Forwarded to :class:`matplotlib.collections.CircleCollection`. Collections with
+        more sites than `tbplot.rasterize.sites` (see :data:`.rc`) are rasterized in
+        vector output unless `rasterized` is given explicitly.
 
     Returns
     -------
     :class:`matplotlib.collections.CircleCollection`
+        Use :meth:`~.CircleCollection.index_at` and the `site_index` attribute to find the
+        site under the cursor, e.g. in a `pick_event` handler.
     """
     if np.all(radius == 0):
         return
 
-    kwargs = with_defaults(kwargs, alpha=0.97, lw=0.2, edgecolor=str(1 - blend))
+    kwargs = with_defaults(kwargs, alpha=0.97, lw=0.2, edgecolor=str(1 - blend),
+                           rasterized=_is_rasterized("sites", np.size(positions[0])))
 
-    if cmap == 'auto':
-        cmap = ['#377ec8', '#ff7f00', '#41ae76', '#e41a1c',
-                '#984ea3', '#ffff00', '#a65628', '#f781bf']
-    elif cmap == 'pairs':
-        cmap = ['#a6cee3', '#1f78b4', '#b2df8a', '#33a02c', '#fb9a99', '#e31a1c',
-                '#fdbf6f', '#ff7f00', '#cab2d6', '#6a3d9a']
+    cmap = _site_cmap(cmap)
 
-    # create colormap from discrete colors
+    # create colormap from discrete colors: the unique values are found once per `data`
     if isinstance(cmap, (list, tuple)):
-        kwargs['cmap'], kwargs['norm'] = pltutils.direct_cmap_norm(data, cmap, blend)
+        unique_data = _cache.get([data], 'unique', lambda: parallel.unique(data))
+        kwargs['cmap'], kwargs['norm'] = pltutils.direct_cmap_norm(unique_data, cmap, blend)
     else:
         kwargs['cmap'] = cmap
 
@@ -139,19 +234,20 @@ def plot_sites(positions, data, radius=0.025, offset=(0, 0, 0), blend=1.0,
     # create array of (x, y) points
     points = np.array(positions[:2]).T + offset[:2]
 
-    ax = plt.gca()
+    ax = pltutils._gca(ax)
     if ax.name != '3d':
         # sort based on z position to get proper 2D z-order
-        z = positions[2]
-        if len(np.unique(z)) > 1:
-            idx = z.argsort()
+        z = np.asarray(positions[2])
+        idx = _cache.get([z], 'depth_order', lambda: _depth_order(z))
+        if idx is not None:
             if not np.isscalar(radius):
-                radius = radius[idx]
-            points, data = points[idx], data[idx]
+                radius = parallel.take(radius, idx)
+            points, data = parallel.take(points, idx), parallel.take(data, idx)
 
         from .detail.collections import CircleCollection
         col = CircleCollection(radius, offsets=points, transOffset=ax.transData, **kwargs)
         col.set_array(data)
+        col.site_index = idx  # maps collection order back to `positions`, `None` if unchanged
 
         ax.add_collection(col)
         ax.autoscale_view()
@@ -166,9 +262,7 @@ def plot_sites(positions, data, radius=0.025, offset=(0, 0, 0), blend=1.0,
                 radius_scale = np.clip(2 - scale, 0.85, 1.3)
                 col.radius = radius_scale * np.atleast_1d(radius)
 
-        dynamic_scale(ax)
-        ax.callbacks.connect('xlim_changed', dynamic_scale)
-        ax.callbacks.connect('ylim_changed', dynamic_scale)
+        _connect_dynamic_scale(ax, col, dynamic_scale, 'sites' if blend == 1 else 'static')
     else:
         from .detail.collections import Circle3DCollection
         col = Circle3DCollection(radius / 8, offsets=points, transOffset=ax.transData, **kwargs)
@@ -184,18 +278,139 @@ def plot_sites(positions, data, radius=0.025, offset=(0, 0, 0), blend=1.0,
     return col
 
 
+def _single_direction_mask(row, col, data, check=True):
+    """Mask which drops the `row > col` entries of bonds stored in both directions
+
+    If `check` is false, the matrix is assumed to be symmetric. Otherwise, an entry (i, j)
+    with i > j is only dropped if the mirror entry (j, i) exists with the same data.
+
+    >>> row, col = np.array([0, 1, 1, 2]), np.array([1, 0, 2, 1])
+    >>> _single_direction_mask(row, col, data=np.array([0, 0, 0, 1])).tolist()
+    [True, False, True, True]
+    """
+    upper = row <= col
+    if not check:
+        return upper
+
+    size = max(row.max(), col.max()) + 1
+    keys = row.astype(np.int64) * size + col
+    mirror_keys = col.astype(np.int64) * size + row
+
+    order = keys.argsort()
+    found = order[np.minimum(np.searchsorted(keys, mirror_keys, sorter=order), keys.size - 1)]
+    has_mirror = np.logical_and(keys[found] == mirror_keys, data[found] == data)
+    return np.logical_or(upper, np.logical_not(has_mirror))
+
+
+def _merge_polylines(from_idx, to_idx, hop_ids):
+    """Decompose the bonds of each hopping ID into trails and return them as polylines
+
+    Bond direction is ignored. At every site, the unused bond ends of the same ID are
+    paired up, so a trail continues through sites of any degree and only ends at sites
+    with an odd number of bonds. Ends are paired with the neighbor at the mirrored index
+    distance first, which continues straight lines on regularly numbered lattices.
+    Closed trails are cut at their lowest bond end. All passes are vectorized: trails are
+    ranked by pointer jumping, so there are only O(log L) passes for trails of length L.
+
+    Returns
+    -------
+    vertices : np.ndarray
+        Site indices of all polylines, concatenated.
+    lengths : np.ndarray
+        Number of vertices in each polyline.
+    ids : np.ndarray
+        Hopping ID of each polyline.
+
+    Examples
+    --------
+    >>> vertices, lengths, ids = _merge_polylines(np.array([1, 1, 3, 3]), np.array([0, 2, 2, 4]),
+    ...                                           np.array([0, 0, 0, 1]))
+    >>> vertices.tolist(), lengths.tolist(), ids.tolist()
+    ([0, 1, 2, 3, 3, 4], [4, 2], [0, 1])
+    >>> vertices, lengths, _ = _merge_polylines(np.array([0, 1, 1, 1]), np.array([1, 2, 3, 4]),
+    ...                                         np.zeros(4, dtype=int))
+    >>> vertices.tolist(), lengths.tolist()
+    ([0, 1, 2, 3, 1, 4], [3, 3])
+    """
+    num_edges = from_idx.size
+    num_ends = 2 * num_edges
+    _, id_idx = np.unique(hop_ids, return_inverse=True)
+
+    # bond end `h` belongs to bond `h // 2` and the other end of the bond is `h ^ 1`
+    site = np.empty(num_ends, dtype=np.int64)
+    site[0::2], site[1::2] = from_idx, to_idx
+    distance = site[np.arange(num_ends) ^ 1] - site
+    end_id = np.repeat(id_idx, 2)
+
+    # pair up consecutive ends at each (site, ID) -- self-loops stay on their own
+    candidates = np.flatnonzero(distance != 0)
+    order = candidates[np.lexsort((distance[candidates], np.abs(distance[candidates]),
+                                   end_id[candidates], site[candidates]))]
+    group = np.concatenate([[True], np.logical_or(site[order[1:]] != site[order[:-1]],
+                                                  end_id[order[1:]] != end_id[order[:-1]])])
+    group_start = np.maximum.accumulate(np.where(group, np.arange(order.size), 0))
+    is_first = (np.arange(order.size) - group_start) % 2 == 0
+    has_pair = np.append(np.logical_and(is_first[:-1], np.logical_not(group[1:])), False)
+    partner = np.full(num_ends, -1, dtype=np.int64)
+    first_ends, second_ends = order[has_pair], order[np.roll(has_pair, 1)]
+    partner[first_ends], partner[second_ends] = second_ends, first_ends
+
+    # a trail enters a bond through end `h`, leaves through `h ^ 1` and enters the next
+    # bond through the end paired with it
+    next_end = partner[np.arange(num_ends) ^ 1]
+
+    # find the lowest end of each closed trail and cut the trail before it
+    lowest = np.arange(num_ends)
+    step = np.where(next_end >= 0, next_end, lowest)
+    is_open = next_end < 0
+    for _ in range(int(np.ceil(np.log2(max(num_ends, 2)))) + 1):
+        lowest = np.minimum(lowest, lowest[step])
+        is_open = np.logical_or(is_open, is_open[step])
+        jump = step[step]
+        if np.array_equal(jump, step):
+            break  # only open trails which have all converged to their last end
+        step = jump
+    next_end[np.logical_and(np.logical_not(is_open), next_end == lowest)] = -1
+
+    # rank each end within its trail: `first` converges to the first end of the trail
+    linked = np.flatnonzero(next_end >= 0)
+    first = np.arange(num_ends)
+    first[next_end[linked]] = linked
+    rank = (first != np.arange(num_ends)).astype(np.int64)
+    while True:
+        step = first[first]
+        if np.array_equal(step, first):
+            break
+        rank += rank[first]
+        first = step
+
+    # every trail was found in both directions, keep the one which starts at a lower end
+    kept = np.flatnonzero(first < first[np.arange(num_ends) ^ 1])
+    kept = kept[np.lexsort((rank[kept], first[kept]))]
+    starts = rank[kept] == 0
+    trail = np.cumsum(starts) - 1
+
+    vertices = np.empty(num_edges + trail[-1] + 1, dtype=site.dtype)
+    vertices[np.arange(num_edges) + trail + 1] = site[kept ^ 1]
+    vertices[np.flatnonzero(starts) + trail[starts]] = site[kept[starts]]
+    lengths = np.bincount(trail) + 1
+    return vertices.astype(np.result_type(from_idx, to_idx)), lengths, hop_ids[kept[starts] // 2]
+
+
 def plot_hoppings(positions, hoppings, width=1.0, offset=(0, 0, 0), blend=1.0, color='#666666',
-                  axes='xyz', boundary=(), draw_only=(), **kwargs):
+                  axes='xyz', boundary=(), draw_only=(), symmetric=False, merge_lines=False,
+                  ax=None, **kwargs):
     """Plot lines between lattice sites at `positions` based on the `hoppings` matrix
 
     Parameters
     ----------
     positions : Tuple[array_like, array_like, array_like]
         Site coordinates in the form of an (x, y, z) tuple of 1D arrays.
-    hoppings : :class:`~scipy.sparse.coo_matrix`
-        Sparse matrix with the hopping data, usually :attr:`System.hoppings`.
-        The `row` and `col` indices of the sparse matrix are used to draw lines between
-        lattice sites, while `data` determines the color.
+    hoppings : Union[:class:`~scipy.sparse.spmatrix`, Tuple[array_like, array_like, array_like]]
+        Sparse matrix with the hopping data, usually :attr:`System.hoppings`, or its
+        `(row, col, data)` arrays. The `row` and `col` indices are used to draw lines
+        between lattice sites, while `data` determines the color. Matrices which are not
+        in COO format are converted only once.
     width : float
         Width of the hopping plot lines.
     offset : Tuple[float, float, float]
@@ -211,61 +426,102 @@ def plot_hoppings(positions, hoppings, width=1.0, offset=(0, 0, 0), blend=1.0, c
         If given, apply the boundary (sign, shift).
     draw_only : Iterable[str]
         Only draw lines for the hoppings named in this list.
+    symmetric : Union[bool, str]
+        Draw a single line for bonds which are stored in both directions, (i, j) and (j, i).
+        If `True`, the matrix is assumed to be symmetric and only the `i <= j` entries are
+        drawn. With 'auto', an (i, j) entry is skipped only if the mirrored (j, i) entry
+        exists with the same hopping ID. The result is computed once per `hoppings`.
+        Not applied to `boundary` hoppings: both directions are distinct bonds.
+    merge_lines : bool
+        Join bonds of the same hopping ID into continuous polylines, regardless of their
+        direction. This greatly reduces the number of paths sent to the renderer.
+        The polylines are computed once per `hoppings`. Not applied to `boundary`.
+    ax : Optional[plt.Axes]
+        Defaults to the active axes. The global pyplot state isn't used if it's given.
     **kwargs
-        Forwarded to :class:`matplotlib.collections.LineCollection`.
+        Forwarded to :class:`matplotlib.collections.LineCollection`. Collections with
+        more lines than `tbplot.rasterize.hoppings` (see :data:`.rc`) are rasterized in
+        vector output unless `rasterized` is given explicitly.
 
     Returns
     -------
     :class:`matplotlib.collections.LineCollection`
     """
-    if width == 0 or hoppings.data.size == 0:
+    triplets = _as_triplets(hoppings)
+    from_idx, to_idx, hop_ids = triplets
+    if width == 0 or hop_ids.size == 0:
         return
 
-    kwargs = with_defaults(kwargs, zorder=-1)
+    kwargs = with_defaults(kwargs, zorder=-1,
+                           rasterized=_is_rasterized("hoppings", hop_ids.size))
 
-    cmap = kwargs.get('cmap', [color])
-    if cmap == 'auto':
-        cmap = ['#666666', '#1b9e77', '#e6ab02', '#7570b3', '#e7298a', '#66a61e', '#a6761d']
+    cmap = _hopping_cmap(kwargs.get('cmap', [color]))
 
     # create colormap from discrete colors
     if isinstance(cmap, (list, tuple)):
-        unique_hop_ids = np.arange(hoppings.data.max() + 1)
+        unique_hop_ids = np.arange(hop_ids.max() + 1)
         kwargs['cmap'], kwargs['norm'] = pltutils.direct_cmap_norm(unique_hop_ids, cmap, blend)
     else:
         kwargs['cmap'] = cmap
 
     rotate = functools.partial(_rotate, axes=axes)
     positions, offset = map(rotate, (positions, offset))
-    hoppings = hoppings.tocoo()
+    from_idx, to_idx, hop_ids = _select_hoppings(triplets, symmetric and not boundary, draw_only)
+
+    ax = pltutils._gca(ax)
+    ndims = 3 if ax.name == '3d' else 2
+    pos = np.array(positions[:ndims]).T + np.array(offset[:ndims])
+
+    if merge_lines and not boundary and hop_ids.size > 0:
+        vertices, lengths, hop_ids = _cache.get(
+            triplets, ('polylines', symmetric, tuple(draw_only)),
+            lambda: _merge_polylines(from_idx, to_idx, hop_ids)
+        )
+        lines = np.split(pos[vertices], np.cumsum(lengths)[:-1])
+    else:
+        lines = np.stack([parallel.take(pos, from_idx), parallel.take(pos, to_idx)], axis=1)
+        if boundary:
+            sign, shift = boundary
+            shift = rotate(shift)[:ndims]
+            if sign > 0:
+                lines[:, 0] += shift
+            else:
+                lines[:, 1] -= shift
+
+    return _add_hopping_collection(ax, lines, width, (pos.min(axis=0), pos.max(axis=0)),
+                                   kwargs, hop_ids=hop_ids)
+
+
+def _select_hoppings(triplets, symmetric=False, draw_only=()):
+    """Return the (row, col, data) triplets which should be drawn, see :func:`plot_hoppings`"""
+    from_idx, to_idx, hop_ids = triplets
+
+    # draw a single line for bonds which are stored in both directions
+    if symmetric:
+        check = symmetric == 'auto'
+        keep = _cache.get(triplets, ('single_direction', check),
+                          lambda: _single_direction_mask(from_idx, to_idx, hop_ids, check))
+        from_idx, to_idx, hop_ids = from_idx[keep], to_idx[keep], hop_ids[keep]
 
     # leave only the desired hoppings
     if draw_only:
-        keep = np.zeros_like(hoppings.data, dtype=np.bool)
+        keep = np.zeros_like(hop_ids, dtype=np.bool)
         for hop_id in draw_only:
-            keep = np.logical_or(keep, hoppings.data == hop_id)
-        hoppings.data = hoppings.data[keep]
-        hoppings.col = hoppings.col[keep]
-        hoppings.row = hoppings.row[keep]
+            keep = np.logical_or(keep, hop_ids == hop_id)
+        from_idx, to_idx, hop_ids = from_idx[keep], to_idx[keep], hop_ids[keep]
 
-    ax = plt.gca()
-    ndims = 3 if ax.name == '3d' else 2
-    pos = np.array(positions[:ndims]).T + np.array(offset[:ndims])
+    return from_idx, to_idx, hop_ids
 
-    if not boundary:
-        lines = ((pos[i], pos[j]) for i, j in zip(hoppings.row, hoppings.col))
-    else:
-        sign, shift = boundary
-        shift = rotate(shift)[:ndims]
-        if sign > 0:
-            lines = ((pos[i] + shift, pos[j]) for i, j in zip(hoppings.row, hoppings.col))
-        else:
-            lines = ((pos[i], pos[j] - shift) for i, j in zip(hoppings.row, hoppings.col))
-
-    if ndims == 2:
+
+def _add_hopping_collection(ax, lines, width, bounds, kwargs, hop_ids=None, colors=None):
+    """Add a (2D or 3D) collection of hopping `lines` colored by `hop_ids` or `colors`
+
+    The `bounds` are the (min, max) corners of the plotted structure, used for 3D scaling.
+    """
+    if ax.name != '3d':
         from matplotlib.collections import LineCollection
 
         col = LineCollection(lines, **kwargs)
-        col.set_array(hoppings.data)
         ax.add_collection(col)
         ax.autoscale_view()
 
@@ -275,21 +531,21 @@ def plot_hoppings(positions, hoppings, width=1.0, offset=(0, 0, 0), blend=1.0, c
             scale = np.clip(scale, 0.6, 1.2)  # don't make the line too thin or thick
             col.set_linewidth(scale * width)
 
-        dynamic_scale(ax)
-        ax.callbacks.connect('xlim_changed', dynamic_scale)
-        ax.callbacks.connect('ylim_changed', dynamic_scale)
+        _connect_dynamic_scale(ax, col, dynamic_scale, 'static')
     else:
         from mpl_toolkits.mplot3d.art3d import Line3DCollection
 
         had_data = ax.has_data()
         col = Line3DCollection(list(lines), lw=width, **kwargs)
-        col.set_array(hoppings.data)
         ax.add_collection3d(col)
 
         ax.set_zmargin(0.5)
-        minmax = np.vstack((pos.min(axis=0), pos.max(axis=0))).T
-        ax.auto_scale_xyz(*minmax, had_data=had_data)
+        ax.auto_scale_xyz(*np.vstack(bounds).T, had_data=had_data)
 
+    if colors is not None:
+        col.set_color(colors)
+    else:
+        col.set_array(hop_ids)
     return col
 
 
@@ -313,10 +569,9 @@ def plot_periodic_boundaries(positions, hoppings, boundaries, data, num_periods=
     ----------
     positions : Tuple[array_like, array_like, array_like]
         Site coordinates in the form of an (x, y, z) tuple of 1D arrays.
-    hoppings : :class:`~scipy.sparse.coo_matrix`
-        Sparse matrix with the hopping data, usually :meth:`System.hoppings`.
-        The `row` and `col` indices of the sparse matrix are used to draw lines between
-        lattice sites, while `data` determines the color.
+    hoppings : Union[:class:`~scipy.sparse.spmatrix`, Tuple[array_like, array_like, array_like]]
+        Sparse matrix with the hopping data, usually :meth:`System.hoppings`, or its
+        `(row, col, data)` arrays, see :func:`plot_hoppings`.
     boundaries : List[Boundary]
         Periodic boundaries of a :class:`System`.
     data : array_like
@@ -324,52 +579,307 @@ def plot_periodic_boundaries(positions, hoppings, boundaries, data, num_periods=
     num_periods : int
         Number of times to repeat the periodic boundaries.
     **kwargs
-        Additional plot arguments as specified in :func:`.structure_plot_properties`.
+        Additional plot arguments as specified in :func:`.structure_plot_properties`,
+        including the target `ax`.
     """
     props = structure_plot_properties(**kwargs)
+    layout = _periodic_layout(boundaries, num_periods)
+    _plot_periodic_layout(positions, hoppings, data, layout, props)
+
+
+def _periodic_layout(boundaries, num_periods):
+    """Offsets of the periodic images: they don't depend on the view or the data
+
+    The shift combinations are computed once per set of boundary shifts and `num_periods`.
+
+    Returns
+    -------
+    Tuple[tuple, tuple]
+        The (shift, blend) of each unit cell image and the combinations of boundary
+        hoppings: (boundaries, shifts, signs, boundary indices, blends) as arrays.
+    """
+    units, combinations = _cache.get([b.shift for b in boundaries],
+                                     ('periodic_layout', num_periods),
+                                     lambda: _make_periodic_layout(boundaries, num_periods))
+    return units, (boundaries,) + combinations
+
 
+def _make_periodic_layout(boundaries, num_periods):
+    """See :func:`_periodic_layout`: the arrays are read-only because they are shared"""
     # the periodic parts will fade out gradually at each level of repetition
     blend_gradient = np.linspace(0.5, 0.15, num_periods)
 
     # periodic unit cells
-    for level, blend in enumerate(blend_gradient, start=1):
-        shift_set = _make_shift_set(boundaries, level)
-        for shift in shift_set:
-            plot_sites(positions, data, offset=shift, blend=blend, **props['site'])
-            plot_hoppings(positions, hoppings, offset=shift, blend=blend, **props['hopping'])
+    units = tuple((shift, blend)
+                  for level, blend in enumerate(blend_gradient, start=1)
+                  for shift in _make_shift_set(boundaries, level))
 
     # periodic boundary hoppings
-    for level, blend in enumerate(blend_gradient, start=1):
-        shift_set = _make_shift_set(boundaries, level)
-        prev_shift_set = _make_shift_set(boundaries, level - 1)
-        boundary_set = itertools.product(shift_set + prev_shift_set, (1, -1), boundaries)
+    combinations = [_boundary_combinations(boundaries, level) + (blend,)
+                    for level, blend in enumerate(blend_gradient, start=1)]
+    if not combinations:  # num_periods == 0
+        arrays = np.zeros((0, 3)), np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    else:
+        arrays = tuple(np.concatenate([c[i] for c in combinations]) for i in range(3))
+        arrays += (np.concatenate([np.full(c[0].shape[0], c[3]) for c in combinations]),)
+    for array in arrays + tuple(shift for shift, _ in units):
+        array.setflags(write=False)
+    return units, arrays
+
+
+def _boundary_combinations(boundaries, level):
+    """All (shift, sign, boundary index) combinations which connect `level` to `level - 1`
+
+    A combination is valid if `shift + sign * boundary.shift` lands on an image of the
+    previous level. Equivalent to a loop over the product of the candidate shifts, signs
+    and boundaries (in the same order), but done as a single array operation.
+    """
+    prev_shift_set = _make_shift_set(boundaries, level - 1)
+    candidates = _make_shift_set(boundaries, level) + prev_shift_set
+    shifts = np.array(candidates.data, dtype=float).reshape(-1, 3)
+    prev = np.array(prev_shift_set.data, dtype=float).reshape(-1, 3)
+    boundary_shifts = np.array([b.shift for b in boundaries], dtype=float).reshape(-1, 3)
+    signs = np.array([1, -1])
+
+    # shape: (num_shifts, num_signs, num_boundaries, num_prev, 3)
+    targets = shifts[:, None, None] + signs[:, None, None] * boundary_shifts
+    tolerance = prev_shift_set.atol + prev_shift_set.rtol * np.abs(prev)
+    close = np.abs(targets[..., None, :] - prev) <= tolerance
+    shift_idx, sign_idx, which = np.nonzero(close.all(axis=-1).any(axis=-1))
+    return shifts[shift_idx], signs[sign_idx], which
+
+
+def _plot_periodic_layout(positions, hoppings, data, layout, props,
+                          layers=('sites', 'hoppings')):
+    """Plot the periodic images described by :func:`_periodic_layout`
+
+    Only the given `layers` are plotted. Returns the new collections.
+    """
+    units, boundary_hoppings = layout
+    collections = []
+    for shift, blend in units:
+        if 'sites' in layers:
+            collections.append(plot_sites(positions, data, offset=shift,
+                                          blend=blend, **props['site']))
+        if 'hoppings' in layers:
+            collections.append(plot_hoppings(positions, hoppings, offset=shift, blend=blend,
+                                             **props['hopping']))
+
+    if 'hoppings' in layers:
+        collections.append(_plot_boundary_hoppings(positions, boundary_hoppings,
+                                                   **props['boundary']))
+    return [c for c in collections if c is not None]
+
+
+def _plot_boundary_hoppings(positions, combinations, width=1.0, color='#666666', axes='xyz',
+                            draw_only=(), symmetric=False, merge_lines=False, ax=None,
+                            **kwargs):
+    """Plot the boundary hoppings of all periodic images as a single collection
+
+    Same result as a :func:`plot_hoppings` call with `boundary=(sign, shift)` for each of
+    the (shift, sign, boundary, blend) `combinations` from :func:`_periodic_layout`, but
+    the segments are generated by broadcasting each boundary's hoppings over all of its
+    shifts at once. Discrete colors are resolved per segment so the blending of each
+    level is kept. A continuous `cmap` is normalized over all the boundary hoppings.
+    """
+    if width == 0:
+        return
+
+    cmap = _hopping_cmap(kwargs.pop('cmap', [color]))
+    ax = pltutils._gca(ax)
+    segments = _boundary_segments(positions, combinations, cmap, axes,
+                                  ndims=3 if ax.name == '3d' else 2, draw_only=draw_only)
+    if segments is None:
+        return
+
+    lines, hop_ids, colors, bounds = segments
+    if colors is None:
+        kwargs['cmap'] = cmap
+    kwargs = with_defaults(kwargs, zorder=-1, rasterized=_is_rasterized("hoppings", hop_ids.size))
+    return _add_hopping_collection(ax, lines, width, bounds, kwargs, hop_ids, colors)
 
-        for shift, sign, boundary in boundary_set:
-            if (shift + sign * boundary.shift) not in prev_shift_set:
-                continue  # skip existing
 
-            plot_hoppings(positions, boundary.hoppings.tocoo(), offset=shift, blend=blend,
-                          boundary=(sign, boundary.shift), **props['boundary'])
+def _boundary_segments(positions, combinations, cmap, axes='xyz', ndims=2, draw_only=()):
+    """Line segments of the boundary hoppings for all the periodic `combinations`
+
+    Returns
+    -------
+    Optional[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], tuple]]
+        The (num_lines, 2, ndims) segments, their hopping IDs, their RGBA colors for a
+        discrete `cmap` (`None` otherwise) and the (min, max) bounds of all the images.
+        `None` if there is nothing to draw.
+    """
+    boundaries, shifts, signs, which, blends = combinations
+    if shifts.shape[0] == 0:
+        return None
+    discrete = isinstance(cmap, (list, tuple))
+
+    rotate = functools.partial(_rotate, axes=axes)
+    pos = np.array(rotate(positions)[:ndims]).T
+    # same permutation of the coordinates as `_rotate`, applied to all shifts at once
+    offsets = np.array(rotate(tuple(shifts.T))[:ndims]).T
+
+    lines, hop_ids, colors, order = [], [], [], []
+    for n, boundary in enumerate(boundaries):
+        combo = np.flatnonzero(which == n)
+        from_idx, to_idx, ids = _as_triplets(boundary.hoppings)
+        if combo.size == 0 or ids.size == 0:
+            continue
+
+        if discrete:
+            unique_hop_ids = np.arange(ids.max() + 1)
+        if draw_only:
+            keep = np.isin(ids, list(draw_only))
+            from_idx, to_idx, ids = from_idx[keep], to_idx[keep], ids[keep]
+            if ids.size == 0:
+                continue
+
+        segments = np.stack([parallel.take(pos, from_idx), parallel.take(pos, to_idx)], axis=1)
+        boundary_shift = np.array(rotate(boundary.shift)[:ndims], dtype=float)
+        start = offsets[combo] + (signs[combo] > 0)[:, None] * boundary_shift
+        end = offsets[combo] - (signs[combo] < 0)[:, None] * boundary_shift
+        combo_offsets = np.stack([start, end], axis=1)  # shape: (num_combos, 2, ndims)
+        lines.append((segments[None] + combo_offsets[:, None]).reshape(-1, 2, ndims))
+        hop_ids.append(np.tile(ids, combo.size))
+        order.append(np.repeat(combo, ids.size))
+
+        if discrete:
+            unique_blends, inverse = np.unique(blends[combo], return_inverse=True)
+            palette = []
+            for blend in unique_blends:
+                cm, norm = pltutils.direct_cmap_norm(unique_hop_ids, cmap, blend)
+                palette.append(cm(norm(ids)))
+            colors.append(np.array(palette)[inverse].reshape(-1, 4))
+
+    if not lines:
+        return None
+
+    # draw in the same order as one call per combination would
+    order = np.argsort(np.concatenate(order), kind='mergesort')
+    lines = np.concatenate(lines)[order]
+    hop_ids = np.concatenate(hop_ids)[order]
+    colors = np.concatenate(colors)[order] if discrete else None
+    bounds = pos.min(axis=0) + offsets.min(axis=0), pos.max(axis=0) + offsets.max(axis=0)
+    return lines, hop_ids, colors, bounds
+
+
+class StructureBuilder:
+    """Collect sites and hoppings which arrive in chunks and plot them as single collections
+
+    Chunks are appended to growable buffers, so the data is never concatenated from a
+    list of parts. For the 2D z-order, each chunk is sorted on its own and the sorted
+    runs are merged instead of sorting all the sites at once.
 
+    Parameters
+    ----------
+    num_sites, num_hoppings : int
+        Expected totals which are preallocated. The buffers grow as needed.
+
+    Examples
+    --------
+    >>> builder = StructureBuilder()
+    >>> builder.extend(sites=[((np.arange(3), np.zeros(3), np.arange(3)), np.zeros(3)),
+    ...                       ((np.arange(3), np.ones(3), np.arange(3) - 1), np.ones(3))],
+    ...                hoppings=[(np.arange(2), np.arange(1, 3), np.zeros(2))])
+    >>> builder.num_sites, builder.hoppings.nnz
+    (6, 2)
+    >>> builder.z_order().tolist()
+    [3, 0, 4, 1, 5, 2]
+    """
 
-def plot_site_indices(system):
+    def __init__(self, num_sites=1024, num_hoppings=1024):
+        self._positions = GrowableArray(float, 3, num_sites)
+        self._data = None  # the dtype is taken from the first chunk
+        self._num_sites = num_sites
+        self._hoppings = GrowableArray(np.int64, 3, num_hoppings)
+
+    @property
+    def num_sites(self) -> int:
+        return len(self._positions)
+
+    @property
+    def positions(self):
+        """Site positions as an (x, y, z) tuple of array views"""
+        xyz = self._positions.view
+        return xyz[:, 0], xyz[:, 1], xyz[:, 2]
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data.view if self._data is not None else np.empty(0)
+
+    @property
+    def hoppings(self):
+        """Sparse matrix of all the hoppings added so far"""
+        from scipy.sparse import coo_matrix
+        row, col, ids = self._hoppings.view.T
+        return coo_matrix((ids, (row, col)), shape=(self.num_sites,) * 2)
+
+    def add_sites(self, positions, data):
+        """Append a chunk of sites: an (x, y, z) tuple of 1D arrays and their data"""
+        data = np.asarray(data)
+        if self._data is None:
+            self._data = GrowableArray(data.dtype, None, self._num_sites)
+        self._data.append(data)
+        self._positions.append(np.column_stack(positions))
+
+    def add_hoppings(self, row, col, ids):
+        """Append a chunk of hoppings: global site indices and hopping IDs"""
+        self._hoppings.append(np.column_stack([row, col, ids]))
+
+    def extend(self, sites=(), hoppings=()):
+        """Consume iterables of `(positions, data)` and `(row, col, ids)` chunks"""
+        for positions, data in sites:
+            self.add_sites(positions, data)
+        for row, col, ids in hoppings:
+            self.add_hoppings(row, col, ids)
+
+    def z_order(self, axes='xyz'):
+        """Site order from back to front along the axis perpendicular to `axes`"""
+        z = _rotate(self.positions, axes)[2]
+        return parallel.argsort(z, self._positions.runs)
+
+    def plot_sites(self, axes='xyz', **kwargs):
+        """Plot all the sites as a single collection, see :func:`plot_sites`
+
+        The `site_index` of the returned collection maps back to the order of addition.
+        """
+        if pltutils._gca(kwargs.get('ax')).name == '3d':
+            return plot_sites(self.positions, self.data, axes=axes, **kwargs)
+
+        idx = self.z_order(axes)
+        if not np.isscalar(kwargs.get('radius', 0)):
+            kwargs['radius'] = np.asarray(kwargs['radius'])[idx]
+        col = plot_sites(tuple(parallel.take(v, idx) for v in self.positions),
+                         parallel.take(self.data, idx), axes=axes, **kwargs)
+        if col is not None:
+            col.site_index = idx
+        return col
+
+    def plot_hoppings(self, axes='xyz', **kwargs):
+        """Plot all the hoppings as a single collection, see :func:`plot_hoppings`"""
+        return plot_hoppings(self.positions, self.hoppings, axes=axes, **kwargs)
+
+
+def plot_site_indices(system, ax=None):
     """Show the Hamiltonian index next to each atom (mainly for debugging)
 
     Parameters
     ----------
     system : System
+    ax : Optional[plt.Axes]
     """
     for i, xy in enumerate(zip(system.x, system.y)):
-        pltutils.annotate_box(i, xy)
+        pltutils.annotate_box(i, xy, ax=ax)
 
 
-def plot_hopping_values(system, lattice):
+def plot_hopping_values(system, lattice, ax=None):
     """Show the hopping energy over each hopping line (mainly for debugging)
 
     Parameters
     ----------
     system : System
     lattice : Lattice
+    ax : Optional[plt.Axes]
     """
     pos = system.xyz[:, :2]
 
@@ -378,9 +888,11 @@ def plot_hopping_values(system, lattice):
         return t.real if t.imag == 0 else t
 
     for i, j, k in system.hoppings.triplets():
-        pltutils.annotate_box(get_energy(k), (pos[i] + pos[j]) / 2)
+        pltutils.annotate_box(get_energy(k), (pos[i] + pos[j]) / 2, ax=ax)
 
     for boundary in system.boundaries:
         for i, j, k in boundary.hoppings.triplets():
-            pltutils.annotate_box(get_energy(k), (pos[i] + pos[j] + boundary.shift[:2]) / 2)
-            pltutils.annotate_box(get_energy(k), (pos[i] + pos[j] - boundary.shift[:2]) / 2)
+            pltutils.annotate_box(get_energy(k), (pos[i] + pos[j] + boundary.shift[:2]) / 2,
+                                  ax=ax)
+            pltutils.annotate_box(get_energy(k), (pos[i] + pos[j] - boundary.shift[:2]) / 2,
+                                  ax=ax)
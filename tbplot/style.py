@@ -7,7 +7,7 @@ import matplotlib.style as mpl_style
 from .pltutils import get_palette
 from .detail.utils import with_defaults
 
-__all__ = ["use_style", "tbplot_style"]
+__all__ = ["use_style", "tbplot_style", "rc", "rc_defaults"]
 
 
 def _make_style():
@@ -56,8 +56,39 @@ def _make_style():
     return with_defaults(style, defaults)
 
 
+def _make_rc_defaults():
+    """Settings specific to tbplot, these are not known to matplotlib"""
+    return {
+        # Site and hopping collections with more elements than these thresholds are
+        # rasterized at the savefig DPI in vector output (pdf, svg). `None` disables it.
+        "tbplot.rasterize.sites": 20000,
+        "tbplot.rasterize.hoppings": 20000,
+        # Threads used to sort and gather the site and hopping arrays before plotting.
+        # `None` uses all the cores. Smaller arrays are always handled in one thread.
+        "tbplot.threads": 1,
+        "tbplot.threads.min_size": 100000,
+        # Limits for the estimated cost of a plot, see :mod:`tbplot.budget`: the transient
+        # memory in bytes and the plot and draw time in seconds. `None` means no limit.
+        # The policy for plots over budget: 'warn', 'raise', 'degrade' or `None` (ignore).
+        "tbplot.budget.memory": 2 * 2**30,
+        "tbplot.budget.seconds": None,
+        "tbplot.budget.policy": "warn",
+    }
+
+
+def _split_style(style):
+    """Split a style dict into matplotlib rc params and tbplot specific settings"""
+    mpl_part = {k: v for k, v in style.items() if not k.startswith("tbplot.")}
+    tbplot_part = {k: v for k, v in style.items() if k.startswith("tbplot.")}
+    return mpl_part, tbplot_part
+
+
 tbplot_style = _make_style()
 
+# The default and the active tbplot specific settings (`tbplot.*` keys)
+rc_defaults = _make_rc_defaults()
+rc = dict(rc_defaults)
+
 
 def _is_jupyter_notebook():
     """Detect if this is being executed inside of a notebook"""
@@ -88,8 +119,14 @@ def use_style(style=tbplot_style):
     Parameters
     ----------
     style : dict
-        A matplotlib style specification.
+        A matplotlib style specification. Any `tbplot.*` keys are applied to :data:`rc`.
+        The default style also restores :data:`rc` to :data:`rc_defaults`.
     """
+    if style is tbplot_style:
+        rc.update(rc_defaults)
+    if hasattr(style, "keys"):
+        style, tbplot_part = _split_style(style)
+        rc.update(tbplot_part)
     mpl_style.use(style)
 
     # The style shouldn't override inline backend settings
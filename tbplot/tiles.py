@@ -0,0 +1,366 @@
+"""Render very large structures as a pyramid of image tiles
+
+The finest zoom level is rendered with :func:`.plot_sites` and :func:`.plot_hoppings`
+in parallel worker processes, each tile receiving only the sites and hoppings within
+its bounds. Coarser levels are aggregated by downsampling the tiles of the level below.
+Tiles are stored as `directory/z/x/y.png` and can be browsed with the generated
+`index.html` viewer.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+
+import numpy as np
+import matplotlib as mpl
+from scipy.sparse import coo_matrix
+
+from . import pltutils
+from .detail.utils import with_defaults, stable_json
+
+__all__ = ['render_tiles']
+
+# Bump when the tile layout or the metadata changes in an incompatible way
+_FORMAT_VERSION = 2
+
+
+class _GridIndex:
+    """Spatial index: item indices sorted by the grid cell which contains them
+
+    Cells are numbered row by row, starting from the top left corner of the grid.
+    """
+
+    def __init__(self, x, y, origin, cell_size, num_cells):
+        ix = np.clip(np.floor((x - origin[0]) / cell_size), 0, num_cells - 1).astype(np.int64)
+        iy = np.clip(np.floor((origin[1] - y) / cell_size), 0, num_cells - 1).astype(np.int64)
+        keys = iy * num_cells + ix
+        self.order = np.argsort(keys, kind='mergesort')
+        self.bounds = np.searchsorted(keys[self.order], np.arange(num_cells ** 2 + 1))
+        self.num_cells = num_cells
+
+    def query(self, ix, iy, radius=0):
+        """Indices of the items in cell (ix, iy) and its neighbors within `radius` cells"""
+        n = self.num_cells
+        x0, x1 = max(ix - radius, 0), min(ix + radius, n - 1)
+        rows = range(max(iy - radius, 0), min(iy + radius, n - 1) + 1)
+        return np.concatenate([self.order[self.bounds[r * n + x0]:self.bounds[r * n + x1 + 1]]
+                               for r in rows])
+
+
+def _touched_cells(x0, x1, y0, y1, origin, cell_size, num_cells):
+    """Keys of the grid cells (see :class:`_GridIndex`) which overlap any of the boxes"""
+    def cell(v, start, sign):
+        index = np.floor(sign * (v - start) / cell_size)
+        return np.clip(index, 0, num_cells - 1).astype(np.int64)
+
+    ix0, ix1 = cell(x0, origin[0], 1), cell(x1, origin[0], 1)
+    iy0, iy1 = cell(y1, origin[1], -1), cell(y0, origin[1], -1)  # rows start at the top
+    keys = [np.zeros(0, dtype=np.int64)]
+    for dx in range(int((ix1 - ix0).max()) + 1 if ix0.size else 0):
+        for dy in range(int((iy1 - iy0).max()) + 1):
+            inside = (ix0 + dx <= ix1) & (iy0 + dy <= iy1)
+            keys.append(((iy0 + dy) * num_cells + ix0 + dx)[inside])
+    return np.unique(np.concatenate(keys))
+
+
+def _tile_path(directory, level, ix, iy):
+    return os.path.join(directory, str(level), str(ix), "{}.png".format(iy))
+
+
+def _write_png(path, rgba):
+    """Atomically write an RGBA float image: an interrupted run never leaves partial tiles"""
+    import matplotlib.image
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with mpl.rc_context({"savefig.bbox": "standard"}):
+        matplotlib.image.imsave(tmp_path, rgba, format="png")
+    os.replace(tmp_path, path)
+
+
+def _downsample(children, tile_size):
+    """Merge 2x2 child tiles (None if empty) into one tile of the same pixel size"""
+    import matplotlib.image
+
+    canvas = np.zeros((2 * tile_size, 2 * tile_size, 4), dtype=np.float32)
+    for (dx, dy), path in children:
+        if path:
+            image = matplotlib.image.imread(path)
+            canvas[dy * tile_size:(dy + 1) * tile_size, dx * tile_size:(dx + 1) * tile_size] = image
+
+    # average with premultiplied alpha so that empty pixels don't darken the edges
+    canvas[..., :3] *= canvas[..., 3:]
+    canvas = canvas.reshape(tile_size, 2, tile_size, 2, 4).mean(axis=(1, 3))
+    alpha = canvas[..., 3:]
+    canvas[..., :3] = np.divide(canvas[..., :3], alpha, out=np.zeros_like(canvas[..., :3]),
+                                where=alpha > 0)
+    return canvas
+
+
+_worker = {}  # per process rendering state, see :func:`_init_worker`
+
+
+def _init_worker(state):
+    _worker.update(state)
+
+
+def _render_tile(job):
+    """Render a single tile of the finest level, return its path or `None` if it's empty"""
+    ix, iy = job
+    s = _worker
+    path = _tile_path(s["directory"], s["max_level"], ix, iy)
+    if os.path.exists(path):
+        return path
+
+    sites = s["site_index"].query(ix, iy, s["margin_cells"])
+    if sites.size == 0:
+        return None
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from .structure import plot_sites, plot_hoppings
+
+    positions, data = s["positions"], s["data"]
+    local = sites
+    local_hoppings = None
+    if s["hoppings"] is not None:
+        from_idx, to_idx, hop_ids = s["hoppings"]
+        bonds = s["hopping_index"].query(ix, iy, s["margin_cells"])
+        local = np.union1d(sites, np.concatenate([from_idx[bonds], to_idx[bonds]]))
+        local_hoppings = coo_matrix((hop_ids[bonds], (np.searchsorted(local, from_idx[bonds]),
+                                                      np.searchsorted(local, to_idx[bonds]))),
+                                    shape=(local.size, local.size))
+    local_positions = tuple(v[local] for v in positions)
+
+    tile_size, dpi = s["tile_size"], s["dpi"]
+    with mpl.rc_context({"savefig.bbox": "standard"}):
+        # a standalone figure: not registered with pyplot, so nothing to close
+        fig = Figure(figsize=(tile_size / dpi, tile_size / dpi), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        if local_hoppings is not None and local_hoppings.nnz > 0:
+            plot_hoppings(local_positions, local_hoppings, **dict(s["hopping"], ax=ax))
+        plot_sites(local_positions, data[local], **dict(s["site"], ax=ax))
+
+        x0, y0 = s["origin"]
+        width = s["tile_width"]
+        ax.set_xlim(x0 + ix * width, x0 + (ix + 1) * width)
+        ax.set_ylim(y0 - (iy + 1) * width, y0 - iy * width)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        fig.savefig(tmp_path, format="png", dpi=dpi, transparent=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _aggregate_tile(job):
+    """Build a tile of a coarse level from its 4 children, `None` if they're all empty"""
+    directory, level, ix, iy, tile_size = job
+    path = _tile_path(directory, level, ix, iy)
+    if os.path.exists(path):
+        return path
+
+    children = [((dx, dy), _tile_path(directory, level + 1, 2 * ix + dx, 2 * iy + dy))
+                for dx in (0, 1) for dy in (0, 1)]
+    children = [(d, p if os.path.exists(p) else None) for d, p in children]
+    if not any(p for _, p in children):
+        return None
+
+    _write_png(path, _downsample(children, tile_size))
+    return path
+
+
+_viewer_html = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>tbplot tiles</title>
+<style>html, body, #map {{margin: 0; width: 100%; height: 100%; overflow: hidden;
+  background: white; cursor: move}} img {{position: absolute; image-rendering: auto}}</style>
+</head><body><div id="map"></div><script>
+var maxLevel = {max_level}, tileSize = {tile_size};
+var map = document.getElementById("map"), tiles = {{}};
+var zoom = 0, cx = tileSize / 2, cy = tileSize / 2;  // view center in level 0 pixels
+
+function draw() {{
+  var level = Math.max(0, Math.min(maxLevel, Math.floor(zoom)));
+  var scale = Math.pow(2, zoom - level), size = tileSize * scale, n = Math.pow(2, level);
+  var w = map.clientWidth, h = map.clientHeight;
+  var left = cx * Math.pow(2, zoom) - w / 2, top = cy * Math.pow(2, zoom) - h / 2;
+  var visible = {{}};
+  for (var x = Math.max(0, Math.floor(left / size)); x < Math.min(n, (left + w) / size); ++x) {{
+    for (var y = Math.max(0, Math.floor(top / size)); y < Math.min(n, (top + h) / size); ++y) {{
+      var key = level + "/" + x + "/" + y, img = tiles[key];
+      if (!img) {{
+        img = tiles[key] = document.createElement("img");
+        img.onerror = function() {{ this.style.visibility = "hidden"; }};
+        img.src = key + ".png";
+        img.draggable = false;
+      }}
+      img.style.left = (x * size - left) + "px"; img.style.top = (y * size - top) + "px";
+      img.style.width = img.style.height = size + "px";
+      if (!img.parentNode) map.appendChild(img);
+      visible[key] = true;
+    }}
+  }}
+  for (var k in tiles) if (!visible[k] && tiles[k].parentNode) map.removeChild(tiles[k]);
+}}
+
+map.addEventListener("wheel", function(e) {{
+  e.preventDefault();
+  var s = Math.pow(2, zoom), mx = e.clientX - map.clientWidth / 2;
+  var my = e.clientY - map.clientHeight / 2;
+  var px = cx + mx / s, py = cy + my / s;
+  zoom = Math.max(0, Math.min(maxLevel + 3, zoom - e.deltaY * 0.002));
+  s = Math.pow(2, zoom); cx = px - mx / s; cy = py - my / s;
+  draw();
+}});
+var drag = null;
+map.addEventListener("mousedown", function(e) {{ drag = [e.clientX, e.clientY]; }});
+window.addEventListener("mouseup", function() {{ drag = null; }});
+window.addEventListener("mousemove", function(e) {{
+  if (!drag) return;
+  var s = Math.pow(2, zoom);
+  cx -= (e.clientX - drag[0]) / s; cy -= (e.clientY - drag[1]) / s;
+  drag = [e.clientX, e.clientY];
+  draw();
+}});
+window.addEventListener("resize", draw);
+draw();
+</script></body></html>
+"""
+
+
+def render_tiles(smap, directory, max_level=None, tile_size=256, sites_per_tile=5000,
+                 num_workers=None, dpi=100, cmap="YlGnBu", site=None, hopping=None):
+    """Render a z/x/y pyramid of PNG tiles for browsing a huge structure at any zoom level
+
+    Interrupted runs can be resumed by calling this function again with the same
+    arguments: existing tiles are kept and only the missing ones are rendered. Resuming
+    with a different map or styling is an error.
+
+    Parameters
+    ----------
+    smap : Union[SpatialMap, StructureMap]
+        The sites are colored by :attr:`~.SpatialMap.data`. Hoppings are drawn if present.
+    directory : str
+        Output directory for the tiles, `metadata.json` and the `index.html` viewer.
+    max_level : Optional[int]
+        The finest zoom level with `4**max_level` tiles. By default, it's chosen so that
+        each tile contains about `sites_per_tile` sites.
+    tile_size : int
+        Width and height of the tiles in pixels.
+    sites_per_tile : int
+        Used to choose the default `max_level`.
+    num_workers : Optional[int]
+        Number of worker processes. Defaults to the number of CPUs. With 1, the tiles
+        are rendered in the calling process.
+    dpi : float
+        Resolution used to convert line widths and other sizes given in points.
+    cmap : Union[str, List[str]]
+        Colormap for the site data. A list of discrete colors is applied consistently
+        across all tiles, see :func:`.plot_sites`.
+    site, hopping : dict
+        Additional arguments forwarded to :func:`.plot_sites` and :func:`.plot_hoppings`.
+
+    Returns
+    -------
+    str
+        Path of the `index.html` viewer.
+    """
+    x, y = np.asarray(smap.x), np.asarray(smap.y)
+    data = np.asarray(smap.data)
+    site = with_defaults(site, radius=0.025, axes="xyz")
+    hopping = with_defaults(hopping, width=1.0, color="#bbbbbb", axes="xyz")
+
+    # the same colormap and normalization for every tile
+    if isinstance(cmap, (list, tuple)):
+        site["cmap"], site["norm"] = pltutils.direct_cmap_norm(data, cmap)
+    else:
+        from matplotlib.colors import Normalize
+        site["cmap"] = cmap
+        site["norm"] = Normalize(data.min(), data.max())
+
+    hoppings = getattr(smap, "hoppings", None)
+    if hoppings is not None:
+        from .structure import _as_triplets
+        hoppings = _as_triplets(hoppings)
+        from_idx, to_idx, _ = hoppings
+        bond_length = np.hypot(x[to_idx] - x[from_idx], y[to_idx] - y[from_idx])
+        max_bond = bond_length.max() if bond_length.size else 0
+    else:
+        max_bond = 0
+
+    # square grid which covers all sites
+    margin = 2 * np.max(site["radius"])
+    side = max(x.max() - x.min(), y.max() - y.min()) + 2 * margin
+    origin = (x.min() - margin, y.max() + margin)  # top left corner
+    if max_level is None:
+        max_level = max(0, int(math.ceil(math.log(max(data.size / sites_per_tile, 1), 4))))
+    num_cells = 2 ** max_level
+    tile_width = side / num_cells
+
+    # everything which changes the pixels: resuming must not mix differently styled tiles
+    parameters = [dpi, site, hopping, smap.positions, data, hoppings]
+    metadata = dict(format_version=_FORMAT_VERSION, max_level=max_level, tile_size=tile_size,
+                    extent=[origin[0], origin[0] + side, origin[1] - side, origin[1]],
+                    num_sites=int(data.size), parameters=hashlib.sha1(json.dumps(
+                        parameters, sort_keys=True, default=stable_json).encode()).hexdigest())
+    os.makedirs(directory, exist_ok=True)
+    metadata_path = os.path.join(directory, "metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as file:
+            if json.load(file) != metadata:
+                raise RuntimeError("Can't resume: '{}' contains tiles rendered with different "
+                                   "parameters".format(directory))
+    else:
+        with open(metadata_path, "w") as file:
+            json.dump(metadata, file)
+
+    state = dict(directory=directory, max_level=max_level, tile_size=tile_size, dpi=dpi,
+                 origin=origin, tile_width=tile_width, site=site, hopping=hopping,
+                 positions=tuple(np.asarray(v) for v in smap.positions), data=data,
+                 hoppings=hoppings, margin_cells=int(math.ceil((max_bond + margin) / tile_width)),
+                 site_index=_GridIndex(x, y, origin, tile_width, num_cells))
+    if hoppings is not None:
+        state["hopping_index"] = _GridIndex(x[hoppings[0]], y[hoppings[0]], origin,
+                                            tile_width, num_cells)
+
+    # only tiles which are touched by a site circle or a hopping line need to be rendered
+    occupied = _touched_cells(x - margin, x + margin, y - margin, y + margin,
+                              origin, tile_width, num_cells)
+    if hoppings is not None:
+        xs, ys = (np.stack([v[hoppings[0]], v[hoppings[1]]]) for v in (x, y))
+        occupied = np.union1d(occupied, _touched_cells(
+            xs.min(axis=0) - margin, xs.max(axis=0) + margin,
+            ys.min(axis=0) - margin, ys.max(axis=0) + margin, origin, tile_width, num_cells))
+    jobs = [(int(k % num_cells), int(k // num_cells)) for k in occupied]
+
+    if num_workers == 1:
+        _init_worker(state)
+        rendered = [_render_tile(job) for job in jobs]
+        for level in reversed(range(max_level)):
+            jobs = _aggregate_jobs(directory, level, rendered, tile_size)
+            rendered = [_aggregate_tile(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(num_workers, _init_worker, (state,)) as pool:
+            chunksize = max(1, len(jobs) // (4 * (num_workers or os.cpu_count() or 1)))
+            rendered = list(pool.imap_unordered(_render_tile, jobs, chunksize))
+            for level in reversed(range(max_level)):
+                jobs = _aggregate_jobs(directory, level, rendered, tile_size)
+                rendered = list(pool.imap_unordered(_aggregate_tile, jobs, chunksize))
+
+    viewer_path = os.path.join(directory, "index.html")
+    with open(viewer_path, "w") as file:
+        file.write(_viewer_html.format(max_level=max_level, tile_size=tile_size))
+    return viewer_path
+
+
+def _aggregate_jobs(directory, level, child_paths, tile_size):
+    """Parent tiles at `level` of the non-empty tiles rendered at `level + 1`"""
+    parents = set()
+    for path in filter(None, child_paths):
+        ix = int(os.path.basename(os.path.dirname(path)))
+        iy = int(os.path.splitext(os.path.basename(path))[0])
+        parents.add((ix // 2, iy // 2))
+    return [(directory, level, ix, iy, tile_size) for ix, iy in sorted(parents)]
@@ -2,7 +2,29 @@ import pytest
 from .utils.compare_figures import AssertFigure
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup("tbplot", "figure performance baselines")
+    group.addoption("--perf-factor", type=float, default=3.0,
+                    help="Allowed ratio of figure render time and peak memory to the "
+                         "values in baseline_plots/performance.json (default: 3.0)")
+    group.addoption("--perf-action", choices=["warn", "fail", "ignore"], default="warn",
+                    help="What to do when a figure exceeds its performance baseline")
+    group.addoption("--perf-update", action="store_true",
+                    help="Record the measurements as the new performance baseline instead "
+                         "of checking them. Nothing is written without this option.")
+    group.addoption("--perf-memory", action="store_true",
+                    help="Trace the peak memory of each figure with tracemalloc (slow)")
+
+
 @pytest.fixture
 def assert_figure(request):
     """Compare a figure to a baseline image"""
     return AssertFigure(request)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_call(item):
+    """Fail the test if any of its figures, compared in the background, don't match"""
+    assert_figure = getattr(item, "funcargs", {}).get("assert_figure")
+    if assert_figure is not None:
+        assert_figure.wait()
@@ -0,0 +1,153 @@
+import warnings
+
+import pytest
+import numpy as np
+import scipy.sparse
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+import tbplot
+from tbplot.render import render
+from tbplot.results import StructureMap, Boundary
+
+
+@pytest.fixture
+def smap():
+    side = 10
+    x, y = (v.ravel() * 0.1 for v in np.meshgrid(np.arange(side), np.arange(side)))
+    idx = np.arange(x.size)
+    keep = idx % side != side - 1
+    rows = np.concatenate([idx[keep], idx[:-side]])
+    cols = np.concatenate([idx[keep] + 1, idx[side:]])
+    hoppings = scipy.sparse.coo_matrix((rows % 2, (rows, cols)), shape=(x.size, x.size))
+    edge = np.arange(side) * side
+    boundary = scipy.sparse.coo_matrix((np.zeros(side), (edge + side - 1, edge)),
+                                       shape=(x.size, x.size))
+    return StructureMap(np.linspace(0, 1, x.size), (x, y, np.zeros_like(x)), idx % 2,
+                        hoppings, [Boundary([side * 0.1, 0, 0], boundary)])
+
+
+def test_estimate_system(smap):
+    from tbplot.detail.collections import CircleCollection
+
+    cost = tbplot.estimate_system(smap, num_periods=2)
+    plt.figure()
+    tbplot.plot_system(smap, num_periods=2)
+    collections = plt.gca().collections
+    plt.close()
+    lines = [c for c in collections if isinstance(c, LineCollection)]
+    circles = [c for c in collections if isinstance(c, CircleCollection)]
+
+    assert cost.num_artists == len(collections) == 11  # 1 + 4 images and the boundaries
+    assert cost.num_sites == sum(len(c.get_offsets()) for c in circles) == 500
+    assert cost.num_hoppings == sum(len(c.get_paths()) for c in lines) == 940
+    assert cost.memory > tbplot.estimate_system(smap, hoppings=False).memory > 0
+
+    with_leads = tbplot.estimate_system(smap, num_periods=2, leads=[smap], lead_length=3)
+    assert with_leads.num_sites == cost.num_sites + 3 * smap.num_sites
+    assert tbplot.estimate_map(smap, decimate="mean").memory < tbplot.estimate_map(smap).memory
+
+    vector = tbplot.estimate_system(smap, num_periods=2, format="svg")
+    assert vector.memory > tbplot.estimate_system(smap, num_periods=2, format="svg",
+                                                  rasterized=True).memory == cost.memory
+    assert tbplot.estimate_system(smap, num_views=3) == tuple(3 * v for v in
+                                                            tbplot.estimate_system(smap))
+
+    # computed once for the estimate and the plot
+    from tbplot.structure import _periodic_layout
+    assert _periodic_layout(smap.boundaries, 2)[0] is _periodic_layout(smap.boundaries, 2)[0]
+
+
+def test_budget_policy(monkeypatch, smap):
+    full = tbplot.estimate_system(smap, num_periods=2)
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory", full.memory - 1)
+
+    def num_collections(plot, **kwargs):
+        plt.figure()
+        plot(smap, **kwargs)
+        count = len(plt.gca().collections) + len(plt.gca().images)
+        plt.close()
+        return count
+
+    with pytest.warns(UserWarning, match="tbplot.budget.memory"):
+        assert num_collections(tbplot.plot_system, num_periods=2) == full.num_artists
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "raise")
+    with pytest.raises(RuntimeError):
+        tbplot.plot_system(smap, num_periods=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert num_collections(tbplot.plot_system, num_periods=1) == 7
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "degrade")
+    with pytest.warns(UserWarning, match="num_periods=1"):
+        assert num_collections(tbplot.plot_system, num_periods=2) == 7
+    with pytest.warns(UserWarning, match="num_periods=1"):
+        assert num_collections(StructureMap.plot, num_periods=2) == 7
+
+    sites_only = tbplot.estimate_system(smap, num_periods=0, hoppings=False)
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory", sites_only.memory)
+    with pytest.warns(UserWarning, match="only the sites"):
+        assert num_collections(tbplot.plot_system, num_periods=2) == 1
+
+    spatial_map = smap.spatial_map
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory",
+                        tbplot.estimate_map(spatial_map, decimate="mean").memory)
+    with pytest.warns(UserWarning, match="decimated"):
+        image = spatial_map.plot_pcolor()
+        assert image.get_array().ndim == 2
+        plt.close()
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory", sites_only.memory - 1)
+    with pytest.raises(RuntimeError):
+        spatial_map.plot_pcolor()
+    with pytest.raises(RuntimeError):
+        tbplot.plot_system(smap)
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", None)
+    assert num_collections(tbplot.plot_system) == full.num_artists - 4
+
+
+def test_budget_with_leads(monkeypatch, smap):
+    full = tbplot.estimate_system(smap, leads=[smap, smap], lead_length=3)
+    system = tbplot.estimate_system(smap)
+    lead = tbplot.estimate_system(smap, num_periods=0, leads=[smap], lead_length=3)
+    assert max(system.memory, lead.memory) < full.memory - 1  # each part fits on its own
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory", full.memory - 1)
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "raise")
+    with pytest.raises(RuntimeError, match="plot_system_with_leads"):
+        tbplot.plot_system_with_leads(smap, [smap, smap], lead_length=3)
+    plt.close("all")
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "degrade")
+    with pytest.warns(UserWarning, match="lead_length=2"):
+        plt.figure()
+        tbplot.plot_system_with_leads(smap, [smap, smap], lead_length=3)
+        num_collections = len(plt.gca().collections)
+        plt.close()
+    assert num_collections == tbplot.estimate_system(smap, leads=[smap, smap],
+                                                     lead_length=2).num_artists
+
+
+def test_budget_rasterize(monkeypatch, smap):
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "degrade")
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.memory",
+                        tbplot.estimate_system(smap, num_periods=2).memory)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        render(smap, dict(plot="system", num_periods=2), "png")
+    with pytest.warns(UserWarning, match="plotting rasterized collections instead"):
+        render(smap, dict(plot="system", num_periods=2), "svg")
+
+    with plt.rc_context({"savefig.format": "pdf"}), pytest.warns(UserWarning):
+        plt.figure()
+        tbplot.plot_system(smap, num_periods=2)
+        collections = plt.gca().collections
+        plt.close()
+    assert len(collections) == 11 and all(c.get_rasterized() for c in collections)
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.budget.policy", "raise")
+    with pytest.raises(RuntimeError, match="plot_system_views"):
+        tbplot.plot_system_views(smap, views=("xy", "xz"), num_periods=2)
+    plt.close("all")
@@ -0,0 +1,70 @@
+import re
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+import numpy as np
+import scipy.sparse
+
+import tbplot
+from tbplot.results import StructureMap, Boundary
+
+
+@pytest.fixture
+def smap():
+    side = 6
+    x, y = (v.ravel() * 0.1 for v in np.meshgrid(np.arange(side), np.arange(side)))
+    idx = np.arange(x.size)
+    keep = idx % side != side - 1
+    rows = np.concatenate([idx[keep], idx[:-side]])
+    cols = np.concatenate([idx[keep] + 1, idx[side:]])
+    hoppings = scipy.sparse.coo_matrix((rows % 2, (rows, cols)), shape=(x.size, x.size))
+    edge = np.arange(side) * side
+    boundary = scipy.sparse.coo_matrix((np.zeros(side), (edge + side - 1, edge)),
+                                       shape=(x.size, x.size))
+    return StructureMap(np.linspace(0, 1, x.size), (x, y, np.zeros_like(x)), idx % 2,
+                        hoppings, [Boundary([side * 0.1, 0, 0], boundary)])
+
+
+def test_export_svg(tmpdir, smap):
+    file = str(tmpdir.join("structure.svg"))
+    tbplot.export_system(smap, file, num_periods=2)
+
+    svg = "{http://www.w3.org/2000/svg}"
+    root = ElementTree.parse(file).getroot()
+    uses = root.findall(".//{}use".format(svg))
+    assert len(root.findall(".//{}symbol".format(svg))) == 1
+    assert len(uses) == smap.positions.x.size * 5  # the unit cell and 4 periodic images
+    assert len({u.get("class") for u in uses}) == 6  # 2 sublattices x 3 blend levels
+
+    paths = root.findall(".//{}path".format(svg))
+    num_segments = sum(p.get("d").count("M") for p in paths)
+    num_boundary = 6 * 4  # boundary hoppings x (shift, sign) combinations: 2 per level
+    assert num_segments == smap.hoppings.nnz * 5 + num_boundary
+
+
+def test_export_pdf(tmpdir, smap):
+    file = str(tmpdir.join("structure.pdf"))
+    smap.export(file, chunk_size=7)
+    with open(file, "rb") as f:
+        pdf = f.read()
+
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    offsets = re.findall(rb"(\d{10}) 00000 n", pdf[xref:])
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset):].startswith("{} 0 obj".format(number).encode())
+
+    start = pdf.index(b"stream\n") + len(b"stream\n")
+    content = zlib.decompress(pdf[start:pdf.index(b"\nendstream", start)])
+    assert content.count(b" Do Q") == smap.positions.x.size * 3  # with 2 periodic images
+    # one circle per distinct radius and color: the radius follows the data
+    num_forms = len(re.findall(rb"/Subtype /Form", pdf))
+    assert smap.positions.x.size <= num_forms <= 2 * smap.positions.x.size
+
+
+def test_export_format(tmpdir, smap):
+    with pytest.raises(RuntimeError):
+        tbplot.export_system(smap, str(tmpdir.join("structure.png")))
+    with pytest.raises(RuntimeError):
+        tbplot.export_system(smap, str(tmpdir.join("structure")))
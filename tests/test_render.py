@@ -0,0 +1,159 @@
+import os
+
+import pytest
+import numpy as np
+import scipy.sparse
+
+from tbplot.render import render
+from tbplot.results import StructureMap, Boundary, load_map
+from tbplot.__main__ import main
+
+
+@pytest.fixture
+def smap():
+    x, y = (v.ravel() * 0.1 for v in np.meshgrid(np.arange(4), np.arange(4)))
+    size = x.size
+    hoppings = scipy.sparse.coo_matrix((np.zeros(size - 1), (np.arange(size - 1),
+                                                             np.arange(1, size))),
+                                       shape=(size, size))
+    return StructureMap(np.linspace(0, 1, size), (x, y, np.zeros(size)), np.arange(size) % 2,
+                        hoppings, [Boundary([0.4, 0, 0], hoppings)])
+
+
+def test_render(smap):
+    png = render(smap, dict(num_periods=2, figsize=(2, 2)))
+    assert png.startswith(b"\x89PNG")
+    assert render(smap, dict(plot="system", site_radius=0.02), "svg").startswith(b"<?xml")
+    assert render(smap.spatial_map, format="pdf").startswith(b"%PDF")
+    with pytest.raises(RuntimeError):
+        render(smap, dict(plot="nonexistent"))
+
+
+def test_cli(tmpdir, capsys, smap):
+    for name in ("a", "b"):
+        smap.save(str(tmpdir.join(name + ".npz")))
+    assert isinstance(load_map(str(tmpdir.join("a.npz"))), StructureMap)
+    assert not isinstance(load_map(str(tmpdir.join("a.npz"))).spatial_map, StructureMap)
+
+    out = str(tmpdir.join("out"))
+    args = [str(tmpdir.join("*.npz")), "-o", out, "-j", "1", "--num-periods", "2",
+            "--style", "figure.figsize=(2, 2)"]
+    assert main(args) == 0
+    assert sorted(os.listdir(out)) == ["a.png", "b.png"]
+    assert "2 rendered, 0 skipped, 0 failed" in capsys.readouterr().out
+
+    assert main(args) == 0  # up to date
+    assert "0 rendered, 2 skipped, 0 failed" in capsys.readouterr().out
+
+    assert main(args + ["--force", "--plot", "nonexistent"]) == 1
+    assert "0 rendered, 0 skipped, 2 failed" in capsys.readouterr().out
+
+
+def test_render_context(smap):
+    import matplotlib.pyplot as plt
+    from tbplot.render import RenderContext
+
+    with RenderContext(size=1, trace_memory=True) as context:
+        first = context.render(smap, dict(num_periods=2))
+        figure = context._idle[0]
+        ax = figure.axes[0]
+        assert not ax.collections and not ax.callbacks.callbacks.get("xlim_changed")
+
+        context.render(smap.spatial_map, dict(figsize=(2, 1)))  # adds a colorbar
+        assert context._idle == [figure] and figure.axes == [ax]
+        assert tuple(figure.get_size_inches()) != (2, 1)
+        same_as_new_figure = context.render(smap, dict(num_periods=2)) == first
+        assert same_as_new_figure
+
+        assert len(context.stats) == 3
+        assert all(s.seconds > 0 and s.peak_allocated > 0 for s in context.stats)
+    assert not plt.fignum_exists(figure.number)
+
+
+def test_render_cache(tmpdir, monkeypatch, smap):
+    import matplotlib.pyplot as plt
+    from tbplot.render import RenderCache
+
+    cache = RenderCache(str(tmpdir), max_size=10**6)
+    spec = dict(num_periods=2, figsize=(2, 2))
+    png = render(smap, spec, cache=cache)
+    assert len(cache.entries()) == 1
+
+    def no_figures(*args, **kwargs):
+        raise AssertionError("a cache hit should not plot")
+
+    with monkeypatch.context() as m:
+        m.setattr(plt, "figure", no_figures)
+        same_as_rendered = render(smap, spec, cache=cache) == png
+        assert same_as_rendered
+        changed = StructureMap(smap.data[::-1], smap.positions, smap.sublattices,
+                               smap.hoppings, smap.boundaries)
+        for key in [cache.key(changed, spec, "png"), cache.key(smap, spec, "pdf"),
+                    cache.key(smap, dict(spec, style={"figure.dpi": 50}), "png")]:
+            assert key != cache.key(smap, spec, "png") and cache.load(key) is None
+
+    # objects in the spec are keyed by their parameters, not by their address
+    from matplotlib.colors import Normalize
+    keys = {cache.key(smap, dict(spec, norm=Normalize(0, v), cmap=plt.get_cmap("Reds")), "png")
+            for v in [1, 1, 2]}
+    assert len(keys) == 2
+    with pytest.raises(RuntimeError):
+        cache.key(smap, dict(spec, norm=object()), "png")
+
+    cache.max_size = len(render(smap, spec, "svg")) + 1  # only room for the newest entry
+    render(smap, spec, "svg", cache=cache)
+    assert [os.path.splitext(p)[0] for *_, p in cache.entries()] == [
+        os.path.join(str(tmpdir), cache.key(smap, spec, "svg"))]
+    cache.clear()
+    assert not cache.entries()
+
+
+def test_render_async(smap):
+    import asyncio
+    from tbplot.render import AsyncRenderer
+
+    expected = render(smap, dict(num_periods=2))
+
+    async def idle(renderer):
+        while renderer.num_running:  # the slots are freed by callbacks from the executor
+            await asyncio.sleep(0.01)
+
+    async def main(renderer):
+        results = await asyncio.gather(*[renderer.render(smap, dict(num_periods=2))
+                                         for _ in range(3)])
+        await idle(renderer)
+
+        # 1 running + 2 pending: the queue is full
+        overflow = await asyncio.gather(*[renderer.render(smap) for _ in range(4)],
+                                        return_exceptions=True)
+        assert sum(isinstance(r, RuntimeError) for r in overflow) == 1
+
+        with pytest.raises(asyncio.TimeoutError):
+            await renderer.render(smap, timeout=0)
+        await idle(renderer)  # an abandoned job holds its slot until it's done
+        return results
+
+    loop = asyncio.new_event_loop()
+    try:
+        for kind in ["thread", "process"]:
+            renderer = AsyncRenderer(max_workers=1, kind=kind, max_pending=2)
+            results = loop.run_until_complete(main(renderer))
+            renderer.close()
+            same_as_render = all(r == expected for r in results)
+            assert same_as_render
+    finally:
+        loop.close()
+
+
+def test_render_threads(smap):
+    from concurrent.futures import ThreadPoolExecutor
+    from tbplot.render import _render_in_thread
+
+    specs = [dict(num_periods=2), dict(plot="system", style={"lines.linewidth": 3}),
+             dict(plot="plot_contourf")] * 3
+    expected = [render(smap, spec) for spec in specs]
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda spec: _render_in_thread(smap, spec, "png", None),
+                                    specs))
+    same_as_sequential = results == expected
+    assert same_as_sequential
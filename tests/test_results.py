@@ -0,0 +1,182 @@
+import pytest
+
+import numpy as np
+import scipy.sparse
+
+from tbplot.results import SpatialMap, StructureMap, Boundary
+
+
+@pytest.fixture
+def smap():
+    size = 6
+    x = np.arange(size, dtype=float)
+    positions = x, np.zeros(size), np.zeros(size)
+    row = np.arange(size - 1)
+    hoppings = scipy.sparse.coo_matrix((np.zeros(size - 1), (row, row + 1)), shape=(size, size))
+    edge = scipy.sparse.coo_matrix(([1], ([size - 1], [0])), shape=(size, size))
+    boundaries = [Boundary([size, 0, 0], edge)]
+    return StructureMap(x ** 2, positions, x % 2, hoppings.tocsr(), boundaries)
+
+
+def assert_same_structure(a, b):
+    assert type(a) is type(b)
+    for name in ["data", "x", "y", "z", "sublattices"]:
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    assert (a.hoppings != b.hoppings).nnz == 0
+    assert len(a.boundaries) == len(b.boundaries)
+    for x, y in zip(a.boundaries, b.boundaries):
+        np.testing.assert_array_equal(x.shift, y.shift)
+        assert (x.hoppings != y.hoppings).nnz == 0
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+def test_save_load(tmpdir, smap, compressed):
+    file = str(tmpdir.join("smap.npz" if compressed else "smap"))
+    smap.save(file, compressed)
+
+    loaded = StructureMap.load(file, mmap=not compressed)
+    assert_same_structure(smap, loaded)
+    assert_same_structure(smap.cropped(x=[1, 4]), loaded.cropped(x=[1, 4]))
+
+    spatial_map = SpatialMap.load(file)
+    assert type(spatial_map) is SpatialMap
+    np.testing.assert_array_equal(spatial_map.data, smap.data)
+
+
+def test_save_load_exact_path(tmpdir, smap):
+    from tbplot.results import load_map
+
+    file = str(tmpdir.join("smap"))  # no `.npz` extension is added
+    smap.save(file)
+    assert tmpdir.listdir() == [tmpdir.join("smap")]
+    assert_same_structure(smap, StructureMap.load(file))
+    assert_same_structure(smap, load_map(file))
+
+    spatial_file = str(tmpdir.join("spatial.map"))
+    SpatialMap(smap.data, smap.positions, smap.sublattices).save(spatial_file)
+    np.testing.assert_array_equal(SpatialMap.load(spatial_file).data, smap.data)
+
+
+def test_pick(smap):
+    pick = smap.pick(2.1, 0.2)
+    assert pick.index == 2
+    np.testing.assert_array_equal(pick.position, [2, 0, 0])
+    assert pick.data == 4 and pick.sublattice == 0 and pick.hopping is None
+
+    assert smap.pick(2.5, 3, max_distance=1) is None
+    assert smap.pick(3.6, 0.1, hopping=True).hopping == (3, 4, 0)
+
+
+def test_collection_index_at():
+    import matplotlib.pyplot as plt
+    from tbplot import plot_sites
+
+    x = np.array([0.0, 1.0, 2.0])
+    col = plot_sites((x, np.zeros(3), np.array([2.0, 0.0, 1.0])), np.zeros(3), radius=0.3)
+    plt.close()
+
+    assert col.site_index[col.index_at(0.1, 0.1)] == 0
+    assert col.site_index[col.index_at(1.9, -0.1)] == 2
+    assert col.index_at(0.5, 0) is None
+
+
+@pytest.mark.parametrize("statistic", ["mean", "max"])
+def test_plot_decimated(statistic):
+    import matplotlib.pyplot as plt
+    from matplotlib.artist import Artist
+
+    x, y = (v.ravel() for v in np.meshgrid(np.linspace(0, 10, 300), np.linspace(0, 5, 300)))
+    spatial_map = SpatialMap(x * y, (x, y, np.zeros_like(x)))
+
+    figure = plt.figure()
+    try:
+        image = spatial_map.plot_pcolor(decimate=statistic)
+        ax = plt.gca()
+        assert image.get_array().shape[1] <= np.ceil(ax.bbox.width)
+        assert image.get_array().max() <= spatial_map.data.max()
+
+        plt.xlim(2, 3)
+        plt.ylim(2, 3)
+        figure.canvas.draw()  # re-binned on draw, not in the limits callbacks
+        assert image.get_extent() == [2, 3, 2, 3]
+        assert image.get_array().mask.any()  # zoomed in beyond the site density
+        plt.clf()
+
+        contours = spatial_map.plot_contourf(decimate=statistic)
+        plt.xlim(2, 3)
+        figure.canvas.draw()
+        ax = plt.gca()
+        assert ax.collections  # replaced by the contours of the visible part
+        replaced = [contours] if isinstance(contours, Artist) else contours.collections
+        assert not any(artist in ax.collections for artist in replaced)
+    finally:
+        plt.close(figure)
+
+
+def test_reductions():
+    rng = np.random.RandomState(1)
+    x, y = rng.uniform(-5, 5, size=(2, 1000))
+    smap = SpatialMap(x + y, (x, y, np.zeros_like(x)), rng.randint(2, size=x.size))
+
+    binned = smap.binned(2.5)
+    assert binned.num_sites == 16
+    cell = (np.floor(x / 2.5) == 0) & (np.floor(y / 2.5) == 0)
+    center = (binned.x == 1.25) & (binned.y == 1.25)
+    np.testing.assert_allclose(binned.data[center], smap.data[cell].mean())
+    assert smap.binned(2.5, "count").data.sum() == smap.num_sites
+    np.testing.assert_allclose(smap.binned(2.5, "density").data.mean(), 1000 / 100, rtol=0.1)
+
+    by_sublattice = smap.binned(2.5, "sum", by_sublattice=True)
+    assert set(by_sublattice.sublattices) == {0, 1}
+    np.testing.assert_allclose(by_sublattice.data.sum(), smap.data.sum())
+
+    for method, args in [("binned", (1.0,)), ("hexbinned", (1.0,)),
+                         ("radial_average", ([0, 0], 0.5))]:
+        whole = getattr(smap, method)(*args, statistic="max")
+        chunked = getattr(smap, method)(*args, statistic="max", chunk_size=77)
+        np.testing.assert_array_equal(whole.data, chunked.data)
+        np.testing.assert_array_equal(whole.positions, chunked.positions)
+        assert getattr(smap, method)(*args, statistic="count").data.sum() == smap.num_sites
+
+    hexbinned = smap.hexbinned(1.0)
+    distance = np.hypot(hexbinned.x - x[:50, np.newaxis], hexbinned.y - y[:50, np.newaxis])
+    assert np.all(distance.min(axis=1) <= 1 / np.sqrt(3) + 1e-9)
+
+    radial = smap.radial_average([0, 0], 1.0, "count")
+    r = np.hypot(x, y)
+    assert radial.data[radial.x == 0.5] == np.sum(r < 1)
+
+
+def test_plot_cache_structure(smap):
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    def render(**kwargs):
+        fig = plt.figure(figsize=(2, 1), dpi=100)
+        smap.plot(**kwargs)
+        fig.canvas.draw()
+        image = np.frombuffer(fig.canvas.buffer_rgba(), np.uint8).reshape(100, 200, 4) * 1.0
+        num_lines = sum(isinstance(c, LineCollection) for c in plt.gca().collections)
+        num_images = len(plt.gca().images)
+        plt.close()
+        return image, num_lines, num_images
+
+    vector, num_lines, _ = render()
+    first, *_ = render(cache_structure=True)
+    second, cached_lines, cached_images = render(cache_structure=True)
+    assert num_lines > 0 and cached_lines == 0 and cached_images == 1
+    np.testing.assert_array_equal(first, second)
+    assert np.sqrt(np.mean((vector - second) ** 2)) < 10
+
+    # unrelated rc params don't matter, but the boundary shifts do
+    from tbplot.results import _cache
+    num_entries = len(_cache)
+    with plt.rc_context({"font.size": 3, "image.cmap": "gray"}):
+        render(cache_structure=True)
+    assert len(_cache) == num_entries
+
+    smap.boundaries = [Boundary(b.shift * 2, b.hoppings) for b in smap.boundaries]
+    shifted, *_ = render()
+    shifted_cached, *_ = render(cache_structure=True)
+    assert len(_cache) == num_entries + 1
+    assert np.sqrt(np.mean((shifted - shifted_cached) ** 2)) < 10
@@ -0,0 +1,71 @@
+import pickle
+import multiprocessing
+
+import pytest
+import numpy as np
+import scipy.sparse
+
+from tbplot.render import render, AsyncRenderer
+from tbplot.results import StructureMap, Boundary
+from tbplot.shared import share_map, shared_memory
+
+
+@pytest.fixture
+def smap():
+    size = 1000
+    x = np.arange(size, dtype=float) * 0.1
+    hoppings = scipy.sparse.coo_matrix((np.zeros(size - 1), (np.arange(size - 1),
+                                                             np.arange(1, size))),
+                                       shape=(size, size))
+    return StructureMap(x, (x, np.zeros(size), np.zeros(size)), np.arange(size) % 2,
+                        hoppings, [Boundary([size * 0.1, 0, 0], hoppings)])
+
+
+def _summary(handle):
+    attached = handle.attach()
+    return attached.data.sum(), attached.hoppings.nnz, attached.x.flags.owndata
+
+
+@pytest.mark.parametrize("kind", ["shm", "file"])
+def test_share_map(smap, kind):
+    if kind == "shm" and shared_memory is None:
+        pytest.skip("multiprocessing.shared_memory requires Python 3.8")
+
+    with share_map(smap, kind) as handle:
+        attached = handle.attach()
+        np.testing.assert_array_equal(attached.hoppings.row, smap.hoppings.row)
+        np.testing.assert_array_equal(attached.boundaries[0].shift, smap.boundaries[0].shift)
+        assert not attached.x.flags.writeable
+
+        job = handle.with_data(np.ones(smap.num_sites))
+        assert len(pickle.dumps(job)) < smap.data.nbytes + 2000 < len(pickle.dumps(smap))
+        with pytest.raises(RuntimeError):
+            handle.with_data(np.ones(3))
+
+        with multiprocessing.Pool(2) as pool:
+            results = pool.map(_summary, [handle, job])
+        assert results == [(smap.data.sum(), smap.hoppings.nnz, False),
+                           (smap.num_sites, smap.hoppings.nnz, False)]
+
+    with pytest.raises(FileNotFoundError):
+        handle.attach()
+
+
+def test_render_shared(smap):
+    import asyncio
+
+    data = np.linspace(0, 1, smap.num_sites)
+    spec = dict(num_periods=2, figsize=(2, 2))
+    expected = render(StructureMap(data, smap.positions, smap.sublattices, smap.hoppings,
+                                   smap.boundaries), spec)
+
+    loop = asyncio.new_event_loop()
+    renderer = AsyncRenderer(max_workers=1)
+    try:
+        with share_map(smap, "file") as handle:
+            png = loop.run_until_complete(renderer.render(handle.with_data(data), spec))
+    finally:
+        renderer.close()
+        loop.close()
+    same_as_regular_map = png == expected
+    assert same_as_regular_map
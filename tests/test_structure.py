@@ -62,3 +62,358 @@ def test_plot_sites_and_hoppings(assert_figure, sites, hoppings):
         tbplot.plot_sites(positions, data, radius=0.2)
         tbplot.plot_hoppings(positions, graph, width=1)
         plt.axis("equal")
+
+
+def test_rasterize_threshold(monkeypatch, sites, hoppings):
+    positions, data = sites
+    _, graph = hoppings
+
+    monkeypatch.setitem(tbplot.rc, "tbplot.rasterize.sites", data.size - 1)
+    monkeypatch.setitem(tbplot.rc, "tbplot.rasterize.hoppings", None)
+    sites_col = tbplot.plot_sites(positions, data, radius=0.2)
+    hoppings_col = tbplot.plot_hoppings(positions, graph)
+    explicit_col = tbplot.plot_sites(positions, data, radius=0.2, rasterized=False)
+    plt.close()
+
+    assert sites_col.get_rasterized()
+    assert not hoppings_col.get_rasterized()
+    assert not explicit_col.get_rasterized()
+
+
+def test_style_settings(monkeypatch):
+    for key in tbplot.rc_defaults:
+        monkeypatch.setitem(tbplot.rc, key, tbplot.rc[key])
+
+    with plt.style.context(tbplot.tbplot_style):  # no `tbplot.*` keys for matplotlib
+        assert plt.rcParams["font.size"] == tbplot.tbplot_style["font.size"]
+
+    with plt.rc_context():
+        tbplot.use_style({"tbplot.rasterize.sites": 10})
+        assert tbplot.rc["tbplot.rasterize.sites"] == 10
+        tbplot.use_style()
+        assert tbplot.rc == tbplot.rc_defaults
+
+
+@pytest.mark.parametrize("symmetric", [True, "auto"])
+def test_plot_hoppings_symmetric(hoppings, symmetric):
+    positions, graph = hoppings
+    both_directions = scipy.sparse.coo_matrix((np.tile(graph.data, 2),
+                                               (np.append(graph.row, graph.col),
+                                                np.append(graph.col, graph.row))))
+
+    single = tbplot.plot_hoppings(positions, graph)
+    deduplicated = tbplot.plot_hoppings(positions, both_directions, symmetric=symmetric)
+    plt.close()
+
+    assert len(deduplicated.get_segments()) == len(single.get_segments()) == graph.nnz
+
+
+def test_plot_hoppings_merge_lines(hoppings):
+    positions, graph = hoppings
+    rows, cols = shape
+    is_vertical = (graph.col - graph.row) == cols
+    graph = scipy.sparse.coo_matrix((is_vertical.astype(int), (graph.row, graph.col)))
+
+    merged = tbplot.plot_hoppings(positions, graph, merge_lines=True)
+    plt.close()
+
+    paths = merged.get_segments()
+    assert len(paths) == rows + cols
+    assert sum(len(p) - 1 for p in paths) == graph.nnz
+    assert sorted(merged.get_array()) == [0] * rows + [1] * cols
+
+
+def test_plot_hoppings_merge_lines_single_id():
+    size = 30
+    idx = np.arange(size * size).reshape(size, size)
+    from_idx = np.concatenate([idx[:, :-1].ravel(), idx[:-1, :].ravel()])
+    to_idx = np.concatenate([idx[:, 1:].ravel(), idx[1:, :].ravel()])
+    order = np.random.RandomState(0).permutation(from_idx.size)
+    graph = scipy.sparse.coo_matrix((np.zeros(from_idx.size), (from_idx[order], to_idx[order])))
+    x, y = (v.ravel().astype(float) for v in np.meshgrid(np.arange(size), np.arange(size)))
+    positions = x, y, np.zeros(x.size)
+
+    def segments(col):
+        return sorted(tuple(sorted(map(tuple, s))) for p in col.get_segments()
+                      for s in zip(p[:-1], p[1:]))
+
+    single = tbplot.plot_hoppings(positions, graph)
+    merged = tbplot.plot_hoppings(positions, graph, merge_lines=True)
+    plt.close()
+
+    assert len(single.get_segments()) == graph.nnz
+    assert len(merged.get_segments()) < graph.nnz / 10
+    assert segments(merged) == segments(single)
+
+
+def test_interactive_view(sites, hoppings):
+    positions, data = sites
+    _, graph = hoppings
+
+    site_col = tbplot.plot_sites(positions, data, radius=0.2)
+    hop_col = tbplot.plot_hoppings(positions, graph)
+    width = hop_col.get_linewidth()
+
+    view = tbplot.InteractiveView()
+    view.start_gesture()
+    assert view.in_gesture
+    assert not hop_col.get_visible()  # the static layer is replaced by the bitmap
+    assert site_col.get_visible() and site_col.get_animated()  # sites are blitted
+    assert view._preview.get_array()[..., 3].any()
+    assert view._background is not None
+
+    plt.xlim(0, 0.1)  # the dynamic scale callbacks are suspended during the gesture
+    assert np.all(hop_col.get_linewidth() == width)
+
+    view.settle()
+    assert not view.in_gesture
+    assert site_col.get_visible() and hop_col.get_visible()
+    assert not site_col.get_animated()
+    assert np.all(hop_col.get_linewidth() != width)
+    view.disconnect()
+    plt.close()
+
+
+def test_interactive_view_static_cache(monkeypatch, sites, hoppings):
+    from tbplot import interactive
+
+    renders = []
+    original_render = interactive._render_offscreen
+    monkeypatch.setattr(interactive, "_render_offscreen",
+                        lambda *a: renders.append(1) or original_render(*a))
+
+    positions, data = sites
+    _, graph = hoppings
+    tbplot.plot_sites(positions, data, radius=0.2)
+    tbplot.plot_hoppings(positions, graph)
+    view = tbplot.InteractiveView()
+
+    for xlim in [(0, 2), (1, 3), (-1, 5)]:  # the bitmap covers the whole structure
+        view.start_gesture()
+        plt.xlim(*xlim)
+        view._blit()
+        view.settle()
+    assert len(renders) == 1
+
+    plt.gcf().set_size_inches(4, 3)  # resized: the bitmap is rendered again
+    view.start_gesture()
+    view.settle()
+    assert len(renders) == 2
+
+    view.disconnect()
+    plt.close()
+
+
+def test_structure_builder(sites, hoppings):
+    (x, y, _), data = sites
+    _, graph = hoppings
+    z = np.random.RandomState(0).randint(3, size=x.size).astype(float)
+    positions = x, y, z
+
+    builder = tbplot.StructureBuilder(num_sites=4, num_hoppings=4)
+    chunks = [slice(0, 7), slice(7, 8), slice(8, 20), slice(20, None)]
+    builder.extend(sites=(([v[s] for v in positions], data[s]) for s in chunks),
+                   hoppings=((graph.row[s], graph.col[s], graph.data[s]) for s in chunks))
+    assert builder.num_sites == x.size
+    np.testing.assert_array_equal(builder.hoppings.row, graph.row)
+    np.testing.assert_array_equal(builder.hoppings.col, graph.col)
+
+    streamed = builder.plot_sites(radius=0.2)
+    streamed_hoppings = builder.plot_hoppings()
+    plt.close()
+
+    idx = np.argsort(z, kind="mergesort")
+    np.testing.assert_array_equal(streamed.site_index, idx)
+    np.testing.assert_array_equal(streamed.get_offsets(), np.column_stack([x, y])[idx])
+    np.testing.assert_array_equal(streamed.get_array(), data[idx])
+    assert len(streamed_hoppings.get_segments()) == graph.nnz
+
+
+def test_threads(monkeypatch, sites, hoppings):
+    positions, data = sites
+    _, graph = hoppings
+    positions = positions[:2] + (np.random.RandomState(0).randint(4, size=data.size),)
+
+    def plot():
+        site_col = tbplot.plot_sites(positions, data, radius=0.2)
+        hop_col = tbplot.plot_hoppings(positions, graph, boundary=(1, [1, 0, 0]))
+        plt.close()
+        return site_col.get_offsets(), site_col.get_array(), hop_col.get_segments()
+
+    single = plot()
+    monkeypatch.setitem(tbplot.rc, "tbplot.threads", 3)
+    monkeypatch.setitem(tbplot.rc, "tbplot.threads.min_size", 0)
+    threaded = plot()
+
+    for a, b in zip(single, threaded):
+        np.testing.assert_array_equal(a, b)
+
+    from tbplot.detail import parallel
+    keys = np.random.RandomState(1).randint(100, size=1000)
+    np.testing.assert_array_equal(parallel.argsort(keys), np.argsort(keys, kind="mergesort"))
+    np.testing.assert_array_equal(parallel.unique(keys), np.unique(keys))
+
+
+def test_plot_hoppings_any_format(monkeypatch, hoppings):
+    positions, graph = hoppings
+    csr = graph.tocsr()
+    boundaries = [type("Boundary", (), dict(shift=np.array([5, 0, 0]), hoppings=csr))]
+
+    conversions = []
+    original_tocoo = type(csr).tocoo
+    monkeypatch.setattr(type(csr), "tocoo",
+                        lambda self, *a, **kw: conversions.append(1) or original_tocoo(self))
+
+    from_coo = tbplot.plot_hoppings(positions, graph)
+    from_csr = tbplot.plot_hoppings(positions, csr)
+    from_triplets = tbplot.plot_hoppings(positions, (graph.row, graph.col, graph.data))
+    tbplot.plot_periodic_boundaries(positions, csr, boundaries, np.zeros(positions[0].size),
+                                    num_periods=2)
+    plt.close()
+
+    assert len(conversions) == 1
+    for col in (from_csr, from_triplets):
+        np.testing.assert_array_equal(sorted(map(np.ravel, from_coo.get_segments()), key=list),
+                                      sorted(map(np.ravel, col.get_segments()), key=list))
+
+
+def test_plot_system_views(monkeypatch, sites, hoppings):
+    from tbplot.results import StructureMap, Boundary
+    from tbplot.detail import parallel
+
+    (x, y, _), data = sites
+    _, graph = hoppings
+    z = np.random.RandomState(0).randint(3, size=x.size).astype(float)
+    size = x.size
+    graph = scipy.sparse.coo_matrix((graph.data, (graph.row, graph.col)), shape=(size, size))
+    smap = StructureMap(data, (x, y, z), data % 2, graph, [Boundary([5, 0, 0], graph)])
+    views = ["xy", "xz", "yz"]
+    site = dict(radius=np.linspace(0.1, 0.3, size))  # per-site values follow the depth order
+
+    def circles(ax):
+        return [(np.asarray(c.get_offsets()), c.radius)
+                for c in ax.collections if hasattr(c, "site_index")]
+
+    sorts = []
+    original_argsort = parallel.argsort
+    monkeypatch.setattr(parallel, "argsort", lambda *a: sorts.append(1) or original_argsort(*a))
+    axs = tbplot.plot_system_views(smap, views, site=site)
+    together = [circles(ax) for ax in axs]
+    plt.close()
+    assert len(sorts) == len(views)
+
+    separate = []
+    for view in views:
+        plt.figure()
+        tbplot.plot_system(smap, axes=view, site=site)
+        separate.append(circles(plt.gca()))
+        plt.close()
+
+    for a, b in zip(separate, together):
+        assert len(a) == len(b) > 1
+        for (offsets_a, radius_a), (offsets_b, radius_b) in zip(a, b):
+            np.testing.assert_array_equal(offsets_a, offsets_b)
+            np.testing.assert_array_equal(radius_a, radius_b)
+
+
+def test_plot_sites_depth_order_cache(monkeypatch, sites):
+    from tbplot.detail import parallel
+
+    (x, y, _), data = sites
+    z = np.random.RandomState(0).rand(x.size)
+    sorts = []
+    original_argsort = parallel.argsort
+    monkeypatch.setattr(parallel, "argsort", lambda *a: sorts.append(1) or original_argsort(*a))
+
+    collections = [tbplot.plot_sites((x, y, z), data, radius=0.2, offset=(i, 0, 0))
+                   for i in range(3)]
+    assert len(sorts) == 1
+    tbplot.plot_sites((x, y, np.zeros_like(z)), data, radius=0.2)
+    tbplot.plot_sites((x, z, y), data, radius=0.2, axes="xz")
+    assert len(sorts) == 1
+    plt.close()
+
+    idx = np.argsort(z, kind="mergesort")
+    for col in collections:
+        np.testing.assert_array_equal(col.site_index, idx)
+        np.testing.assert_array_equal(col.get_array(), data[idx])
+
+
+def test_plot_boundary_hoppings(hoppings):
+    import itertools
+    from tbplot.structure import _make_shift_set
+
+    positions, graph = hoppings
+    boundaries = [type("Boundary", (), dict(shift=np.array(shift), hoppings=graph))
+                  for shift in ([5, 0, 0], [0, 5, 0])]
+    num_periods = 2
+    cmap = ["red", "blue"]
+
+    expected_lines, expected_colors = [], []
+    for level, blend in enumerate(np.linspace(0.5, 0.15, num_periods), start=1):
+        prev = _make_shift_set(boundaries, level - 1)
+        candidates = list(_make_shift_set(boundaries, level)) + list(prev)
+        for shift, sign, b in itertools.product(candidates, (1, -1), boundaries):
+            if (shift + sign * b.shift) in prev:
+                col = tbplot.plot_hoppings(positions, b.hoppings, offset=shift, blend=blend,
+                                           boundary=(sign, b.shift), cmap=cmap)
+                expected_lines += col.get_segments()
+                expected_colors.append(col.to_rgba(col.get_array()))
+    plt.close()
+
+    tbplot.plot_periodic_boundaries(positions, graph, boundaries, np.zeros(positions[0].size),
+                                    num_periods=num_periods, boundary=dict(cmap=cmap))
+    boundary_cols = [c for c in plt.gca().collections if c.get_array() is None]
+    plt.close()
+
+    assert len(boundary_cols) == 1
+    col = boundary_cols[0]
+    np.testing.assert_allclose(np.array(col.get_segments()), np.array(expected_lines))
+    np.testing.assert_allclose(col.get_colors(), np.concatenate(expected_colors))
+
+
+def test_explicit_axes(monkeypatch, sites, hoppings):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from tbplot.results import StructureMap, Boundary
+
+    (x, y, z), data = sites
+    _, graph = hoppings
+    size = x.size
+    graph = scipy.sparse.coo_matrix((graph.data, (graph.row, graph.col)), shape=(size, size))
+    smap = StructureMap(data, (x, y, z), data % 2, graph, [Boundary([5, 0, 0], graph)])
+
+    def draw(plot, ax=None):
+        plot(ax)
+        figure = ax.get_figure() if ax else plt.gcf()
+        num_artists = [len(a.collections) + len(a.images) for a in figure.axes]
+        limits = [a.get_xlim() + a.get_ylim() for a in figure.axes]
+        return num_artists, limits
+
+    plots = [
+        lambda ax: tbplot.plot_system(smap, num_periods=2, ax=ax),
+        lambda ax: tbplot.plot_lead(smap, 0, lead_length=3, ax=ax),
+        lambda ax: tbplot.plot_system_with_leads(smap, [smap], ax=ax),
+        lambda ax: tbplot.pltutils.colorbar(smap.plot(cache_structure=True, ax=ax), ax=ax),
+        lambda ax: smap.spatial_map.plot_pcolor(decimate="mean", ax=ax),
+        lambda ax: smap.spatial_map.plot_contourf(ax=ax),
+        lambda ax: smap.spatial_map.plot_contour(ax=ax),
+    ]
+    expected = []
+    for plot in plots:
+        plt.figure()
+        expected.append(draw(plot))
+        plt.close()
+
+    def no_pyplot(*_, **__):
+        raise AssertionError("the global pyplot state should not be used")
+
+    for name in ["gca", "gcf", "sca", "sci", "figure", "xlim", "ylim", "annotate", "colorbar"]:
+        monkeypatch.setattr(plt, name, no_pyplot)
+    for plot, (num_artists, limits) in zip(plots, expected):
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        result = draw(plot, figure.add_subplot(111))
+        figure.canvas.draw()
+        assert result[0] == num_artists
+        np.testing.assert_allclose(result[1], limits)
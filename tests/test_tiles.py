@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+import scipy.sparse
+import matplotlib.image
+
+from tbplot.results import StructureMap
+from tbplot.tiles import render_tiles
+
+
+def test_render_tiles(tmpdir):
+    size = 4
+    x, y = (v.ravel() for v in np.meshgrid(np.arange(size), np.arange(size)))
+    positions = x.astype(float), y.astype(float), np.zeros(x.size)
+    row = np.arange(x.size - 1)
+    hoppings = scipy.sparse.coo_matrix((np.zeros(row.size), (row, row + 1)),
+                                       shape=(x.size, x.size))
+    smap = StructureMap(np.arange(x.size), positions, np.zeros(x.size), hoppings)
+
+    directory = str(tmpdir.join("tiles"))
+    viewer = render_tiles(smap, directory, max_level=1, tile_size=32, num_workers=1)
+    assert os.path.exists(viewer)
+    tiles = sorted(str(p.relto(tmpdir.join("tiles"))) for p in tmpdir.visit("*.png"))
+    assert tiles == [os.path.join(*p) for p in [("0", "0", "0.png"), ("1", "0", "0.png"),
+                                                  ("1", "0", "1.png"), ("1", "1", "0.png"),
+                                                  ("1", "1", "1.png")]]
+
+    # resuming keeps the existing tiles
+    mtimes = [p.mtime() for p in tmpdir.visit("*.png")]
+    render_tiles(smap, directory, max_level=1, tile_size=32, num_workers=1)
+    assert mtimes == [p.mtime() for p in tmpdir.visit("*.png")]
+
+    with pytest.raises(RuntimeError):  # different styling: the old tiles can't be reused
+        render_tiles(smap, directory, max_level=1, tile_size=32, num_workers=1, cmap="Reds")
+
+
+def test_render_tiles_overlap(tmpdir):
+    """Tiles without sites are rendered if a hopping line or a site circle reaches them"""
+    positions = np.array([0.0, 2.0, 0.0]), np.array([0.0, 0.0, 2.0]), np.zeros(3)
+    hoppings = scipy.sparse.coo_matrix(([0], ([0], [1])), shape=(3, 3))
+    smap = StructureMap(np.arange(3), positions, np.zeros(3), hoppings)
+
+    directory = tmpdir.join("tiles")
+    render_tiles(smap, str(directory), max_level=2, tile_size=32, num_workers=1)
+    for ix in range(4):  # all along the bottom row which is crossed by the hopping
+        image = matplotlib.image.imread(str(directory.join("2", str(ix), "3.png")))
+        assert image[..., 3].max() > 0
+    assert not directory.join("2", "1", "1.png").exists()
@@ -1,16 +1,24 @@
+import io
+import json
 import os
 import shutil
 import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 
+import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-import matplotlib.style
 import matplotlib.units
 from matplotlib.testing.compare import compare_images
 
 from .path import path_from_fixture
-from tbplot import tbplot_style
+from tbplot import tbplot_style, use_style
+from tbplot.style import rc as tbplot_rc
 
 
 def _remove_text(figure):
@@ -30,65 +38,260 @@ def _remove_text(figure):
             ax.zaxis.set_minor_formatter(ticker.NullFormatter())
 
 
+class PerformanceWarning(UserWarning):
+    """A figure took more time or memory than its performance baseline"""
+
+
+# Decoded baseline images: {filename: (mtime, future RGB array)}
+_baseline_images = {}
+_baseline_lock = threading.Lock()
+# Decodes baseline images and compares figures in the background
+_executor = ThreadPoolExecutor(max_workers=max(os.cpu_count() or 1, 2))
+
+
+def _read_rgb(filename):
+    """Decode a PNG into 0-255 integer RGB, same as :func:`compare_images`"""
+    from matplotlib.image import imread
+    image = imread(filename)
+    if image.dtype != np.uint8:
+        image = np.round(image * 255)
+    return image[:, :, :3].astype(np.int16)
+
+
+def _baseline_image(filename):
+    """Future RGB array of a baseline image, decoded once in a background thread"""
+    mtime = os.path.getmtime(filename)
+    with _baseline_lock:
+        cached = _baseline_images.get(filename)
+        if cached is None or cached[0] != mtime:
+            cached = mtime, _executor.submit(_read_rgb, filename)
+            _baseline_images[filename] = cached
+    return cached[1]
+
+
+def _images_match(expected, actual_filename, tol):
+    """Fast path of :func:`compare_images`: `False` also if the sizes differ"""
+    actual = _read_rgb(actual_filename)
+    if expected.shape != actual.shape:
+        return False
+    squared = (expected - actual).astype(np.int32) ** 2
+    return np.sqrt(squared.mean()) <= tol
+
+
+_calibration = []
+
+
+def _calibration_time(repeat=3):
+    """Time needed to draw and save a reference figure on this machine, measured once
+
+    The stored render times are relative to it, so the baseline isn't tied to one host.
+    """
+    if not _calibration:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+
+        rng = np.random.RandomState(0)
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.add_collection(LineCollection(rng.rand(5000, 2, 2)))
+        ax.scatter(*rng.rand(2, 5000))
+
+        def render():
+            start = time.perf_counter()
+            fig.savefig(io.BytesIO(), format="png")
+            return time.perf_counter() - start
+
+        _calibration.append(min(render() for _ in range(repeat)))
+    return _calibration[0]
+
+
+class PerformanceBaseline:
+    """Relative render time and peak memory of each figure, stored as JSON
+
+    The file lives next to the baseline images. Times are in units of the calibration
+    run, see :func:`_calibration_time`. Entries are written only on request (see
+    `--perf-update`) and figures without an entry are not checked. A figure which
+    exceeds its entry by more than `factor` triggers a warning or a failure.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = {}
+            with suppress(FileNotFoundError):
+                with open(self.filename) as file:
+                    self._entries = json.load(file)
+        return self._entries
+
+    def check(self, key, measured, factor):
+        """Return a description of each measurement which exceeds its baseline by `factor`"""
+        baseline = self.entries.get(key, {})
+        return ["{}: {:.3g} > {} x {:.3g}".format(name, measured[name], factor, baseline[name])
+                for name in ("time", "memory")
+                if name in baseline and name in measured
+                and measured[name] > factor * baseline[name]]
+
+    def record(self, key, measured):
+        with self._lock:
+            self.entries[key] = measured
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename, "w") as file:
+                json.dump(self.entries, file, indent=2, sort_keys=True)
+                file.write("\n")
+
+
+_performance_baselines = {}
+
+
+def _performance_baseline(request):
+    filename = str(path_from_fixture(request, prefix="baseline_plots").parent.parent
+                   / "performance.json")
+    if filename not in _performance_baselines:
+        _performance_baselines[filename] = PerformanceBaseline(filename)
+    return _performance_baselines[filename]
+
+
 class AssertFigure:
     """A context manager which compares a figure to a baseline image
 
-    An `AssertionError` is raised if the images don't match up within tolerance.
+    The figure is saved when the context exits, but the comparison runs in the
+    background while the test continues, in parallel with the comparisons of other
+    figures (see `variant`). :meth:`wait` raises an `AssertionError` if the images don't
+    match up within tolerance. It's called at the end of each test, see `conftest.py`.
+
+    The time needed to draw and save the figure is compared to
+    `baseline_plots/performance.json`, as well as the peak memory (as seen by
+    :mod:`tracemalloc`) if it's traced. See the `--perf-*` options in `conftest.py`.
     """
 
     def __init__(self, request):
         self.request = request
         self.passed = False
+        self.measured = None
+        self._pending = []
 
         self._original_rc = {}
+        self._original_tbplot_rc = {}
         self._original_units_registry = {}
 
-    def __call__(self, ext=".png", tol=10, remove_text=True, savefig_kwargs=None):
+    def __call__(self, ext=".png", tol=10, remove_text=True, savefig_kwargs=None, variant=""):
         self.ext = ext
         self.tol = tol
         self.remove_text = remove_text
         self.savefig_kwargs = savefig_kwargs or {}
+        self.variant = variant
         return self
 
+    def _path(self, prefix, variant=""):
+        return path_from_fixture(self.request, prefix=prefix, variant=self.variant + variant,
+                                 ext=self.ext)
+
     def _enter_style(self, style=tbplot_style):
         self._original_rc = mpl.rcParams.copy()
+        self._original_tbplot_rc = tbplot_rc.copy()
         self._original_units_registry = matplotlib.units.registry.copy()
 
-        matplotlib.style.use(style)
+        use_style(style)
         mpl.use("Agg", warn=False)
 
     def _exit_style(self):
         mpl.rcParams.clear()
         mpl.rcParams.update(self._original_rc)
+        tbplot_rc.clear()
+        tbplot_rc.update(self._original_tbplot_rc)
         matplotlib.units.registry.clear()
         matplotlib.units.registry.update(self._original_units_registry)
 
     def __enter__(self):
         self._enter_style()
         self.fig = plt.figure()
+
+        # decode the baseline while the figure is being drawn
+        baseline = self._path("baseline_plots")
+        self._expected = _baseline_image(str(baseline)) \
+            if self.ext == ".png" and baseline.exists() else None
+
+        self._trace_memory = self.request.config.getoption("perf_memory", default=False)
+        self._stop_tracing = self._trace_memory and not tracemalloc.is_tracing()
+        if self._stop_tracing:
+            tracemalloc.start()
+        if self._trace_memory:
+            tracemalloc.clear_traces()
+        self._start_time = time.perf_counter()
         return self
 
+    def _stop_measurement(self):
+        self.measured = dict(time=time.perf_counter() - self._start_time)
+        if self._trace_memory:
+            self.measured["memory"] = tracemalloc.get_traced_memory()[1]
+        if self._stop_tracing:
+            tracemalloc.stop()
+
+    def _check_performance(self):
+        config = self.request.config
+        action = config.getoption("perf_action", default="warn")
+        update = config.getoption("perf_update", default=False)
+        if action == "ignore" and not update:
+            return
+
+        baseline = _performance_baseline(self.request)
+        key = self.request.node.nodeid + self.variant
+        measured = dict(self.measured, time=self.measured["time"] / _calibration_time())
+        if update:
+            baseline.record(key, measured)
+            return
+
+        exceeded = baseline.check(key, measured, config.getoption("perf_factor", 3.0))
+        if exceeded:
+            message = "Performance baseline exceeded: " + ", ".join(exceeded)
+            if action == "fail":
+                raise AssertionError(message)
+            warnings.warn(message, PerformanceWarning)
+
     def __exit__(self, exception, *_):
         if exception:
+            if self.measured is None:
+                self._stop_measurement()
             return
 
         if self.remove_text:
             _remove_text(self.fig)
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            actual_file = path_from_fixture(self.request, prefix=tmpdir, ext=self.ext)
-            actual_filename = str(actual_file)
-            if not actual_file.parent.exists():
-                actual_file.parent.mkdir(parents=True)
-            plt.savefig(actual_filename, **self.savefig_kwargs)
+        tmpdir = tempfile.mkdtemp()
+        actual_file = self._path(tmpdir)
+        if not actual_file.parent.exists():
+            actual_file.parent.mkdir(parents=True)
+        plt.savefig(str(actual_file), **self.savefig_kwargs)
+        self._stop_measurement()
 
-            baseline = path_from_fixture(self.request, prefix="baseline_plots", ext=self.ext)
-            baseline_filename = str(baseline)
+        plt.close()
+        self._exit_style()
+        self._check_performance()
+
+        # the paths are fixed now: `self` may be reused for the next figure of the test
+        failed = {variant: self._path("failed", variant)
+                  for variant in ("_actual", "_baseline", "_diff")}
+        self._pending.append(_executor.submit(self._compare, self._expected, str(actual_file),
+                                              self._path("baseline_plots"), failed, self.tol,
+                                              tmpdir))
 
-            if baseline.exists():
+    def _compare(self, expected, actual_filename, baseline, failed, tol, tmpdir):
+        """Compare the saved figure to the baseline, return an error message if they differ"""
+        try:
+            baseline_filename = str(baseline)
+            if expected is not None and _images_match(expected.result(), actual_filename, tol):
+                self.report(None, failed)
+            elif baseline.exists():
                 try:
                     failure_data = compare_images(baseline_filename, actual_filename,
-                                                  self.tol, in_decorator=True)
+                                                  tol, in_decorator=True)
                 except ValueError as exc:
                     if "could not be broadcast" not in str(exc):
                         raise
@@ -96,22 +299,29 @@ class AssertFigure:
                         failure_data = dict(actual=actual_filename, expected=baseline_filename)
 
                 if failure_data:
-                    self.report(failure_data)
-                    raise AssertionError("Mismatch between actual figure and baseline image")
+                    self.report(failure_data, failed)
+                    return "Mismatch between actual figure and baseline image: " + \
+                           baseline_filename
             else:
                 os.makedirs(os.path.dirname(baseline_filename), exist_ok=True)
                 shutil.copyfile(actual_filename, baseline_filename)
                 self.passed = True
-                self.report(None)
+                self.report(None, failed)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
 
-        plt.close()
-        self._exit_style()
+    def wait(self):
+        """Wait for the pending comparisons and raise an `AssertionError` if any failed"""
+        pending, self._pending = self._pending, []
+        errors = [error for error in (future.result() for future in pending) if error]
+        if errors:
+            raise AssertionError("\n".join(errors))
 
-    def report(self, failure_data):
+    @staticmethod
+    def report(failure_data, failed):
         def reportfile(variant):
-            path = path_from_fixture(self.request, prefix="failed", variant=variant, ext=self.ext)
-            if not path.parent.exists():
-                path.parent.mkdir(parents=True)
+            path = failed[variant]
+            path.parent.mkdir(parents=True, exist_ok=True)
             return str(path)
 
         def delete(variant):